@@ -1,16 +1,23 @@
 import streamlit as st
-import requests
-import json
-import time
 import os
-import pandas as pd
+import time
+import requests
+
+from incident_store import HistoryTail, IncidentStore
+from sample_channel import fetch_samples
+from timeseries import TimeSeriesStore, cpu_total_series
 
 # --- CONFIGURATION ---
-NODE_EXPORTER_URL = "http://localhost:9100/metrics"
-REMEDIATION_HISTORY_FILE = "remediation_history.json"
+# The agent publishes its CPU samples here; the dashboard never scrapes Node Exporter itself
+AGENT_SAMPLES_URL = os.getenv("AGENT_SAMPLES_URL", "http://localhost:9101/samples")
+DASHBOARD_TARGET = os.getenv("DASHBOARD_TARGET", "localhost")
+INCIDENT_STORE_FILE = "incidents.sqlite3"
+# The agent's memory-mapped CPU history (raw/10s/1m tiers), opened read-only
+TIMESERIES_DIR = os.getenv("AGENT_TIMESERIES_DIR", "timeseries")
+CHART_WINDOWS = {"10 min": 600, "1 h": 3600, "24 h": 86400}
+HISTORY_ITEMS_SHOWN = 5
 TARGET_CONTAINER_NAME = "cpu-test-app"
 REFRESH_RATE_SECONDS = 1  # Faster refresh for smoother chart
-NUM_CORES = 2 # Set to matches your t3.small (2 vCPUs)
 
 # Page Config (Clean, No Icons)
 st.set_page_config(
@@ -20,65 +27,60 @@ st.set_page_config(
 )
 
 # --- LIGHTWEIGHT STATE MANAGEMENT ---
-if 'cpu_data' not in st.session_state:
-    st.session_state.cpu_data = [0.0] * 60 # Store last 60 points
+if 'cpu_history' not in st.session_state:
+    st.session_state.cpu_history = TimeSeriesStore(TIMESERIES_DIR, readonly=True)
+if 'samples_http' not in st.session_state:
+    st.session_state.samples_http = requests.Session() # Keep-alive to the agent
+if 'history_tail' not in st.session_state:
+    # Aggregates are built once per session; each rerun only reads incidents appended since the last one
+    st.session_state.history_tail = HistoryTail(IncidentStore(INCIDENT_STORE_FILE), keep=HISTORY_ITEMS_SHOWN)
 
 # --- HELPER FUNCTIONS ---
 
 def get_cpu_percentage():
     """
-    Fetches CPU usage and scales it to 0-200% (matching the Agent's logic).
+    Reads the agent's latest CPU sample (0-(100 x cores) scale) from its sample channel.
+    Every viewer sees the same numbers, and none of them scrapes Node Exporter.
     """
     try:
-        response = requests.get(NODE_EXPORTER_URL, timeout=0.5)
-        if response.status_code == 200:
-            lines = response.text.split('\n')
-            idle_secs = 0.0
-            total_secs = 0.0
-            
-            # Fast parsing
-            for line in lines:
-                if line.startswith('node_cpu_seconds_total'):
-                    parts = line.split()
-                    val = float(parts[-1])
-                    if 'mode="idle"' in line:
-                        idle_secs += val
-                    total_secs += val
-            
-            # State management for rate calculation
-            if 'prev_idle' not in st.session_state:
-                st.session_state.prev_idle = idle_secs
-                st.session_state.prev_total = total_secs
-                return 0.0
-            
-            delta_idle = idle_secs - st.session_state.prev_idle
-            delta_total = total_secs - st.session_state.prev_total
-            
-            st.session_state.prev_idle = idle_secs
-            st.session_state.prev_total = total_secs
-            
-            if delta_total == 0: return 0.0
-            
-            # FORMULA FIX: Multiply by NUM_CORES to match Agent's 0-200% scale
-            # (1 - idle_ratio) gives average load (0-1). 
-            # Multiply by 100 for %. Multiply by Cores for Aggregate.
-            cpu_util = (1 - (delta_idle / delta_total)) * 100 * NUM_CORES
-            
-            return round(cpu_util, 2)
-            
+        sample = fetch_samples(AGENT_SAMPLES_URL, DASHBOARD_TARGET, session=st.session_state.samples_http).get(DASHBOARD_TARGET)
     except Exception:
+        sample = None
+    st.session_state.cpu_sample = sample
+    if sample is None:
         return 0.0
-    return 0.0
+    return sample["total_percent"]
+
+def load_cpu_trend(window_seconds):
+    """
+    CPU trend for the chart: the agent's time-series store picks the tier for the window
+    (raw / 10s / 1m buckets), falling back to the sample channel's short history.
+    pandas is imported here, on the first chart, not at startup.
+    """
+    import pandas as pd
+
+    try:
+        window = st.session_state.cpu_history.query(cpu_total_series(DASHBOARD_TARGET), time.time() - window_seconds)
+    except Exception:
+        window = None
+    if window is not None and len(window.times):
+        index = pd.to_datetime(window.times, unit="s")
+        return pd.DataFrame({"CPU Usage %": window.avg, "Peak %": window.max}, index=index)
+    sample = st.session_state.get('cpu_sample')
+    points = sample["history"] if sample else []
+    return pd.DataFrame(
+        {"CPU Usage %": [percent for _ts, percent in points]},
+        index=pd.to_datetime([ts for ts, _percent in points], unit="s"),
+    )
 
 def load_history():
-    """Loads history with UTF-8 encoding."""
-    if os.path.exists(REMEDIATION_HISTORY_FILE):
-        try:
-            with open(REMEDIATION_HISTORY_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except:
-            return []
-    return []
+    """Reads only the incidents appended since the last rerun and returns the running view."""
+    tail = st.session_state.history_tail
+    try:
+        tail.poll()
+    except Exception:
+        pass
+    return tail
 
 # --- MAIN UI LAYOUT ---
 
@@ -92,39 +94,49 @@ col1, col2, col3, col4 = st.columns(4)
 
 # Fetch Data
 current_cpu = get_cpu_percentage()
-history = load_history()
-incident_count = len(history)
+tail = load_history()
+history = list(tail.recent)
+incident_count = tail.count
 last_incident_time = history[-1]['timestamp'] if history else "No Incidents"
 
-# Update Chart Data
-st.session_state.cpu_data.append(current_cpu)
-st.session_state.cpu_data.pop(0) 
-
 # Display Metrics
 with col1:
-    st.metric(label="Live CPU Usage", value=f"{current_cpu}%", delta=f"{current_cpu - st.session_state.cpu_data[-2]:.2f}%" if len(st.session_state.cpu_data) > 1 else None)
+    recent = st.session_state.cpu_sample["history"] if st.session_state.get('cpu_sample') else []
+    st.metric(label="Live CPU Usage", value=f"{current_cpu}%", delta=f"{current_cpu - recent[-2][1]:.2f}%" if len(recent) > 1 else None)
+    if st.session_state.get('cpu_sample') is not None:
+        st.caption(st.session_state.cpu_sample["breakdown"])
+    else:
+        st.caption("No samples from the agent yet")
 
 with col2:
     st.metric(label="Total Incidents", value=incident_count)
+    if tail.by_status:
+        st.caption(" | ".join(f"{status or 'UNKNOWN'}: {n}" for status, n in tail.by_status.most_common()))
 
 with col3:
     st.metric(label="Last Incident", value=str(last_incident_time).split('.')[0]) 
 
 with col4:
-    # Status Indicator (Thresholds scaled for 200% max)
-    if current_cpu > 150:
+    # Status Indicator: the agent's own detector state, so the dashboard and the agent agree
+    detector = (st.session_state.get('cpu_sample') or {}).get("detector") or {}
+    if detector.get("firing"):
         st.error("Status: CRITICAL")
-    elif current_cpu > 75:
+    elif detector.get("pending"):
         st.warning("Status: HIGH LOAD")
     else:
         st.success("Status: HEALTHY")
+    if detector:
+        st.caption(detector.get("reason", ""))
 
 # 3. Live Chart
 st.subheader("CPU Trend (Real-time)")
-chart_data = pd.DataFrame(st.session_state.cpu_data, columns=["CPU Usage %"])
-# Chart Color Logic: Red if over 75%
-color = "#FF4B4B" if current_cpu > 75 else "#00CC96"
-st.area_chart(chart_data, color=color, height=200)
+window_label = st.radio("Window", list(CHART_WINDOWS), horizontal=True, label_visibility="collapsed")
+chart_data = load_cpu_trend(CHART_WINDOWS[window_label])
+# Chart Color Logic: Red while the agent's detector sees a spike
+color = "#FF4B4B" if detector.get("firing") or detector.get("pending") else "#00CC96"
+st.area_chart(chart_data[["CPU Usage %"]], color=color, height=200)
+if "Peak %" in chart_data and len(chart_data):
+    st.caption(f"Peak in window: {chart_data['Peak %'].max():.2f}% | Average: {chart_data['CPU Usage %'].mean():.2f}%")
 
 # 4. Incident History
 st.subheader("Incident History & RCA")
@@ -132,7 +144,7 @@ st.subheader("Incident History & RCA")
 if not history:
     st.info("No incidents recorded yet. System is stable.")
 else:
-    for incident in reversed(history[-5:]):
+    for incident in reversed(history):
         with st.expander(f"{incident.get('timestamp')} - {incident.get('status')}", expanded=True):
             c1, c2 = st.columns([3, 1])
             with c1:
@@ -0,0 +1,385 @@
+"""
+Pluggable root cause analyzers.
+
+An AnalyzerChain runs cheap local analyzers first and only falls through to the
+LLM when none of them is confident:
+
+  - RuleAnalyzer: regex rules over the incident's log templates (known failure
+    signatures such as the spike app's "CRITICAL ERROR" line). Microseconds.
+  - StatisticalAnalyzer: scores templates that burst near the spike, plus the
+    CPU mode breakdown (iowait / steal). Sub-millisecond. A log burst alone stays
+    below the restart threshold (`max_confidence`).
+  - LlmAnalyzer: the Gemini RCA prompt, behind the RCA cache.
+
+Every analyzer returns the same typed AnalysisResult.
+"""
+import json
+import math
+import os
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+from cpu_rate import CpuSnapshot
+from instrumentation import ERRORS, get_logger
+from log_reducer import LogReducer, LogTemplate
+from rca_cache import RcaCache, fingerprint
+
+log = get_logger("analyzers")
+
+
+@dataclass
+class AnalysisInput:
+    """What the analyzers get to look at for one incident."""
+    target_name: str
+    container_logs: str
+    system_logs: str
+    log_signature: List[str] = field(default_factory=list)
+    reducers: List[LogReducer] = field(default_factory=list)
+    snapshot: Optional[CpuSnapshot] = None
+    # (container, CPU %) busiest first, from cgroup/cAdvisor attribution (empty when not configured)
+    top_containers: List[Tuple[str, float]] = field(default_factory=list)
+    # Incident type: "cpu" or one of resource_rates.RESOURCES
+    resource: str = "cpu"
+
+    def templates(self) -> List[Tuple[LogReducer, LogTemplate]]:
+        return [(reducer, template) for reducer in self.reducers for template in reducer.templates]
+
+
+@dataclass
+class AnalysisResult:
+    """
+    One analyzer's verdict. `actionable` is False when the cause is outside the
+    container (e.g. hypervisor steal), so restarting it would not help.
+    """
+    analyzer: str
+    reason: str
+    confidence: int
+    evidence: List[str] = field(default_factory=list)
+    actionable: bool = True
+    raw_text: str = ""
+    cached: bool = False
+    elapsed_ms: float = 0.0
+    # (analyzer, confidence or None if it had no opinion, ms) for every analyzer consulted
+    trace: List[Tuple[str, Optional[int], float]] = field(default_factory=list)
+
+
+class Analyzer:
+    """Base class: return an AnalysisResult, or None when there is nothing to say."""
+    name = "analyzer"
+
+    def analyze(self, data: AnalysisInput) -> Optional[AnalysisResult]:
+        raise NotImplementedError
+
+
+# --- RULE ENGINE ---
+
+@dataclass
+class Rule:
+    """
+    A known failure signature, matched against log templates (numbers are masked in
+    them). It only explains incidents of the types in `resources`.
+    """
+    name: str
+    pattern: str
+    reason: str
+    confidence: int
+    min_count: int = 1
+    actionable: bool = True
+    resources: Tuple[str, ...] = ("cpu", "load")
+
+
+DEFAULT_RULES = [
+    Rule("cpu-test-app-spike", r"CRITICAL ERROR: Beginning CPU-intensive calculation",
+         "cpu-test-app /spike endpoint started a CPU-intensive calculation.", 95),
+    Rule("oom-killer", r"invoked oom-killer|Out of memory: Killed process",
+         "Kernel OOM killer fired; memory pressure is driving reclaim and CPU load.", 90,
+         resources=("cpu", "load", "memory")),
+    Rule("recursion", r"RecursionError|maximum recursion depth exceeded",
+         "Runaway recursion in the application.", 85),
+    Rule("gc-overhead", r"GC overhead limit exceeded|OutOfMemoryError",
+         "JVM garbage collection thrashing under heap pressure.", 85, resources=("cpu", "load", "memory")),
+    Rule("fd-exhaustion", r"[Tt]oo many open files",
+         "File descriptor exhaustion; the service is spinning on failed accepts/opens.", 80),
+    Rule("retry-storm", r"[Rr]etrying .*(attempt|retry)", "Retry storm against a failing dependency.", 70, min_count=50,
+         resources=("cpu", "load", "network")),
+    Rule("slow-query", r"[Ss]low query", "Repeated slow database queries.", 60, min_count=20,
+         resources=("cpu", "load", "disk")),
+]
+
+
+def load_rules(path: str) -> List[Rule]:
+    """
+    Loads rules from a JSON list of Rule fields:
+        [{"name": "...", "pattern": "...", "reason": "...", "confidence": 90}, ...]
+    `resources` (incident types the rule explains) defaults to ["cpu", "load"]. Falls back to DEFAULT_RULES if the file does not exist.
+    """
+    if not os.path.exists(path):
+        return list(DEFAULT_RULES)
+    with open(path, 'r', encoding='utf-8') as f:
+        return [Rule(**entry) for entry in json.load(f)]
+
+
+class RuleAnalyzer(Analyzer):
+    """
+    Rule patterns without groups of their own are also compiled into one alternation,
+    so a template that matches none of them (most do not) costs a single regex search
+    however many rules there are; patterns with groups (or backreferences) are only
+    searched on their own, so their numbering is not shifted. Every rule matching a
+    template is credited: with all its lines when it matches the template text, with
+    the example line only when it matches just that (it looks at a part that differs
+    between the lines). The highest-confidence rule for the incident's type (its
+    `resources`) that reaches its `min_count` wins.
+    """
+    name = "rules"
+
+    def __init__(self, rules: Optional[List[Rule]] = None):
+        self.rules = list(DEFAULT_RULES if rules is None else rules)
+        self._groups = {f"r{i}": rule for i, rule in enumerate(self.rules)}
+        self._plain: List[Tuple[str, re.Pattern]] = []
+        self._grouped: List[Tuple[str, re.Pattern]] = []
+        for group, rule in self._groups.items():
+            try:
+                regex = re.compile(rule.pattern)
+            except re.error as e:
+                raise ValueError(f"Invalid pattern in rule {rule.name!r}: {e}") from e
+            (self._grouped if regex.groups else self._plain).append((group, regex))
+        self._regex = re.compile("|".join(f"(?:{regex.pattern})" for _, regex in self._plain)) if self._plain else None
+
+    def _matches(self, line: str) -> List[str]:
+        """The groups of every rule matching `line`."""
+        groups = [group for group, regex in self._grouped if regex.search(line) is not None]
+        if self._regex is not None and self._regex.search(line) is not None:
+            groups += [group for group, regex in self._plain if regex.search(line) is not None]
+        return groups
+
+    def analyze(self, data: AnalysisInput) -> Optional[AnalysisResult]:
+        if not any(data.resource in rule.resources for rule in self.rules):
+            return None
+        counts: Dict[str, int] = {}
+        examples: Dict[str, str] = {}
+        for _reducer, template in data.templates():
+            whole = self._matches(template.text)
+            for group in whole + [group for group in self._matches(template.example) if group not in whole]:
+                counts[group] = counts.get(group, 0) + (template.count if group in whole else 1)
+                examples.setdefault(group, template.example)
+        # A CPU signature in the logs does not explain, say, a disk incident
+        counts = {group: count for group, count in counts.items() if data.resource in self._groups[group].resources}
+
+        best: Optional[Rule] = None
+        for group, count in counts.items():
+            rule = self._groups[group]
+            if count >= rule.min_count and (best is None or rule.confidence > best.confidence):
+                best = rule
+        if best is None:
+            return None
+
+        evidence = [
+            f"rule {self._groups[group].name}: x{count} e.g. {examples[group][:200]}"
+            for group, count in sorted(counts.items(), key=lambda item: -self._groups[item[0]].confidence)
+        ]
+        return AnalysisResult(self.name, best.reason, best.confidence, evidence, actionable=best.actionable)
+
+
+# --- STATISTICAL SCORER ---
+
+# Confidence ceiling by template severity: a burst of INFO lines is a weaker
+# explanation than a burst of ERRORs.
+_SEVERITY_CONFIDENCE_CAP = {5: 90, 4: 85, 3: 70}
+_DEFAULT_CONFIDENCE_CAP = 60
+
+
+class StatisticalAnalyzer(Analyzer):
+    """
+    Flags log templates whose rate in the final part of the window (next to the spike)
+    is far above their rate in the rest of it. Under a uniform rate the recent count
+    is Binomial(count, recent_fraction); the z-score against that is the burst
+    strength. CPU time dominated by iowait or steal is reported as a non-container cause.
+    A burst is correlation, not a cause: its confidence is capped at `max_confidence`
+    (keep it below the chain's threshold), so it never restarts a container by itself
+    and the chain goes on to the LLM.
+    """
+    name = "statistical"
+
+    def __init__(self, min_count: int = 5, z_threshold: float = 4.0,
+                 iowait_share: float = 0.4, steal_share: float = 0.3, max_confidence: int = 79):
+        self.min_count = min_count
+        self.z_threshold = z_threshold
+        self.iowait_share = iowait_share
+        self.steal_share = steal_share
+        self.max_confidence = max_confidence
+
+    @staticmethod
+    def burst_z(reducer: LogReducer, template: LogTemplate) -> float:
+        p = reducer.recent_fraction
+        expected = template.count * p
+        spread = math.sqrt(expected * (1 - p)) or 1.0
+        return (template.recent_count - expected) / spread
+
+    def _cpu_mode_finding(self, snapshot: Optional[CpuSnapshot]) -> Optional[AnalysisResult]:
+        if snapshot is None or snapshot.total_percent <= 0:
+            return None
+        busy = snapshot.total_percent
+        if snapshot.steal_percent / busy >= self.steal_share:
+            return AnalysisResult(
+                self.name, f"Hypervisor steal is {snapshot.steal_percent:.0f}% of busy CPU; the host is oversubscribed.",
+                80, [snapshot.breakdown()], actionable=False)
+        if snapshot.iowait_percent / busy >= self.iowait_share:
+            return AnalysisResult(
+                self.name, f"iowait is {snapshot.iowait_percent:.0f}% of busy CPU; the spike is an I/O bottleneck.",
+                75, [snapshot.breakdown()], actionable=False)
+        return None
+
+    def analyze(self, data: AnalysisInput) -> Optional[AnalysisResult]:
+        findings: List[Tuple[float, int, LogReducer, LogTemplate]] = []
+        for reducer, template in data.templates():
+            if template.count < self.min_count:
+                continue
+            z = self.burst_z(reducer, template)
+            if z >= self.z_threshold:
+                cap = _SEVERITY_CONFIDENCE_CAP.get(template.severity, _DEFAULT_CONFIDENCE_CAP)
+                findings.append((z, min(cap, self.max_confidence, int(50 + 5 * z)), reducer, template))
+
+        mode_result = self._cpu_mode_finding(data.snapshot) if data.resource == "cpu" else None
+        if not findings:
+            return mode_result
+
+        findings.sort(key=lambda f: (f[1], f[0]), reverse=True)
+        z, confidence, reducer, top = findings[0]
+        window_s = (reducer.window_end_ns - reducer.window_start_ns) * reducer.recent_fraction / 1e9
+        evidence = [
+            f"z={fz:.1f} x{t.recent_count}/{t.count} in last {window_s:.0f}s: {t.text[:200]}"
+            for fz, _c, _r, t in findings[:5]
+        ]
+        result = AnalysisResult(
+            self.name,
+            f"Burst of '{top.text[:160]}' ({top.recent_count} of {top.count} occurrences in the last {window_s:.0f}s before the spike).",
+            confidence, evidence,
+        )
+        if mode_result is not None and mode_result.confidence >= result.confidence:
+            mode_result.evidence += evidence
+            return mode_result
+        return result
+
+
+# --- LLM FALLBACK ---
+
+_REASON_RE = re.compile(r"^[\s*#>-]*REASON[\s*]*:[\s*]*(.+?)\s*$", re.IGNORECASE | re.MULTILINE)
+_CONFIDENCE_RE = re.compile(r"^[\s*#>-]*CONFIDENCE[\s*]*:[\s*]*(\d{1,3})", re.IGNORECASE | re.MULTILINE)
+
+
+def parse_llm_response(text: str) -> Tuple[str, int]:
+    """
+    Extracts (reason, confidence) from a "REASON: ... / CONFIDENCE: NN" response.
+    Tolerates markdown emphasis, list markers, case and a trailing "%".
+    """
+    reason_match = _REASON_RE.search(text)
+    confidence_match = _CONFIDENCE_RE.search(text)
+    reason = reason_match.group(1).rstrip("*").strip() if reason_match else "Not determined"
+    confidence = min(int(confidence_match.group(1)), 100) if confidence_match else 0
+    return reason, confidence
+
+
+class LlmAnalyzer(Analyzer):
+    """
+    Calls `complete(logs_text, resource) -> response_text` (the LLM prompt for that
+    incident type) and parses the result. With a cache, repeat log signatures are
+    answered without the call. Only answers with at least `min_cache_confidence`
+    are cached; an UNCLEAR or unsure answer is asked again next time rather than
+    reused for the cache's whole TTL. Responses that start with "LLM_ERROR" are
+    treated as no opinion.
+    """
+    name = "llm"
+
+    def __init__(self, complete: Callable[[str, str], str], model: str, cache: Optional[RcaCache] = None,
+                 min_cache_confidence: int = 80):
+        self.complete = complete
+        self.model = model
+        self.cache = cache
+        self.min_cache_confidence = min_cache_confidence
+
+    def _cacheable(self, reason: str, confidence: int) -> bool:
+        return confidence >= self.min_cache_confidence and "UNCLEAR" not in reason.upper()
+
+    def analyze(self, data: AnalysisInput) -> Optional[AnalysisResult]:
+        use_cache = self.cache is not None and bool(data.log_signature)
+        # The same logs get a different question per incident type; CPU keeps the original keys
+        model = self.model if data.resource == "cpu" else f"{self.model}/{data.resource}"
+        cached = None
+        if use_cache:
+            key, sim = fingerprint(data.target_name, model, data.log_signature)
+            cached = self.cache.get(key, sim, data.target_name, model)
+            if cached is not None and not self._cacheable(*parse_llm_response(cached.response_text)):
+                cached = None  # stored before only confident answers were cached
+
+        if cached is not None:
+            text = cached.response_text
+        else:
+            logs = (
+                "--- SYSTEM LOGS ---\n" + data.system_logs +
+                "\n--- CONTAINER LOGS ---\n" + data.container_logs
+            )
+            if data.top_containers:
+                busiest = "\n".join(f"{name}: {percent:.1f}% CPU" for name, percent in data.top_containers)
+                logs = "--- BUSIEST CONTAINERS (100% = one core) ---\n" + busiest + "\n" + logs
+            text = self.complete(logs, data.resource)
+            if text.startswith("LLM_ERROR"):
+                return None
+
+        reason, confidence = parse_llm_response(text)
+        if use_cache and cached is None and self._cacheable(reason, confidence):
+            self.cache.put(key, sim, data.target_name, model, text)
+        evidence = [f"cache hit ({'near-duplicate' if cached.near_duplicate else 'exact'}, seen {cached.hits}x)"] if cached else []
+        return AnalysisResult(self.name, reason, confidence, evidence, raw_text=text, cached=cached is not None)
+
+
+# --- CHAIN ---
+
+class AnalyzerChain:
+    """
+    Runs analyzers in order and stops at the first result with at least
+    `confidence_threshold`. If none gets there, the most confident result seen is
+    returned (or an "UNCLEAR" result with confidence 0 if nobody had an opinion).
+    """
+
+    def __init__(self, analyzers: List[Analyzer], confidence_threshold: int = 80):
+        self.analyzers = analyzers
+        self.confidence_threshold = confidence_threshold
+        self.decisions: Dict[str, int] = {analyzer.name: 0 for analyzer in analyzers}
+        self.decision_ms: Dict[str, float] = {analyzer.name: 0.0 for analyzer in analyzers}
+
+    def analyze(self, data: AnalysisInput) -> AnalysisResult:
+        start = time.perf_counter()
+        trace: List[Tuple[str, Optional[int], float]] = []
+        best: Optional[AnalysisResult] = None
+
+        for analyzer in self.analyzers:
+            step_start = time.perf_counter()
+            try:
+                result = analyzer.analyze(data)
+            except Exception as e:
+                ERRORS.inc(f"analyzer_{analyzer.name}")
+                log.error(f"ERROR in {analyzer.name} analyzer: {e!r}", extra={"target": data.target_name})
+                result = None
+            trace.append((analyzer.name, result.confidence if result else None, (time.perf_counter() - step_start) * 1e3))
+            if result is not None and (best is None or result.confidence > best.confidence):
+                best = result
+            if best is not None and best.confidence >= self.confidence_threshold:
+                break
+
+        if best is None:
+            best = AnalysisResult("none", "UNCLEAR", 0)
+        best.trace = trace
+        best.elapsed_ms = (time.perf_counter() - start) * 1e3
+        if best.analyzer in self.decisions:
+            self.decisions[best.analyzer] += 1
+            self.decision_ms[best.analyzer] += best.elapsed_ms
+        return best
+
+    def format_stats(self) -> str:
+        """One-line decision count and mean time-to-decision per analyzer."""
+        return " | ".join(
+            f"{name}: {count} ({self.decision_ms[name] / count:.1f}ms avg)" if count else f"{name}: 0"
+            for name, count in self.decisions.items()
+        )
@@ -0,0 +1,179 @@
+"""
+Container-level CPU attribution: which containers are burning a node's CPU.
+
+Two sources of per-container cumulative CPU seconds:
+
+  - CgroupSource: cgroup v2 `cpu.stat` (usage_usec) under a root such as
+    /sys/fs/cgroup, for the node the agent runs on. Each file is opened once and
+    re-read with os.pread, so a reading costs one syscall per container; the tree
+    is only rescanned (new or removed containers) every `rescan_seconds`.
+  - CadvisorSource: one scrape of a cAdvisor-format /metrics endpoint
+    (container_cpu_usage_seconds_total), parsed in a single streaming pass.
+
+cgroups only carry container ids (the first 12 characters, as docker ps shows
+them); name_containers() maps them to names, e.g. from the Docker API. cAdvisor
+names kubelet containers "pod/container", which is not a Docker container name
+(is_pod_container()).
+
+container_rates() turns two readings into CPU % per container (100 = one core,
+the agent's total scale) and top_containers() ranks the offenders.
+"""
+import heapq
+import os
+import re
+import time
+from typing import Dict, List, Optional, Tuple, Union
+
+import aiohttp
+
+from prom_parser import FamilyParser, group_by_labels
+
+CADVISOR_CPU_FAMILY = "container_cpu_usage_seconds_total"
+READ_CHUNK_BYTES = 64 * 1024
+
+# Container cgroups: docker-<id>.scope (systemd driver), docker/<id> (cgroupfs driver),
+# and the containerd / CRI-O / Podman equivalents
+_CONTAINER_DIR = re.compile(r"^(?:(?:docker|cri-containerd|crio|libpod)-)?([0-9a-f]{64})(?:\.scope)?$")
+
+ContainerUsage = Dict[str, float]  # container -> cumulative CPU seconds
+
+
+class CgroupSource:
+    """Per-container CPU usage from cgroup v2 cpu.stat files, read through cached descriptors."""
+
+    def __init__(self, root: str = "/sys/fs/cgroup", rescan_seconds: float = 30.0, max_depth: int = 4):
+        self.root = root
+        self.rescan_seconds = rescan_seconds
+        self.max_depth = max_depth
+        self._fds: Dict[str, int] = {}  # short container id -> open cpu.stat
+        self._scanned_at: Optional[float] = None
+
+    def _scan(self):
+        found: Dict[str, str] = {}
+        stack = [(self.root, 0)]
+        while stack:
+            path, depth = stack.pop()
+            try:
+                entries = list(os.scandir(path))
+            except OSError:
+                continue
+            for entry in entries:
+                if not entry.is_dir(follow_symlinks=False):
+                    continue
+                match = _CONTAINER_DIR.match(entry.name)
+                if match:
+                    found[match.group(1)[:12]] = os.path.join(entry.path, "cpu.stat")
+                elif depth < self.max_depth:
+                    stack.append((entry.path, depth + 1))
+
+        for container in list(self._fds):
+            if container not in found:
+                os.close(self._fds.pop(container))
+        for container, path in found.items():
+            if container not in self._fds:
+                try:
+                    self._fds[container] = os.open(path, os.O_RDONLY)
+                except OSError:
+                    continue  # gone between the scan and the open
+        self._scanned_at = time.monotonic()
+
+    def read_sync(self) -> ContainerUsage:
+        if self._scanned_at is None or time.monotonic() - self._scanned_at >= self.rescan_seconds:
+            self._scan()
+        usage: ContainerUsage = {}
+        for container, fd in list(self._fds.items()):
+            try:
+                # "usage_usec N" is the first line of cpu.stat
+                first_line = os.pread(fd, 64, 0).split(b"\n", 1)[0]
+                usage[container] = int(first_line.split()[1]) / 1e6
+            except (OSError, IndexError, ValueError):
+                os.close(self._fds.pop(container))  # the container's cgroup was removed
+        return usage
+
+    async def read(self) -> ContainerUsage:
+        return self.read_sync()
+
+    async def close(self):
+        for fd in self._fds.values():
+            os.close(fd)
+        self._fds.clear()
+        self._scanned_at = None
+
+
+def parse_cadvisor_usage(parser: FamilyParser) -> ContainerUsage:
+    """container_cpu_usage_seconds_total per container name from a fed FamilyParser."""
+    samples = parser.close()[CADVISOR_CPU_FAMILY]
+    usage: ContainerUsage = {}
+    for (name, container, pod, cpu), value in group_by_labels(samples, "name", "container", "pod", "cpu").items():
+        if cpu not in ("", "total"):
+            continue  # per-core series (older cAdvisor with percpu enabled) would double count
+        if not name:
+            # kubelet's cAdvisor labels containers by pod/container instead of name
+            if not container or container == "POD":
+                continue
+            name = f"{pod}/{container}" if pod else container
+        usage[name] = usage.get(name, 0.0) + value
+    return usage
+
+
+def is_pod_container(name: str) -> bool:
+    """A kubelet "pod/container" name (Docker names cannot contain "/")."""
+    return "/" in name
+
+
+class CadvisorSource:
+    """Per-container CPU usage from one cAdvisor /metrics scrape."""
+
+    def __init__(self, url: str, timeout: float = 5.0):
+        self.url = url
+        self.timeout = timeout
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def read(self) -> ContainerUsage:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout))
+        parser = FamilyParser((CADVISOR_CPU_FAMILY,))
+        async with self._session.get(self.url) as response:
+            response.raise_for_status()
+            async for chunk in response.content.iter_chunked(READ_CHUNK_BYTES):
+                parser.feed(chunk)
+        return parse_cadvisor_usage(parser)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+
+
+def make_source(spec: str) -> Union[CgroupSource, CadvisorSource]:
+    """A cAdvisor /metrics URL ("http(s)://...") or a cgroup v2 root path."""
+    if spec.startswith(("http://", "https://")):
+        return CadvisorSource(spec)
+    return CgroupSource(spec)
+
+
+# --- RANKING ---
+
+def container_rates(before: ContainerUsage, after: ContainerUsage, seconds: float) -> Dict[str, float]:
+    """CPU % per container between two readings (containers missing from either, or restarted, are left out)."""
+    if seconds <= 0:
+        return {}
+    rates = {}
+    for container, used in after.items():
+        previous = before.get(container)
+        if previous is not None and used >= previous:
+            rates[container] = 100.0 * (used - previous) / seconds
+    return rates
+
+
+def name_containers(rates: Dict[str, float], names: Dict[str, str]) -> Dict[str, float]:
+    """`rates` keyed by container name instead of id; ids without a name are kept."""
+    named: Dict[str, float] = {}
+    for container, percent in rates.items():
+        name = names.get(container, container)
+        named[name] = named.get(name, 0.0) + percent
+    return named
+
+
+def top_containers(rates: Dict[str, float], count: int = 5) -> List[Tuple[str, float]]:
+    """The `count` busiest containers, busiest first."""
+    return heapq.nlargest(count, rates.items(), key=lambda item: item[1])
@@ -0,0 +1,28 @@
+"""Shared helpers for the detection-agent microbenchmarks (run from any directory)."""
+import os
+import sys
+import time
+
+# The agent modules live one directory up and are imported as top-level modules.
+AGENT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if AGENT_DIR not in sys.path:
+    sys.path.insert(0, AGENT_DIR)
+
+
+def best_of(func, repeat: int = 5, number: int = 1) -> float:
+    """Returns the best per-call wall time (seconds) of `func` over `repeat` rounds."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
+
+
+def print_table(headers, rows):
+    """Prints a simple fixed-width results table."""
+    widths = [max(len(str(h)), *(len(str(r[i])) for r in rows)) for i, h in enumerate(headers)]
+    print("  ".join(str(h).rjust(w) for h, w in zip(headers, widths)))
+    for row in rows:
+        print("  ".join(str(c).rjust(w) for c, w in zip(row, widths)))
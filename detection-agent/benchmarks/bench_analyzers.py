@@ -0,0 +1,77 @@
+"""
+Benchmark: time-to-decision of the analyzer chain on each path.
+
+  rules        - the spike app's CRITICAL line is present
+  statistical  - no known signature, but an ERROR template bursts near the spike;
+                 a burst stays below the threshold, so the LLM still decides
+  llm          - nothing local is confident; falls through to a stub LLM with
+                 injected latency (then again, answered by the RCA cache)
+
+    python detection-agent/benchmarks/bench_analyzers.py
+"""
+import os
+import tempfile
+import time
+
+import _bench  # noqa: F401  (puts the agent modules on sys.path)
+from _bench import best_of, print_table
+from bench_log_reducer import START_NS, WINDOW_NS, synthetic_lines
+
+from analyzers import AnalysisInput, AnalyzerChain, LlmAnalyzer, RuleAnalyzer, StatisticalAnalyzer
+from log_reducer import LogReducer
+from rca_cache import RcaCache
+
+LOG_BYTES = 20 * 10**6
+TOKEN_BUDGET = 4000
+LLM_LATENCY_SECONDS = 2.0
+
+
+def stub_llm(logs: str, resource: str = "cpu") -> str:
+    time.sleep(LLM_LATENCY_SECONDS)
+    return "**REASON**: Stub analysis of the reduced logs.\n**CONFIDENCE**: 85%"
+
+
+def build_input(name: str, keep, burst: int = 0) -> AnalysisInput:
+    reducer = LogReducer(START_NS, START_NS + WINDOW_NS)
+    for ts, line in synthetic_lines(LOG_BYTES):
+        if keep(ts, line):
+            reducer.add(ts, line)
+    # An error with no rule that starts in the last minute before the spike
+    for i in range(burst):
+        ts = START_NS + WINDOW_NS - 60 * 10**9 + i * 60 * 10**9 // burst
+        reducer.add(ts, f"2026-10-17 04:59:{i % 60:02d},000 - ERROR - [api] upstream timeout calling payments after {1000 + i}ms")
+    rendered = reducer.render(TOKEN_BUDGET)
+    return AnalysisInput(name, rendered, "", reducer.signature(), [reducer])
+
+
+def main():
+    scenarios = {
+        "rules": build_input("node-rules", lambda ts, line: True),
+        "statistical": build_input("node-stat", lambda ts, line: " ERROR " not in line, burst=200),
+        "llm": build_input("node-llm", lambda ts, line: " ERROR " not in line),
+    }
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = RcaCache(os.path.join(tmp, "rca.sqlite3"))
+        chain = AnalyzerChain([RuleAnalyzer(), StatisticalAnalyzer(), LlmAnalyzer(stub_llm, "stub", cache)])
+        for path, data in scenarios.items():
+            result = chain.analyze(data)
+            if result.analyzer == "llm":
+                seconds = result.elapsed_ms / 1e3
+                rows.append((path, result.analyzer, result.confidence, f"{seconds * 1e3:,.2f}", result.reason[:60]))
+                result = chain.analyze(data)
+                rows.append((path + " (cached)", result.analyzer, result.confidence, f"{result.elapsed_ms:,.2f}", result.reason[:60]))
+                continue
+            seconds = best_of(lambda: chain.analyze(data), repeat=20)
+            rows.append((path, result.analyzer, result.confidence, f"{seconds * 1e3:,.3f}", result.reason[:60]))
+        cache.close()
+
+    templates = {path: len(data.reducers[0].templates) for path, data in scenarios.items()}
+    print(f"{LOG_BYTES // 10**6} MB of synthetic logs per scenario, templates: {templates}, "
+          f"stub LLM latency {LLM_LATENCY_SECONDS}s")
+    print_table(("scenario", "decided by", "confidence", "decision ms", "reason"), rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+Replay benchmark for the spike detectors: detection latency, false positives and
+per-sample cost over 24h CPU traces (agent aggregate scale, 2 VCPUs, 10s samples).
+
+Built-in synthetic traces:
+  idle      - quiet box, single-tick noise bursts, cpu-spike-app /spike incidents
+  busy      - batch load constantly above the 75% threshold, plus real spikes
+  diurnal   - daily load curve with noise and spikes
+
+Recorded traces can be replayed too, from CSV rows of
+"timestamp,value[,incident]" (incident=1 marks samples inside a real spike):
+
+    python detection-agent/benchmarks/bench_detectors.py [trace.csv ...]
+"""
+import csv
+import math
+import random
+import sys
+import time
+from typing import List, Tuple
+
+import _bench  # noqa: F401  (puts the agent modules on sys.path)
+from _bench import print_table
+
+from detectors import DetectorConfig, SpikeDetector
+
+INTERVAL = 10.0
+DAY = 86400
+NUM_CPUS = 2
+GRACE_SECONDS = 60  # a detection this long after an incident ended still counts as that incident
+LEGACY_DEDUP_SECONDS = 120  # the old loop re-fired once the previous incident cycle had finished
+
+Trace = Tuple[List[float], List[float], List[Tuple[float, float]]]  # times, values, incidents
+
+
+def synthetic_trace(kind: str, seed: int = 0) -> Trace:
+    rng = random.Random(seed)
+    n = int(DAY / INTERVAL)
+    times = [i * INTERVAL for i in range(n)]
+    values = []
+    for t in times:
+        if kind == "busy":
+            base = 85 + 8 * rng.gauss(0, 1)
+        elif kind == "diurnal":
+            base = 35 + 25 * math.sin(2 * math.pi * t / DAY) + 4 * rng.gauss(0, 1)
+        else:
+            base = 5 + 3 * abs(rng.gauss(0, 1))
+        # Single-sample noise: cron jobs, deploys, log rotation
+        if rng.random() < 0.004:
+            base += rng.uniform(60, 110)
+        values.append(base)
+
+    incidents = []
+    for k in range(6):
+        start = (k + 0.5) * DAY / 6 + rng.uniform(-1800, 1800)
+        duration = rng.uniform(40, 120)
+        incidents.append((start, start + duration))
+        for i, t in enumerate(times):
+            if start <= t < start + duration:
+                values[i] = min(100.0 * NUM_CPUS, values[i] + 100 + rng.uniform(-3, 3))  # one core pinned
+    return times, [max(0.0, min(100.0 * NUM_CPUS, v)) for v in values], incidents
+
+
+def load_csv(path: str) -> Trace:
+    times, values, incidents = [], [], []
+    open_start = None
+    with open(path, newline='') as f:
+        for row in csv.reader(f):
+            if not row or not row[0].replace('.', '', 1).isdigit():
+                continue  # header
+            t, v = float(row[0]), float(row[1])
+            flagged = len(row) > 2 and row[2].strip() == "1"
+            if flagged and open_start is None:
+                open_start = t
+            elif not flagged and open_start is not None:
+                incidents.append((open_start, t))
+                open_start = None
+            times.append(t)
+            values.append(v)
+    if open_start is not None:
+        incidents.append((open_start, times[-1]))
+    return times, values, incidents
+
+
+class LegacyThreshold:
+    """The old loop: any single sample above the threshold starts a cycle (deduped while one runs)."""
+
+    def __init__(self, threshold: float):
+        self.threshold = threshold
+        self.last_fired = -math.inf
+
+    def update(self, timestamp: float, value: float):
+        if value > self.threshold and timestamp - self.last_fired >= LEGACY_DEDUP_SECONDS:
+            self.last_fired = timestamp
+            return timestamp
+        return None
+
+
+CONFIGS = {
+    "legacy single-sample": None,
+    "sustained+hysteresis": DetectorConfig(threshold=75, sustain_seconds=10, clear_below=60, clear_seconds=20),
+    "+EWMA (agent default)": DetectorConfig(threshold=75, sustain_seconds=10, clear_below=60, clear_seconds=20,
+                                            ewma_alpha=0.05, ewma_z=3.0),
+    "+MAD(60)": DetectorConfig(threshold=75, sustain_seconds=10, clear_below=60, clear_seconds=20,
+                               mad_window=60, mad_z=3.5),
+    "+EWMA+MAD(60)": DetectorConfig(threshold=75, sustain_seconds=10, clear_below=60, clear_seconds=20,
+                                    ewma_alpha=0.05, ewma_z=3.0, mad_window=60, mad_z=3.5),
+}
+
+
+def replay(trace: Trace, config):
+    times, values, incidents = trace
+    detector = LegacyThreshold(75) if config is None else SpikeDetector(config)
+    fired = []
+    start = time.perf_counter()
+    for t, v in zip(times, values):
+        result = detector.update(t, v)
+        if result is not None:
+            fired.append(t)
+    per_sample = (time.perf_counter() - start) / len(times)
+
+    detected, latencies, false_positives = set(), [], 0
+    for t in fired:
+        match = next((i for i, (s, e) in enumerate(incidents) if s <= t <= e + GRACE_SECONDS), None)
+        if match is None:
+            false_positives += 1
+        elif match not in detected:
+            detected.add(match)
+            latencies.append(t - incidents[match][0])
+        # repeat detections of an already detected incident are neither hits nor false alarms
+    days = (times[-1] - times[0]) / DAY if len(times) > 1 else 1.0
+    return {
+        "detected": f"{len(detected)}/{len(incidents)}",
+        "latency": f"{sum(latencies) / len(latencies):.0f}" if latencies else "-",
+        "fp_per_day": f"{false_positives / max(days, 1e-9):.1f}",
+        "cost_us": f"{per_sample * 1e6:.2f}",
+    }
+
+
+def main():
+    traces = {path: load_csv(path) for path in sys.argv[1:]} or {
+        kind: synthetic_trace(kind, seed) for seed, kind in enumerate(("idle", "busy", "diurnal"))
+    }
+    rows = []
+    for trace_name, trace in traces.items():
+        for config_name, config in CONFIGS.items():
+            r = replay(trace, config)
+            rows.append((trace_name, config_name, r["detected"], r["latency"], r["fp_per_day"], r["cost_us"]))
+    print(f"samples every {INTERVAL:.0f}s; latency = first detection - spike start")
+    print_table(("trace", "detector", "detected", "mean latency s", "false pos/day", "us/sample"), rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+"""
+End-to-end benchmark: the real agent loop (scheduler, detectors, incident pipeline,
+Loki fetch, analyzer chain) against the replay harness, at several fleet sizes.
+
+Each fleet member replays a trace with two cpu-spike-app /spike runs: one silent
+(the LLM stand-in has to explain it) and one logged (the rule analyzer explains it). Reported
+per spike, from the moment it started:
+
+    detect     the detector fired
+    rca        the analyzer chain decided
+    remediate  the fake Docker daemon finished the restart
+
+plus the agent process's CPU (% of one core) and peak RSS. Restarts go through the
+agent's real remediation executor to a fake Docker Engine API on a Unix socket. The
+fake servers run in child processes and are not counted. The agent's delays (interval, sustain/clear,
+Loki ingestion wait) are scaled down by INTERVAL / CHECK_INTERVAL_SECONDS
+so one fleet size takes about a minute.
+
+    python detection-agent/benchmarks/bench_e2e.py [trace.csv]
+
+Restarts are real in the replay: a restart that lands late (analysis backlog on a
+large fleet) also ends whatever spike is running by then, so a second spike can be
+over before it is detected and counts as missed.
+
+A recorded trace (see replay.py record) replaces the synthetic one; spikes are
+then only the incident=1 rows in it.
+"""
+import asyncio
+import contextlib
+import dataclasses
+import multiprocessing
+import os
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+
+import aiohttp
+
+import _bench  # noqa: F401  (puts the agent modules on sys.path)
+from _bench import print_table
+from fake_servers import free_port, serve_in_process, serve_unix_in_process
+from replay import (CpuTrace, Spike, StubAnalyzer, make_replay_docker_app, make_replay_exporter_app,
+                    make_replay_loki_app, target_offset)
+
+FLEET_SIZES = (1, 10, 100, 500)
+INTERVAL = 1.0
+NUM_CPUS = 2
+STARTUP_SECONDS = 3.0  # agent import and counter priming, before the trace starts
+SPREAD_SECONDS = 8.0  # fleet members start their trace up to this late
+RUN_SECONDS = 60.0
+# The silent spike comes first: once a logged spike's ERROR line is in the 300s log window,
+# the rules would (mis)attribute any later spike to it
+SPIKES = (
+    Spike(start=15, duration=15, core=1, logged=False),
+    Spike(start=35, duration=20, core=0),
+)
+LLM_LATENCY_SECONDS = 2.0
+RESTART_LATENCY_SECONDS = 1.0
+GRACE_SECONDS = 10.0  # a detection this long after a spike ended still belongs to it
+
+
+def run_fleet(size: int, trace: CpuTrace, epoch: float, exporter_url: str, loki_url: str, docker_endpoint: str,
+              results):
+    """Child process: imports the agent, swaps in the stubs and runs it until epoch + RUN_SECONDS."""
+    workdir = tempfile.mkdtemp(prefix="agent-replay-")  # the agent's SQLite files land here
+    os.chdir(workdir)
+    for key in ("GEMINI_API_KEY", "GOOGLE_API_KEY"):
+        os.environ.pop(key, None)  # the stub LLM stands in; no GenAI SDK warm-up mid-run
+    os.environ["AGENT_TIMESERIES_DIR"] = ""
+    os.environ.pop("SLACK_WEBHOOK_URL", None)
+    os.environ.pop("AGENT_NOTIFY_WEBHOOK_URL", None)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        import detection_agent as agent
+        from analyzers import AnalyzerChain, RuleAnalyzer, StatisticalAnalyzer
+        from detectors import SpikeDetector
+        from remediation import RemediationExecutor
+        from scrape_scheduler import ScrapeTarget
+
+        scale = INTERVAL / agent.CHECK_INTERVAL_SECONDS
+        agent.CHECK_INTERVAL_SECONDS = INTERVAL
+        agent.LOG_INGESTION_DELAY_SECONDS *= scale
+        agent.LOKI_URL = f"{loki_url}/loki/api/v1/query_range"
+        agent.LOKI_INSTANT_URL = f"{loki_url}/loki/api/v1/query"
+        agent.SAMPLE_CHANNEL_PORT = free_port()
+        llm = StubAnalyzer(LLM_LATENCY_SECONDS)
+        agent.analyzer_chain = AnalyzerChain([RuleAnalyzer(), StatisticalAnalyzer(), llm],
+                                             agent.ANALYZER_CONFIDENCE_THRESHOLD)
+        agent.remediation_executor = RemediationExecutor(
+            docker_endpoint,
+            max_concurrent=agent.REMEDIATION_MAX_CONCURRENT,
+            max_per_host=agent.REMEDIATION_MAX_PER_HOST,
+            # Every spike in the trace is remediated: no cooldown, and no rate limit below one restart per spike
+            cooldown_seconds=0,
+            rate_limit=size * len(trace.spikes),
+        )
+
+        detections: List[Tuple[int, float]] = []
+        decided: Dict[Tuple[str, float], float] = {}
+
+        class RecordingDetector(SpikeDetector):
+            def __init__(self, n, config):
+                super().__init__(config)
+                self.n = n
+
+            def update(self, timestamp, value):
+                detection = super().update(timestamp, value)
+                if detection is not None:
+                    detections.append((self.n, detection.timestamp))
+                return detection
+
+        analysis_stage = agent.analysis_stage
+
+        def timed_analysis_stage(incident):
+            try:
+                return analysis_stage(incident)
+            finally:
+                decided[(incident.target.name, incident.detected_at.timestamp())] = time.time()
+
+        agent.analysis_stage = timed_analysis_stage
+
+        d = agent.DETECTOR_DEFAULTS
+        config = dataclasses.replace(d, sustain_seconds=d.sustain_seconds * scale, clear_seconds=d.clear_seconds * scale)
+        targets = [ScrapeTarget(f"node-{n}", f"{exporter_url}/targets/{n}/metrics", INTERVAL, f"app-{n}")
+                   for n in range(size)]
+        detectors = {target.name: RecordingDetector(n, config) for n, target in enumerate(targets)}
+
+        async def drive():
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(agent.run_agent(targets, detectors, {}, {}), epoch + RUN_SECONDS - time.time())
+
+        before = resource.getrusage(resource.RUSAGE_SELF)
+        started = time.time()
+        asyncio.run(drive())
+        elapsed = time.time() - started
+        after = resource.getrusage(resource.RUSAGE_SELF)
+
+    cpu_seconds = (after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime)
+    results.put({
+        "detections": detections,
+        "decided": decided,
+        "llm_calls": llm.calls,
+        "cpu_percent": 100 * cpu_seconds / elapsed,
+        "peak_rss_mb": after.ru_maxrss / 1024,
+    })
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+def docker_restarts(endpoint: str) -> List[Tuple[int, float]]:
+    """(member, time) per restart the fake daemon finished."""
+    async def fetch():
+        async with aiohttp.ClientSession(connector=aiohttp.UnixConnector(path=endpoint[len("unix://"):])) as session:
+            async with session.get("http://docker/stats") as response:
+                return await response.json()
+    return [(int(name.rsplit("-", 1)[-1]), t) for t, name in asyncio.run(fetch())["calls"]]
+
+
+def percentiles(values: List[float]) -> str:
+    if not values:
+        return "-"
+    ordered = sorted(values)
+    return f"{statistics.median(ordered):.1f} / {ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]:.1f}"
+
+
+def score(size: int, trace: CpuTrace, epoch: float, result: dict) -> tuple:
+    """Matches detections/decisions/restarts to the spike each one belongs to."""
+    detect, rca, remediate = [], [], []
+    matched = set()
+    remediated = sorted(result["remediated"])
+    for n in range(size):
+        start_of_trace = epoch + target_offset(n, SPREAD_SECONDS)
+        for spike in trace.spikes:
+            start = start_of_trace + spike.start
+            end = start + spike.duration + GRACE_SECONDS
+            hit = next(((m, t) for m, t in result["detections"] if m == n and start <= t <= end), None)
+            if hit is None:
+                continue
+            matched.add(hit)
+            detect.append(hit[1] - start)
+            decided = result["decided"].get((f"node-{n}", hit[1]))
+            if decided is not None:
+                rca.append(decided - start)
+            restart = next((t for m, t in remediated if m == n and hit[1] <= t <= end + RUN_SECONDS), None)
+            if restart is not None and (decided is None or restart >= decided):
+                remediate.append(restart - start)
+    false_positives = len(result["detections"]) - len(matched)
+    spikes = size * len(trace.spikes)
+    return (
+        size,
+        f"{len(detect)}/{spikes}",
+        false_positives,
+        percentiles(detect),
+        percentiles(rca),
+        percentiles(remediate),
+        result["llm_calls"],
+        f"{result['cpu_percent']:.1f}",
+        f"{result['peak_rss_mb']:.0f}",
+    )
+
+
+def main(trace_path: Optional[str] = None):
+    trace = CpuTrace.from_csv(trace_path, NUM_CPUS) if trace_path else CpuTrace.synthetic(NUM_CPUS, 20.0, SPIKES)
+    rows = []
+    for size in FLEET_SIZES:
+        epoch = time.time() + STARTUP_SECONDS
+        with serve_in_process(make_replay_exporter_app, trace=trace, epoch=epoch, spread=SPREAD_SECONDS) as exporter_url, \
+                serve_in_process(make_replay_loki_app, trace=trace, epoch=epoch, targets=size,
+                                 spread=SPREAD_SECONDS) as loki_url, \
+                serve_unix_in_process(make_replay_docker_app, os.path.join(tempfile.gettempdir(), "replay-docker.sock"),
+                                      exporter_url=exporter_url, restart_delay=RESTART_LATENCY_SECONDS) as docker_endpoint:
+            results = multiprocessing.Queue()
+            proc = multiprocessing.Process(target=run_fleet,
+                                           args=(size, trace, epoch, exporter_url, loki_url, docker_endpoint, results))
+            proc.start()
+            result = results.get(timeout=RUN_SECONDS + 120)
+            proc.join(30)
+            result["remediated"] = docker_restarts(docker_endpoint)
+        rows.append(score(size, trace, epoch, result))
+
+    print(f"interval={INTERVAL}s, {NUM_CPUS} VCPUs, LLM stand-in {LLM_LATENCY_SECONDS}s, restart stand-in "
+          f"{RESTART_LATENCY_SECONDS}s; latencies in seconds from spike start (p50 / p95)")
+    print_table(("targets", "detected", "false pos", "detect", "rca", "remediate", "llm calls",
+                 "agent cpu %", "peak rss MB"), rows)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1] if len(sys.argv) > 1 else None)
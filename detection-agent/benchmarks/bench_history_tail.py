@@ -0,0 +1,75 @@
+"""
+Benchmark: dashboard refresh cost (HistoryTail.poll) against history size.
+A refresh should cost the same with 1k or 1M stored incidents; only the one-time
+per-session bootstrap depends on the history size. Exits non-zero if a refresh
+reads anything but the new rows, or if a median refresh at the largest size costs
+more than MAX_SLOWDOWN times the smallest size's.
+
+    python detection-agent/benchmarks/bench_history_tail.py [N ...]   (default: 1000 1000000)
+"""
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+import _bench  # noqa: F401  (puts the agent modules on sys.path)
+from _bench import print_table
+from bench_incident_store import make_record
+
+from incident_store import HistoryTail, IncidentStore
+
+BATCH = 50_000
+REFRESHES = 500
+MAX_SLOWDOWN = 3.0
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1_000, 1_000_000]
+    rng = random.Random(0)
+    rows, medians = [], []
+    for n in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            writer = IncidentStore(os.path.join(tmp, "incidents.sqlite3"))
+            for start in range(0, n, BATCH):
+                writer.append_many(make_record(i, rng) for i in range(start, min(start + BATCH, n)))
+
+            boot_start = time.perf_counter()
+            tail = HistoryTail(IncidentStore(writer.path))
+            bootstrap = time.perf_counter() - boot_start
+
+            # Idle refreshes: nothing new since the last poll
+            idle, read = [], 0
+            for _ in range(REFRESHES):
+                start = time.perf_counter()
+                read += tail.poll()
+                idle.append(time.perf_counter() - start)
+
+            # Busy refreshes: the agent appended one incident since the last poll
+            busy = []
+            for i in range(REFRESHES):
+                writer.append(make_record(n + i, rng))
+                start = time.perf_counter()
+                read += tail.poll()
+                busy.append(time.perf_counter() - start)
+
+            assert read == REFRESHES, f"{n:,} stored: refreshes read {read} row(s) for {REFRESHES} new incident(s)"
+            assert tail.count == n + REFRESHES, (tail.count, n + REFRESHES)
+            idle, busy = statistics.median(idle), statistics.median(busy)
+            medians.append((n, idle, busy))
+            rows.append((f"{n:,}", f"{bootstrap * 1e3:,.1f}", f"{idle * 1e6:.1f}", f"{busy * 1e6:.1f}", tail.count))
+            writer.close()
+
+    print_table(("history", "bootstrap ms (once)", "median idle refresh us", "median refresh +1 incident us",
+                 "count"), rows)
+    (small, small_idle, small_busy), (large, large_idle, large_busy) = min(medians), max(medians)
+    slowdown = max(large_idle / small_idle, large_busy / small_busy)
+    print(f"{'OK' if slowdown <= MAX_SLOWDOWN else 'OVER BUDGET'}: a refresh at {large:,} incidents costs "
+          f"{slowdown:.2f}x the one at {small:,} (budget {MAX_SLOWDOWN:g}x)")
+    if slowdown > MAX_SLOWDOWN:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
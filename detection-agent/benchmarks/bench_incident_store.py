@@ -0,0 +1,101 @@
+"""
+Benchmark: incident history write/read cost as history grows, SQLite store vs the
+legacy read-modify-rewrite of remediation_history.json.
+
+    python detection-agent/benchmarks/bench_incident_store.py [N ...]   (default: 1000 10000 100000)
+"""
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import _bench  # noqa: F401  (puts the agent modules on sys.path)
+from _bench import print_table
+
+from incident_store import IncidentStore
+
+LEGACY_MAX = 10_000  # the JSON rewrite gets too slow to bother beyond this
+PROBES = 200
+START = datetime(2026, 1, 1)
+
+
+def make_record(i: int, rng: random.Random) -> dict:
+    return {
+        "timestamp": START + timedelta(seconds=i * 60),
+        "node": f"node-{rng.randrange(50)}",
+        "status": rng.choice(("SUCCESS", "SKIPPED", "FAILED")),
+        "cpu_peak": rng.random() * 40,
+        "root_cause": "cpu-test-app /spike endpoint started a CPU-intensive calculation.",
+        "confidence": rng.randrange(50, 100),
+        "analyzer": rng.choice(("rules", "statistical", "llm")),
+        "action": "docker restart",
+        "target": "cpu-test-app",
+        "summary": "Container 'cpu-test-app' restarted due to CPU spike. RCA Confidence: 95%.",
+    }
+
+
+def legacy_append(path: str, record: dict):
+    """The old log_remediation_history."""
+    history = []
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            history = json.load(f)
+    history.append(record)
+    with open(path, 'w') as f:
+        json.dump(history, f, indent=4, default=str)
+
+
+def legacy_load(path: str):
+    """The old dashboard load_history."""
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def timed(func, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1_000, 10_000, 100_000]
+    rng = random.Random(0)
+    rows = []
+    for n in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            store = IncidentStore(os.path.join(tmp, "incidents.sqlite3"))
+            records = [make_record(i, rng) for i in range(n)]
+            fill_start = time.perf_counter()
+            for record in records:
+                store.append(record)
+            fill = time.perf_counter() - fill_start
+
+            i = iter(range(n, n + PROBES))
+            append = timed(lambda: store.append(make_record(next(i), rng)), PROBES)
+            last5 = timed(lambda: store.last(5), PROBES)
+            last5_node = timed(lambda: store.last(5, node="node-7"), PROBES)
+            mid = START + timedelta(seconds=n * 30)
+            hour = timed(lambda: store.between(mid, mid + timedelta(hours=1)), PROBES)
+            count = timed(store.count, 20)
+            store.close()
+            rows.append(("sqlite", f"{n:,}", f"{fill:.2f}", f"{append * 1e3:.3f}", f"{last5 * 1e3:.3f}",
+                         f"{last5_node * 1e3:.3f}", f"{hour * 1e3:.3f}", f"{count * 1e3:.2f}"))
+
+            if n <= LEGACY_MAX:
+                path = os.path.join(tmp, "remediation_history.json")
+                with open(path, 'w') as f:
+                    json.dump(records, f, indent=4, default=str)
+                append = timed(lambda: legacy_append(path, make_record(n, rng)), 5)
+                load = timed(lambda: legacy_load(path)[-5:], 5)
+                rows.append(("json", f"{n:,}", "-", f"{append * 1e3:.3f}", f"{load * 1e3:.3f}", "-", "-", f"{load * 1e3:.2f}"))
+
+    print("per-operation milliseconds (fill = seconds to append the initial history one by one)")
+    print_table(("store", "history", "fill s", "append ms", "last 5 ms", "last 5 node ms", "1h range ms", "count ms"), rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Pipeline check: one incident of each type through the agent's real stages
+(attribution, log fetch, analysis, confirm, remediation, verify, notify), with
+the cpu-spike-app's CRITICAL ERROR line in the logs every time.
+
+Loki is replaced by those lines, the Docker daemon by an executor that records
+restarts, and verification by an immediate STABLE. Reported per type: the
+analyzer that decided, its confidence, the final status, the restarts issued
+and the time through the pipeline. Exits non-zero if a memory, disk or network
+incident restarted anything, or if a CPU or load incident (ATTRIBUTED_RESOURCES)
+did not.
+
+    python detection-agent/benchmarks/bench_incident_types.py
+"""
+import asyncio
+import contextlib
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+import _bench  # noqa: F401  (puts the agent modules on sys.path)
+from _bench import print_table
+
+from analyzers import AnalyzerChain, RuleAnalyzer, StatisticalAnalyzer
+from incident_pipeline import Incident, IncidentPipeline
+from log_reducer import reduce_lines
+from remediation import RemediationExecutor, RemediationOutcome, RemediationRequest
+from resource_rates import RESOURCES
+from scrape_scheduler import ScrapeTarget
+from stability import StabilityResult
+
+LOG_LINE = "{ts} - ERROR - [cpu-test-app] **CRITICAL ERROR: Beginning CPU-intensive calculation.** Iterations: 500000000"
+
+
+class RecordingExecutor(RemediationExecutor):
+    """Restarts nothing; records what it was asked to restart."""
+
+    def __init__(self):
+        super().__init__(cooldown_seconds=0)
+        self.restarts: List[RemediationRequest] = []
+
+    async def _run(self, request: RemediationRequest) -> RemediationOutcome:
+        self.restarts.append(request)
+        return RemediationOutcome("SUCCESS", f"Recorded restart of {request.resource}", "docker-api")
+
+
+async def fake_logs(spike_time: datetime, suspects=()):
+    end_ns = int(spike_time.timestamp() * 1e9)
+    records = [(end_ns - n * 1_000_000_000, LOG_LINE.format(ts=spike_time - timedelta(seconds=n))) for n in range(5)]
+    text, reducer = reduce_lines(records, end_ns - 300 * 1_000_000_000, end_ns, 2000)
+    return text, "", reducer.signature(), [reducer]
+
+
+async def stable(target, resource="cpu"):
+    return StabilityResult("STABLE", 0.0, 0.0), 0.0
+
+
+async def run(agent, resource: str):
+    executor = agent.remediation_executor = RecordingExecutor()
+    pipeline = IncidentPipeline({
+        "attribution": agent.attribution_stage,
+        "log_fetch": agent.fetch_logs_stage,
+        "analysis": agent.analysis_stage,
+        "confirm": agent.confirm_stage,
+        "remediation": agent.remediation_stage,
+        "verify": agent.verify_stage,
+        "notify": agent.notify_stage,
+    })
+    pipeline.start()
+    incident = Incident(ScrapeTarget("node-0", "http://127.0.0.1:9/metrics", 10.0), datetime.now(), 0.0, resource=resource)
+    start = time.perf_counter()
+    pipeline.submit(incident)
+    while pipeline.in_flight:
+        await asyncio.sleep(0.005)
+    elapsed = time.perf_counter() - start
+    await pipeline.stop()
+    analysis = incident.analysis
+    return (resource, analysis.analyzer if analysis else "-", incident.confidence, incident.status,
+            len(executor.restarts), f"{elapsed * 1e3:.1f}")
+
+
+def main():
+    workdir = tempfile.mkdtemp(prefix="bench-incident-types-")  # the agent's SQLite files land here
+    os.chdir(workdir)
+    os.environ["AGENT_TIMESERIES_DIR"] = ""
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        import detection_agent as agent
+        agent.LOG_INGESTION_DELAY_SECONDS = 0
+        agent.get_incident_logs = fake_logs
+        agent.verify_stability = stable
+        agent.analyzer_chain = AnalyzerChain(
+            [RuleAnalyzer(), StatisticalAnalyzer(agent.ANALYZER_CONFIDENCE_THRESHOLD - 1)],
+            agent.ANALYZER_CONFIDENCE_THRESHOLD)
+        rows = [asyncio.run(run(agent, resource)) for resource in ("cpu",) + tuple(RESOURCES)]
+    shutil.rmtree(workdir, ignore_errors=True)
+    print_table(("incident", "decided by", "confidence", "status", "restarts", "pipeline ms"), rows)
+
+    wrong = [resource for resource, _, _, _, restarts, _ in rows
+             if bool(restarts) != (resource in agent.ATTRIBUTED_RESOURCES)]
+    print(f"{'OK' if not wrong else 'WRONG'}: only {', '.join(agent.ATTRIBUTED_RESOURCES)} incidents restart a container"
+          + (f" (wrong: {', '.join(wrong)})" if wrong else ""))
+    if wrong:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Benchmark: cost of the agent's self-instrumentation on the per-sample hot path.
+
+Each scraped sample pays three histogram observations (scrape, cpu_rate, detect)
+and one log line. Compared here against the work it instruments (CPU rate
+update for a 96-core host, detector update) and against the old print() line,
+plus the cost of rendering /metrics for a fleet-sized label set.
+
+    python detection-agent/benchmarks/bench_instrumentation.py
+"""
+import contextlib
+import logging
+import os
+import threading
+
+import _bench  # noqa: F401  (puts the agent modules on sys.path)
+from _bench import best_of, print_table
+from synthetic import node_exporter_payload
+
+from cpu_rate import CpuRateEngine
+from detectors import DetectorConfig, SpikeDetector
+from instrumentation import (STAGE_SECONDS, SPIKES_DETECTED, Counter, Histogram, JsonFormatter, Registry,
+                             TextFormatter, get_logger)
+from prom_parser import parse_cpu_seconds
+
+N = 100_000
+FLEET_TARGETS = 1000
+THREADS = 8
+
+
+def cpu_seconds_series(count: int):
+    """Successive scrapes of a 96-core host (counters advanced between scrapes)."""
+    base = parse_cpu_seconds(node_exporter_payload(96 * 8, num_cpus=96).splitlines())
+    return [{key: value + i * 5.0 for key, value in base.items()} for i in range(count)]
+
+
+def log_cost(formatter: logging.Formatter) -> float:
+    logger = get_logger("bench")
+    handler = logging.StreamHandler(open(os.devnull, "w"))
+    handler.setFormatter(formatter)
+    logger.handlers[:] = [handler]
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    cost = best_of(lambda: logger.info("Current Total CPU Usage: 12.34% (user 10%, system 2%)",
+                                       extra={"target": "web-1", "cpu_percent": 12.34}), number=N // 10)
+    handler.stream.close()
+    return cost
+
+
+def print_cost() -> float:
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        return best_of(lambda: print("[2026-01-01T00:00:00.000000] [web-1] Current Total CPU Usage: 12.34% "
+                                     "(user 10%, system 2%)"), number=N // 10)
+
+
+def main():
+    histogram = Histogram("bench_seconds", "bench", ("stage",))
+    counter = Counter("bench_total", "bench", ("component",))
+
+    def timed():
+        with histogram.time("detect"):
+            pass
+
+    observe = best_of(lambda: histogram.observe(0.0123, "scrape"), number=N)
+    inc = best_of(lambda: counter.inc("scrape"), number=N)
+    ctx = best_of(timed, number=N)
+
+    # Contended: THREADS threads observing the same histogram at once
+    def hammer():
+        for _ in range(N // THREADS):
+            histogram.observe(0.0123, "scrape")
+
+    def contended():
+        threads = [threading.Thread(target=hammer) for _ in range(THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    contended_cost = best_of(contended, repeat=3) / N
+
+    scrapes = cpu_seconds_series(50)
+    engine = CpuRateEngine()
+    engine.update(scrapes[0])
+    position = {"i": 1}
+
+    def rate_update():
+        engine.update(scrapes[position["i"] % len(scrapes)])
+        position["i"] += 1
+    rate = best_of(rate_update, number=1000)
+
+    detector = SpikeDetector(DetectorConfig(threshold=75, sustain_seconds=10, ewma_alpha=0.05))
+    clock = {"t": 0.0}
+
+    def detect():
+        clock["t"] += 10
+        detector.update(clock["t"], 20.0)
+    detect_cost = best_of(detect, number=N)
+
+    json_log = log_cost(JsonFormatter())
+    text_log = log_cost(TextFormatter())
+    old_print = print_cost()
+
+    per_sample_metrics = 3 * observe
+    rows = [
+        ("Histogram.observe", f"{observe * 1e6:.2f}", ""),
+        ("Counter.inc", f"{inc * 1e6:.2f}", ""),
+        ("Histogram.time() block", f"{ctx * 1e6:.2f}", ""),
+        (f"observe, {THREADS} threads contending", f"{contended_cost * 1e6:.2f}", ""),
+        ("CpuRateEngine.update (96 cores)", f"{rate * 1e6:.2f}", "instrumented work"),
+        ("SpikeDetector.update (EWMA)", f"{detect_cost * 1e6:.2f}", "instrumented work"),
+        ("3 observations per sample", f"{per_sample_metrics * 1e6:.2f}",
+         f"{per_sample_metrics / (rate + detect_cost):.1%} of rate + detect"),
+        ("old print() line", f"{old_print * 1e6:.2f}", ""),
+        ("JSON log line", f"{json_log * 1e6:.2f}", f"{json_log / old_print:.1f}x print"),
+        ("text log line", f"{text_log * 1e6:.2f}", f"{text_log / old_print:.1f}x print"),
+        (f"per sample, {FLEET_TARGETS} targets every 10s", f"{(per_sample_metrics + json_log) * 1e6:.2f}",
+         f"{(per_sample_metrics + json_log) * FLEET_TARGETS / 10:.2%} of one core"),
+    ]
+
+    # /metrics render with a realistic label set: every stage plus per-target spike counters
+    registry = Registry()
+    registry.register(STAGE_SECONDS)
+    for name in ("scrape", "cpu_rate", "detect", "loki_query", "llm", "log_fetch", "analysis",
+                 "remediation", "verify", "notify", "slack"):
+        STAGE_SECONDS.observe(0.1, name)
+    for i in range(FLEET_TARGETS):
+        SPIKES_DETECTED.inc(f"node-{i}")
+    registry.register(SPIKES_DETECTED)
+    body = registry.render()
+    render = best_of(registry.render, number=20)
+    rows.append((f"render /metrics ({FLEET_TARGETS} targets)", f"{render * 1e6:.0f}", f"{len(body) / 1024:.0f} KB"))
+
+    print_table(("operation", "us", "note"), rows)
+
+
+if __name__ == "__main__":
+    main()
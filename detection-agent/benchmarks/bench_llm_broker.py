@@ -0,0 +1,178 @@
+"""
+Benchmark: LLM calls during an incident storm, with and without the broker.
+
+A stub LLM answers with injectable latency: usually around MEDIAN_SECONDS, a
+slow tail (SLOW_FRACTION at SLOW_SECONDS) and a few hangs (HANG_FRACTION at
+HANG_SECONDS), each call drawn independently (so a hedged copy can be fast when
+the first one is slow). Behind the broker the stub gives up after the deadline,
+as the agent's Gemini client does with its HTTP timeout. Incidents arrive from
+as many threads, in two LOADS: a storm (more incidents per second than the
+quota, several nodes per log signature) and a trickle (distinct signatures, with
+quota to spare for hedges):
+
+    direct      every incident calls the stub itself (the old analyze_logs_with_llm)
+    broker      LlmBroker: concurrency cap, rate limit, coalescing and deadline
+    + hedge     ... plus a hedge after the recent p95 latency
+    + fallback  ... plus a faster stub, behind its own broker (as in the agent),
+                when the deadline passes or the call fails
+
+Reported: per-incident latency (p50/p95/max), backend calls and their peak
+concurrency and per-second rate, and incidents that got no answer, timed out or
+were answered by the fallback. Latencies are scaled down about 10x from Gemini's.
+
+    python detection-agent/benchmarks/bench_llm_broker.py
+"""
+import logging
+import random
+import threading
+import time
+from collections import Counter
+
+import _bench  # noqa: F401  (puts the agent modules on sys.path)
+from _bench import print_table
+
+from llm_broker import LlmBroker, LlmUnavailable
+
+MEDIAN_SECONDS = 0.3
+SLOW_FRACTION, SLOW_SECONDS = 0.03, 2.5
+HANG_FRACTION, HANG_SECONDS = 0.02, 20.0
+FALLBACK_SECONDS = 0.1
+LOADS = (("storm", 120, 40.0, 30), ("trickle", 60, 4.0, 60))  # (name, incidents, arrivals per second, signatures)
+WARMUP = 60  # calls before each load (4 workers, within the quota), so the broker has latencies to hedge on
+BROKER = {"max_concurrent": 16, "deadline_seconds": 3.0, "requests_per_minute": 600, "burst": 10,
+          "hedge_min_samples": 20}
+MODES = (
+    ("direct", None),
+    ("broker", {"hedge": False}),
+    ("+ hedge", {"hedge": True}),
+    ("+ fallback", {"hedge": True, "fallback": True}),
+)
+
+
+class StubLlm:
+    """Answers after a random latency (raises TimeoutError past `timeout`); records concurrency and call times."""
+
+    def __init__(self, seed: int, median: float = MEDIAN_SECONDS, timeout: float = None):
+        self.random = random.Random(seed)
+        self.median = median
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.running = 0
+        self.peak = 0
+        self.started = []
+
+    def latency(self) -> float:
+        with self.lock:
+            draw = self.random.random()
+            jitter = self.random.lognormvariate(0, 0.3)
+        if draw < HANG_FRACTION:
+            return HANG_SECONDS
+        if draw < HANG_FRACTION + SLOW_FRACTION:
+            return SLOW_SECONDS * jitter
+        return self.median * jitter
+
+    def __call__(self, prompt: str) -> str:
+        delay = self.latency()
+        with self.lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+            self.started.append(time.monotonic())
+        try:
+            if self.timeout is not None and delay > self.timeout:
+                time.sleep(self.timeout)
+                raise TimeoutError(f"no response in {self.timeout:g}s")
+            time.sleep(delay)
+            return f"REASON: {prompt}\nCONFIDENCE: 90"
+        finally:
+            with self.lock:
+                self.running -= 1
+
+    def reset(self):
+        with self.lock:
+            self.peak = self.running
+            self.started = []
+
+
+def run(mode: str, options, incidents: int, arrival_rate: float, distinct: int):
+    broker = None
+    if options is None:
+        stub = complete = StubLlm(seed=7)
+    else:
+        stub = StubLlm(seed=7, timeout=BROKER["deadline_seconds"])
+        fallback = None
+        if options.get("fallback"):
+            fallback = LlmBroker(StubLlm(seed=8, median=FALLBACK_SECONDS, timeout=BROKER["deadline_seconds"] / 2),
+                                 **{**BROKER, "deadline_seconds": BROKER["deadline_seconds"] / 2}, hedge=False,
+                                 name="llm_fallback").complete
+        broker = LlmBroker(stub, hedge=options["hedge"], fallback=fallback, **BROKER)
+        complete = broker.complete
+
+    def warm_up(worker: int):
+        for n in range(worker, WARMUP, 4):
+            try:
+                complete(f"warmup-{n}")
+            except LlmUnavailable:
+                pass
+            time.sleep(0.5)
+
+    warmup = [threading.Thread(target=warm_up, args=(worker,)) for worker in range(4 if broker is not None else 0)]
+    for thread in warmup:
+        thread.start()
+    for thread in warmup:
+        thread.join()
+    time.sleep(BROKER["burst"] * 60 / BROKER["requests_per_minute"])  # the rate limit's burst refills
+    stub.reset()
+    if broker is not None:
+        broker.counts = {outcome: 0 for outcome in broker.counts}
+
+    latencies, failed = [], []
+    lock = threading.Lock()
+    rng = random.Random(11)
+
+    def incident(prompt: str):
+        start = time.monotonic()
+        try:
+            complete(prompt)
+        except LlmUnavailable:
+            with lock:
+                failed.append(prompt)
+            return
+        with lock:
+            latencies.append(time.monotonic() - start)
+
+    threads = []
+    start = time.monotonic()
+    for n in range(incidents):
+        time.sleep(max(0.0, start + n / arrival_rate - time.monotonic()))
+        thread = threading.Thread(target=incident, args=(f"signature-{rng.randrange(distinct)}",), daemon=True)
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+
+    per_second = Counter(int(t - start) for t in stub.started)
+    latencies.sort()
+    counts = broker.counts if broker is not None else {}
+    if broker is not None:
+        broker.close()
+    return (mode, f"{latencies[len(latencies) // 2]:.2f}", f"{latencies[int(len(latencies) * 0.95)]:.2f}",
+            f"{latencies[-1]:.2f}", len(stub.started), stub.peak, max(per_second.values()),
+            counts.get("coalesced", "-"), counts.get("hedged", "-"), counts.get("timeout", "-"),
+            counts.get("fallback", "-"), len(failed))
+
+
+def main():
+    logging.getLogger("agent").setLevel(logging.ERROR)  # one fallback warning per timed-out incident
+    print(f"stub LLM ~{MEDIAN_SECONDS:g}s, {SLOW_FRACTION:.0%} at ~{SLOW_SECONDS:g}s, {HANG_FRACTION:.0%} hang "
+          f"{HANG_SECONDS:g}s; broker: {BROKER['max_concurrent']} slots, {BROKER['requests_per_minute']}/min, "
+          f"deadline {BROKER['deadline_seconds']:g}s")
+    for name, incidents, arrival_rate, distinct in LOADS:
+        rows = [run(mode, options, incidents, arrival_rate, distinct) for mode, options in MODES]
+        print()
+        print(f"{name}: {incidents} incidents at {arrival_rate:g}/s over {distinct} log signatures")
+        print_table(("mode", "p50 s", "p95 s", "max s", "backend calls", "peak concurrent", "peak calls/s",
+                     "coalesced", "hedged", "timed out", "fallback", "no answer"), rows)
+
+
+if __name__ == "__main__":
+    main()
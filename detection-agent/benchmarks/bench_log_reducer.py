@@ -0,0 +1,80 @@
+"""
+Benchmark: LogReducer throughput and compression on large synthetic incident logs.
+
+    python detection-agent/benchmarks/bench_log_reducer.py [MB ...]   (default: 10 100 300)
+"""
+import random
+import sys
+import time
+
+import _bench  # noqa: F401  (puts the agent modules on sys.path)
+from _bench import print_table
+
+from log_reducer import LogReducer, estimate_tokens
+
+TOKEN_BUDGET = 4000
+WINDOW_NS = 300 * 10**9
+START_NS = 1_700_000_000 * 10**9
+
+
+def synthetic_lines(target_bytes: int, seed: int = 0):
+    """
+    (timestamp_ns, line) pairs resembling the cpu-spike-app plus a noisy neighbour:
+    dominated by health checks and access logs, a handful of warnings, and the
+    spike's CRITICAL line plus a traceback burst in the last 10% of the window.
+    """
+    rng = random.Random(seed)
+    produced = 0
+    i = 0
+    while produced < target_bytes:
+        i += 1
+        ts = START_NS + int(rng.random() * WINDOW_NS)
+        stamp = f"2026-10-17 04:{rng.randrange(60):02d}:{rng.randrange(60):02d},{rng.randrange(1000):03d}"
+        roll = rng.random()
+        if roll < 0.55:
+            line = f"{stamp} - INFO - [cpu-test-app] Health check successful."
+        elif roll < 0.90:
+            line = (f'{stamp} - INFO - 10.0.{rng.randrange(256)}.{rng.randrange(256)} - - '
+                    f'"GET /api/v1/orders/{rng.randrange(10**6)} HTTP/1.1" 200 {rng.randrange(10**4)} {rng.random():.3f}ms')
+        elif roll < 0.98:
+            line = f"{stamp} - WARNING - [worker-{rng.randrange(16)}] Slow query on table orders took {rng.randrange(500, 5000)}ms"
+        elif roll < 0.999 or ts < START_NS + WINDOW_NS * 0.9:
+            line = f"{stamp} - DEBUG - cache stats hits={rng.randrange(10**5)} misses={rng.randrange(10**3)} ratio={rng.random():.2f}"
+        elif i % 2:
+            line = f"{stamp} - ERROR - [cpu-test-app] **CRITICAL ERROR: Beginning CPU-intensive calculation.** Iterations: 500000000"
+        else:
+            line = f'{stamp} - ERROR - Traceback (most recent call last): File "/usr/src/app/app.py", line {rng.randrange(200)}, in cpu_spike'
+        produced += len(line) + 1
+        yield ts, line
+
+
+def main():
+    sizes_mb = [int(arg) for arg in sys.argv[1:]] or [10, 100, 300]
+    rows = []
+    for size_mb in sizes_mb:
+        reducer = LogReducer(START_NS, START_NS + WINDOW_NS)
+        start = time.perf_counter()
+        for ts, line in synthetic_lines(size_mb * 10**6):
+            reducer.add(ts, line)
+        render_start = time.perf_counter()
+        rendered = reducer.render(TOKEN_BUDGET)
+        render_seconds = time.perf_counter() - render_start
+        wall = time.perf_counter() - start
+        stats = reducer.stats(rendered)
+        rows.append((
+            size_mb, f"{stats['lines']:,}", stats["templates"],
+            f"{stats['compression_ratio']:,.0f}x", estimate_tokens(rendered),
+            f"{stats['reduce_seconds']:.2f}", f"{render_seconds * 1e3:.1f}",
+            f"{stats['lines'] / stats['reduce_seconds'] / 1e3:.0f}k",
+        ))
+        if size_mb == sizes_mb[0]:
+            print("Top of rendered summary:")
+            print("\n".join(rendered.splitlines()[:6]))
+            print()
+        del reducer, wall
+    print(f"token budget={TOKEN_BUDGET}")
+    print_table(("MB", "lines", "templates", "compression", "out tokens", "reduce s", "render ms", "lines/s"), rows)
+
+
+if __name__ == "__main__":
+    main()
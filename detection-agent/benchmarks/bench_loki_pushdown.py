@@ -0,0 +1,78 @@
+"""
+Benchmark: incident log fetch with and without LogQL pushdown, on a busy host.
+
+detection_agent.get_incident_logs runs against a fake Loki that evaluates the
+LogQL the planner emits (fake_servers.make_busy_loki_app): N containers share
+the host's log rate, app-1 logs upstream ERRORs and app-7 is the CPU hog.
+
+    pull all      LOKI_PUSHDOWN = False: both jobs whole, filtered by the reducer
+    pushdown      topk metric query, then app-7 (attributed) unfiltered and the
+                  noisiest streams severity-filtered
+    no suspects   pushdown when attribution names nothing Loki knows (a container
+                  id): only the noisiest streams are pulled
+
+Reported: requests, lines and bytes Loki served, fetch time (wall, and the
+agent's own CPU: decoding and log reduction) and whether the cpu-test-app rule
+still matches the reduced logs.
+
+    python detection-agent/benchmarks/bench_loki_pushdown.py
+"""
+import asyncio
+import contextlib
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime
+
+import requests
+
+import _bench  # noqa: F401  (puts the agent modules on sys.path)
+from _bench import print_table
+from fake_servers import make_busy_loki_app, serve_in_process
+
+HOSTS = ((20, 200.0), (100, 2000.0))  # (containers, log lines per second on the host)
+MODES = (
+    ("pull all", False, ["app-7"]),
+    ("pushdown", True, ["app-7"]),
+    ("no suspects", True, ["3f9c2a7b1e04"]),
+)
+
+
+def main():
+    workdir = tempfile.mkdtemp(prefix="bench-loki-")  # the agent's SQLite files land here
+    os.chdir(workdir)
+    os.environ["AGENT_TIMESERIES_DIR"] = ""
+    rows = []
+    # The agent logs to stdout, which stays redirected for the whole run
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        import detection_agent as agent
+        from analyzers import AnalysisInput, RuleAnalyzer
+
+        rules = RuleAnalyzer()
+        for containers, lines_per_second in HOSTS:
+            for name, pushdown, suspects in MODES:
+                with serve_in_process(make_busy_loki_app, containers=containers,
+                                      lines_per_second=lines_per_second) as url:
+                    agent.LOKI_URL = f"{url}/loki/api/v1/query_range"
+                    agent.LOKI_INSTANT_URL = f"{url}/loki/api/v1/query"
+                    agent.LOKI_PUSHDOWN = pushdown
+                    start, cpu_start = time.perf_counter(), time.process_time()
+                    container_logs, system_logs, _signature, reducers = asyncio.run(
+                        agent.get_incident_logs(datetime.now(), suspects))
+                    elapsed, cpu = time.perf_counter() - start, time.process_time() - cpu_start
+                    stats = requests.get(f"{url}/stats", timeout=5).json()
+                result = rules.analyze(AnalysisInput("node-0", container_logs, system_logs, reducers=reducers))
+                verdict = f"{result.confidence}% ({result.evidence[0].split(':')[0]})" if result else "none"
+                rows.append((f"{containers} x {lines_per_second / containers:g}/s", name,
+                             stats["query_range"] + stats["query"], f"{stats['lines']:,}",
+                             f"{stats['bytes'] / 1e6:.2f}", f"{elapsed:.2f}", f"{cpu:.2f}", verdict))
+
+    print(f"{agent.LOG_WINDOW_SECONDS}s window; Loki side: requests, lines and MB served")
+    print_table(("host (containers x lines/s)", "fetch", "requests", "lines", "MB", "wall s", "agent cpu s",
+                 "rule match"), rows)
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Benchmark: does a slow Slack webhook slow down remediation?
+
+A storm of INCIDENTS spikes on distinct nodes arrives at ARRIVAL_RATE/s and goes
+through the incident pipeline's remediation stage (a RESTART_SECONDS restart,
+16 workers) and notify stage (2 workers), against a fake webhook that answers
+after 0.05s, 1s or 5s:
+
+    blocking     the old notify stage: requests.post inline, no timeout
+    dispatcher   notify_stage submits to a NotificationDispatcher (coalescing
+                 window COALESCE_SECONDS, scaled down from 60s)
+
+Reported over a RUN_SECONDS window: incidents remediated and dropped (the first
+queue was full), remediation latency from arrival, and the webhook messages sent.
+The last row fails the first two webhook requests to show the retries.
+
+    python detection-agent/benchmarks/bench_notify.py
+"""
+import asyncio
+import logging
+import statistics
+import time
+from datetime import datetime
+
+import requests
+
+import _bench  # noqa: F401  (puts the agent modules on sys.path)
+from _bench import print_table
+from fake_servers import make_webhook_app, serve_in_process
+
+from incident_pipeline import Incident, IncidentPipeline
+from notifier import Notification, NotificationDispatcher, SlackSink
+from scrape_scheduler import ScrapeTarget
+
+INCIDENTS = 120
+ARRIVAL_RATE = 30.0
+RESTART_SECONDS = 0.2
+RUN_SECONDS = 12.0
+COALESCE_SECONDS = 2.0
+WORKERS = {"remediation": 16, "notify": 2}
+SCENARIOS = ((0.05, 0), (1.0, 0), (5.0, 0), (0.05, 2))  # (webhook latency, failed requests first)
+
+
+def legacy_post(webhook_url: str, incident: Incident):
+    """The pre-change send_slack_notification: one blocking POST per incident, no timeout."""
+    payload = {
+        "text": f"?? DevOps AI Agent Incident: Container restarted on {incident.target.name}",
+        "blocks": [{"type": "section", "text": {"type": "mrkdwn", "text": f"*Time:* {datetime.now().isoformat()}"}}],
+    }
+    requests.post(webhook_url, json=payload)
+
+
+async def run_storm(webhook_url: str, mode: str):
+    arrived, remediated = {}, {}
+    dispatcher = NotificationDispatcher([SlackSink(webhook_url, COALESCE_SECONDS)],
+                                        coalesce_seconds=COALESCE_SECONDS, timeout=10.0, backoff_seconds=0.2)
+
+    async def remediation_stage(incident: Incident) -> bool:
+        await asyncio.sleep(RESTART_SECONDS)
+        remediated[incident.target.name] = time.monotonic() - arrived[incident.target.name]
+        incident.status = "SUCCESS"
+        return True
+
+    if mode == "blocking":
+        def notify_stage(incident: Incident) -> bool:
+            legacy_post(webhook_url, incident)
+            return True
+    else:
+        async def notify_stage(incident: Incident) -> bool:
+            dispatcher.submit(Notification(f"Container restarted on {incident.target.name}", "",
+                                           incident.target.name, incident.status, "CPU spike"))
+            return True
+
+    pipeline = IncidentPipeline({"remediation": remediation_stage, "notify": notify_stage}, workers=WORKERS)
+    pipeline.start()
+    dispatcher.start()
+    start = time.monotonic()
+    for n in range(INCIDENTS):
+        await asyncio.sleep(max(0.0, start + n / ARRIVAL_RATE - time.monotonic()))
+        name = f"node-{n}"
+        arrived[name] = time.monotonic()
+        pipeline.submit(Incident(ScrapeTarget(name, "http://unused/metrics", 10), datetime.now(), 95.0))
+    await asyncio.sleep(max(0.0, start + RUN_SECONDS - time.monotonic()))
+    await pipeline.stop()
+    await dispatcher.close()
+    return list(remediated.values()), pipeline.dropped
+
+
+def main():
+    logging.getLogger("agent").setLevel(logging.ERROR)  # queue-full and retry warnings, one per event
+    rows = []
+    for latency, fail_first in SCENARIOS:
+        for mode in ("blocking", "dispatcher"):
+            with serve_in_process(make_webhook_app, latency=latency, fail_first=fail_first) as url:
+                latencies, dropped = asyncio.run(run_storm(f"{url}/hook", mode))
+                stats = requests.get(f"{url}/stats", timeout=5).json()
+            latencies.sort()
+            p95 = latencies[int(len(latencies) * 0.95)] if latencies else 0.0
+            webhook = f"{latency:g}s" + (f", {fail_first} x 500" if fail_first else "")
+            rows.append((webhook, mode, len(latencies), dropped,
+                         f"{statistics.median(latencies):.2f}" if latencies else "-", f"{p95:.2f}",
+                         stats["received"], stats["requests"]))
+
+    print(f"{INCIDENTS} incidents at {ARRIVAL_RATE:g}/s, {RESTART_SECONDS:g}s restarts, {RUN_SECONDS:g}s window")
+    print_table(("webhook", "notify", "remediated", "dropped", "remediate p50 s", "p95 s",
+                 "messages", "requests"), rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""
+Microbenchmark: legacy split/rescan CPU parsing vs the streaming prom_parser.
+
+    python detection-agent/benchmarks/bench_prom_parser.py
+"""
+import _bench  # noqa: F401  (puts the agent modules on sys.path)
+from _bench import best_of, print_table
+from synthetic import node_exporter_payload
+
+from prom_parser import parse_cpu_seconds
+
+SERIES_COUNTS = (1_000, 10_000, 100_000)
+
+
+def legacy_cpu_totals(metrics_data: str):
+    """The pre-parser calculate_cpu_usage scanning: up to three full splits per scrape."""
+    idle = 0.0
+    for line in metrics_data.split('\n'):
+        if line.startswith('node_cpu_seconds_total') and 'mode="idle"' in line:
+            idle += float(line.split()[-1])
+    total = sum(float(line.split()[-1]) for line in metrics_data.split('\n')
+                if line.startswith('node_cpu_seconds_total') and 'mode=' in line)
+    return idle, total
+
+
+def streaming_cpu_totals(metrics_data: str):
+    """Streams the body once (as iter_lines would) and sums the parsed counters."""
+    cpu_seconds = parse_cpu_seconds(iter(metrics_data.splitlines()))
+    idle = sum(v for (_cpu, mode), v in cpu_seconds.items() if mode == "idle")
+    return idle, sum(cpu_seconds.values())
+
+
+def main():
+    rows = []
+    for count in SERIES_COUNTS:
+        payload = node_exporter_payload(count)
+        legacy_idle, legacy_total = legacy_cpu_totals(payload)
+        idle, total = streaming_cpu_totals(payload)
+        assert abs(idle - legacy_idle) < 1e-6 * legacy_idle and abs(total - legacy_total) < 1e-6 * legacy_total
+
+        legacy = best_of(lambda: legacy_cpu_totals(payload))
+        streaming = best_of(lambda: streaming_cpu_totals(payload))
+        rows.append((
+            f"{count:,}", f"{len(payload) / 1e6:.2f}",
+            f"{legacy * 1e3:.2f}", f"{streaming * 1e3:.2f}", f"{legacy / streaming:.1f}x",
+        ))
+    print_table(("series", "payload MB", "legacy ms", "streaming ms", "speedup"), rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Benchmark: analysis time per incident with and without the RCA cache, using a stub
+LLM client with injected latency. Repeat incidents vary slightly (one template
+added or dropped) to exercise the SimHash near-duplicate path.
+
+    python detection-agent/benchmarks/bench_rca_cache.py
+"""
+import os
+import random
+import tempfile
+import time
+
+import _bench  # noqa: F401  (puts the agent modules on sys.path)
+from _bench import print_table
+
+from rca_cache import RcaCache, fingerprint
+
+LLM_LATENCY_SECONDS = 0.5
+INCIDENTS = 30
+MODEL = "stub-model"
+
+BASE_SIGNATURES = {
+    "cpu-loop": [
+        "<*> <*>,<*> - ERROR - [cpu-test-app] **CRITICAL ERROR: Beginning CPU-intensive calculation.** Iterations: <*>",
+        "<*> <*>,<*> - INFO - [cpu-test-app] CPU calculation finished. Duration: <*>",
+        "<*> <*>,<*> - INFO - [cpu-test-app] Health check successful.",
+        "<*> <*>,<*> - WARNING - [worker-<*>] Slow query on table orders took <*>",
+        "<*> <*>,<*> - INFO - <*> - - \"GET /api/v<*>/orders/<*> HTTP/<*>\" <*> <*> <*>",
+        "kernel: [<*>] python3 invoked oom-killer: gfp_mask=<*>, order=<*>, oom_score_adj=<*>",
+    ],
+    "db-stall": [
+        "<*> <*>,<*> - ERROR - [api] psycopg2.OperationalError: could not connect to server: Connection timed out",
+        "<*> <*>,<*> - WARNING - [api] Retrying database connection (attempt <*>)",
+        "<*> <*>,<*> - INFO - [cpu-test-app] Health check successful.",
+        "<*> <*>,<*> - INFO - [api] Connection pool exhausted, waiting for free slot",
+    ],
+}
+NOISE = ["<*> <*>,<*> - DEBUG - cache stats hits=<*> misses=<*> ratio=<*>",
+         "systemd[<*>]: Started Session <*> of user ubuntu."]
+
+
+class StubLlm:
+    """Stand-in for the Gemini client: fixed latency, canned answer."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = 0
+
+    def analyze(self, signature):
+        self.calls += 1
+        time.sleep(self.latency)
+        return "REASON: Stub root cause.\nCONFIDENCE: 90"
+
+
+def incident_stream(rng):
+    for _ in range(INCIDENTS):
+        kind = rng.choice(sorted(BASE_SIGNATURES))
+        signature = list(BASE_SIGNATURES[kind])
+        if rng.random() < 0.3:
+            signature.append(rng.choice(NOISE))  # near-duplicate of an earlier incident
+        yield kind, signature
+
+
+def run(cache):
+    llm = StubLlm(LLM_LATENCY_SECONDS)
+    rng = random.Random(1)
+    per_incident = []
+    for kind, signature in incident_stream(rng):
+        start = time.perf_counter()
+        if cache is None:
+            llm.analyze(signature)
+        else:
+            key, sim = fingerprint("node-1", MODEL, signature)
+            if cache.get(key, sim, "node-1", MODEL) is None:
+                cache.put(key, sim, "node-1", MODEL, llm.analyze(signature))
+        per_incident.append(time.perf_counter() - start)
+    return llm.calls, per_incident
+
+
+def main():
+    rows = []
+    calls, times = run(None)
+    rows.append(("no cache", calls, f"{sum(times):.2f}", f"{sorted(times)[len(times) // 2] * 1e3:.2f}", "-"))
+    for near_bits in (None, 3):
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = RcaCache(os.path.join(tmp, "rca.sqlite3"), near_duplicate_bits=near_bits)
+            calls, times = run(cache)
+            stats = cache.stats()
+            cache.close()
+        label = "exact only" if near_bits is None else f"exact + simhash<={near_bits}"
+        rows.append((label, calls, f"{sum(times):.2f}", f"{sorted(times)[len(times) // 2] * 1e3:.2f}",
+                     f"{stats['hits']}/{stats['near_hits']}/{stats['misses']} ({stats['avg_lookup_ms']:.2f}ms)"))
+    print(f"{INCIDENTS} incidents, stub LLM latency {LLM_LATENCY_SECONDS}s")
+    print_table(("mode", "LLM calls", "total s", "median ms", "hit/near/miss (avg lookup)"), rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Benchmark: remediation throughput and guard behaviour against a fake Docker daemon.
+
+A burst of incidents across the fleet is remediated the old way (2 pipeline
+workers, each blocking on a forked CLI per restart; `curl --unix-socket` stands in
+for `docker restart`, which is the same fork + HTTP call to the socket) and through
+RemediationExecutor (pooled Docker API connections, parallel within its caps).
+Also: per-call overhead of a fork vs the pooled API, duplicate incidents for one
+container, cooldown suppression, and that dry-run never reaches the daemon.
+
+    python detection-agent/benchmarks/bench_remediation.py
+"""
+import asyncio
+import os
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import aiohttp
+
+import _bench  # noqa: F401  (puts the agent modules on sys.path)
+from _bench import print_table
+from fake_servers import make_docker_app, serve_unix_in_process
+
+from remediation import RemediationExecutor, RemediationRequest
+
+BURST = 50  # incidents on distinct hosts, arriving at once
+RESTART_SECONDS = 0.5  # daemon-side stop/start time per restart
+LEGACY_WORKERS = 2
+OVERHEAD_CALLS = 200
+DUPLICATES = 20
+
+
+def daemon_stats(endpoint: str) -> dict:
+    async def fetch():
+        async with aiohttp.ClientSession(connector=aiohttp.UnixConnector(path=endpoint[len("unix://"):])) as session:
+            async with session.get("http://docker/stats") as response:
+                return await response.json()
+    return asyncio.run(fetch())
+
+
+def cli_restart(endpoint: str, container: str) -> bool:
+    path = endpoint[len("unix://"):]
+    result = subprocess.run(["curl", "-sf", "-X", "POST", "--unix-socket", path,
+                             f"http://docker/containers/{container}/restart?t=10"], capture_output=True)
+    return result.returncode == 0
+
+
+def legacy_burst(endpoint: str, requests) -> float:
+    start = time.perf_counter()
+    with ThreadPoolExecutor(LEGACY_WORKERS) as pool:
+        list(pool.map(lambda request: cli_restart(endpoint, request.resource), requests))
+    return time.perf_counter() - start
+
+
+def executor_burst(endpoint: str, requests, **kwargs) -> float:
+    async def run():
+        executor = RemediationExecutor(endpoint, rate_limit=len(requests), **kwargs)
+        start = time.perf_counter()
+        outcomes = await executor.execute_many(requests)
+        elapsed = time.perf_counter() - start
+        await executor.close()
+        assert all(outcome.status == "SUCCESS" for outcome in outcomes), outcomes
+        return elapsed
+    return asyncio.run(run())
+
+
+def per_call_overhead(endpoint: str):
+    """Sequential restarts against a zero-delay daemon: pure client-side cost per call."""
+    start = time.perf_counter()
+    for i in range(OVERHEAD_CALLS):
+        cli_restart(endpoint, f"app-{i}")
+    fork = (time.perf_counter() - start) / OVERHEAD_CALLS
+
+    async def run():
+        executor = RemediationExecutor(endpoint, cooldown_seconds=0, rate_limit=OVERHEAD_CALLS + 1)
+        await executor.execute(RemediationRequest("warmup", "app-warmup", "docker restart"))
+        start = time.perf_counter()
+        for i in range(OVERHEAD_CALLS):
+            await executor.execute(RemediationRequest(f"host-{i}", f"app-{i}", "docker restart"))
+        elapsed = time.perf_counter() - start
+        await executor.close()
+        return elapsed / OVERHEAD_CALLS
+    return fork, asyncio.run(run())
+
+
+def guards(endpoint: str):
+    """Duplicate burst, cooldown and dry-run: (outcome counts, daemon restarts) per scenario."""
+    same = [RemediationRequest("web-1", "api", "docker restart") for _ in range(DUPLICATES)]
+    fleet = [RemediationRequest(f"host-{i}", f"app-{i}", "docker restart") for i in range(BURST)]
+
+    async def duplicates():
+        executor = RemediationExecutor(endpoint)
+        outcomes = await executor.execute_many(same)
+        # ...and the same spike re-detected after the restart finished
+        outcomes.append(await executor.execute(same[0]))
+        await executor.close()
+        return outcomes
+
+    async def dry_run():
+        executor = RemediationExecutor(endpoint, dry_run=True)
+        first = await executor.execute_many(fleet)
+        second = await executor.execute_many(fleet)
+        await executor.close()
+        return first, second
+
+    rows = []
+    before = daemon_stats(endpoint)["restarts"]
+    outcomes = asyncio.run(duplicates())
+    after = daemon_stats(endpoint)["restarts"]
+    joined = sum(outcome.joined for outcome in outcomes)
+    cooled = sum(outcome.reason == "cooldown" for outcome in outcomes)
+    rows.append((f"{DUPLICATES} concurrent + 1 later, one container", after - before,
+                 f"{joined} joined the restart in flight, {cooled} cooldown"))
+
+    before = after
+    first, second = asyncio.run(dry_run())
+    after = daemon_stats(endpoint)["restarts"]
+    would = sum(outcome.status == "DRY_RUN" for outcome in first)
+    same_answer = [(o.status, o.reason) for o in first] == [(o.status, o.reason) for o in second]
+    rows.append((f"dry run, {BURST} hosts, twice", after - before,
+                 f"{would} would restart; second run identical: {same_answer}"))
+    return rows
+
+
+def main():
+    requests = [RemediationRequest(f"host-{i}", f"app-{i}", "docker restart") for i in range(BURST)]
+    socket_dir = tempfile.mkdtemp(prefix="fake-docker-")
+    with serve_unix_in_process(make_docker_app, os.path.join(socket_dir, "slow.sock"),
+                               restart_delay=RESTART_SECONDS) as endpoint:
+        legacy = legacy_burst(endpoint, requests)
+        capped = executor_burst(endpoint, requests, max_concurrent=8)
+        wide = executor_burst(endpoint, requests, max_concurrent=32)
+        peak = daemon_stats(endpoint)["max_in_progress"]
+        guard_rows = guards(endpoint)
+
+    with serve_unix_in_process(make_docker_app, os.path.join(socket_dir, "fast.sock"), restart_delay=0.0) as endpoint:
+        fork, pooled = per_call_overhead(endpoint)
+    os.rmdir(socket_dir)
+
+    print(f"{BURST} incidents on distinct hosts at once, {RESTART_SECONDS}s per restart in the daemon")
+    print_table(("remediation", "burst s", "note"), [
+        (f"legacy: {LEGACY_WORKERS} workers, forked CLI each", f"{legacy:.2f}", ""),
+        ("executor, max_concurrent=8", f"{capped:.2f}", f"{legacy / capped:.1f}x faster"),
+        ("executor, max_concurrent=32", f"{wide:.2f}", f"{legacy / wide:.1f}x faster (daemon peak {peak} at once)"),
+    ])
+    print()
+    print_table(("client cost per restart", "ms"), [
+        ("fork + exec CLI", f"{fork * 1e3:.2f}"),
+        ("pooled Docker API", f"{pooled * 1e3:.2f}"),
+    ])
+    print()
+    print_table(("guard scenario", "daemon restarts", "outcomes"), guard_rows)
+
+
+if __name__ == "__main__":
+    main()
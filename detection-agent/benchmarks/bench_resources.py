@@ -0,0 +1,101 @@
+"""
+Benchmark: per-scrape processing cost of the resource detectors on a large Node
+Exporter payload: 100k series, with every node_memory_* gauge, per-disk I/O time,
+and error and drop counters for 100 to 10,000 network interfaces (a busy
+Kubernetes node has one veth per pod). The error counters are the only resource
+series that scale with the host, so the rows vary their number:
+
+    cpu only      one pass keeping node_cpu_seconds_total, the CPU rate engine and
+                  the CPU detector (the agent without resource detection)
+    + resources   the same pass also keeping the memory, disk, network and load
+                  families, the ResourceRateEngine and the four resource detectors
+
+Both readings come from the one parse; no request is added. Each scrape is fed to
+the parser in 64 KB chunks, as the scheduler receives it, over a sequence of
+scrapes 10s apart. Reported: ms per scrape (best of 5) and the readings of the last
+one. Exits non-zero when "+ resources" is over SCRAPE_BUDGET_MS in any row, so it
+can guard the budget in CI.
+
+    python detection-agent/benchmarks/bench_resources.py
+"""
+import sys
+
+import _bench  # noqa: F401  (puts the agent modules on sys.path)
+from _bench import best_of, print_table
+from synthetic import node_exporter_payload
+
+from cpu_rate import CpuRateEngine
+from detectors import DetectorConfig, SpikeDetector, metric_value
+from prom_parser import CPU_SECONDS_FAMILY, FamilyParser, group_by_labels
+from resource_rates import ALL_RESOURCE_FAMILIES, RESOURCES, ResourceRateEngine
+from scrape_scheduler import READ_CHUNK_BYTES
+
+SERIES = 100_000
+INTERFACES = (100, 1_000, 10_000)
+SCRAPES = 6
+INTERVAL = 10.0
+SCRAPE_BUDGET_MS = 120.0  # all detectors on a 100k-series scrape: ~80 such targets per core at a 10s interval
+CPU_DETECTOR = DetectorConfig(threshold=75, sustain_seconds=10, clear_below=60, clear_seconds=20, ewma_alpha=0.05)
+# As detection_agent.RESOURCE_DETECTOR_DEFAULTS
+RESOURCE_DETECTORS = {
+    "memory": DetectorConfig(threshold=90, sustain_seconds=30, clear_below=85, clear_seconds=30),
+    "disk": DetectorConfig(threshold=90, sustain_seconds=30, clear_below=70, clear_seconds=30),
+    "network": DetectorConfig(threshold=10, sustain_seconds=20, clear_below=1, clear_seconds=30),
+    "load": DetectorConfig(threshold=2.0, sustain_seconds=60, clear_below=1.5, clear_seconds=30),
+}
+
+
+def chunked(body: bytes):
+    return [body[start:start + READ_CHUNK_BYTES] for start in range(0, len(body), READ_CHUNK_BYTES)]
+
+
+def run(scrapes, resources: bool):
+    """Processes the scrapes in turn with fresh engines; returns the last resource readings."""
+    families = (CPU_SECONDS_FAMILY,) + (ALL_RESOURCE_FAMILIES if resources else ())
+    cpu = CpuRateEngine()
+    cpu_detector = SpikeDetector(CPU_DETECTOR)
+    engine = ResourceRateEngine()
+    detectors = {resource: SpikeDetector(RESOURCE_DETECTORS[resource]) for resource in RESOURCES}
+    readings = None
+    for n, chunks in enumerate(scrapes):
+        timestamp = n * INTERVAL
+        parser = FamilyParser(families)
+        for chunk in chunks:
+            parser.feed(chunk)
+        parsed = parser.close()
+        snapshot = cpu.update(group_by_labels(parsed[CPU_SECONDS_FAMILY], "cpu", "mode"))
+        if snapshot is not None:
+            cpu_detector.update(timestamp, metric_value(snapshot, CPU_DETECTOR.metric))
+        if resources:
+            readings = engine.update(parsed, timestamp, cpu.num_cpus)
+            for resource, detector in detectors.items():
+                value = readings.value(resource)
+                if value is not None:
+                    detector.update(timestamp, value)
+    return readings
+
+
+def main():
+    rows = []
+    worst = 0.0
+    for interfaces in INTERFACES:
+        scrapes = [chunked(node_exporter_payload(SERIES, resources=True, interfaces=interfaces,
+                                                 elapsed=n * INTERVAL).encode())
+                   for n in range(SCRAPES)]
+        readings = run(scrapes, resources=True)
+        cpu_only = best_of(lambda: run(scrapes, resources=False)) / SCRAPES
+        everything = best_of(lambda: run(scrapes, resources=True)) / SCRAPES
+        worst = max(worst, everything)
+        rows.append((f"{interfaces:,}", f"{sum(len(chunk) for chunk in scrapes[0]) / 1e6:.1f}",
+                     f"{cpu_only * 1e3:.2f}", f"{everything * 1e3:.2f}", f"{(everything / cpu_only - 1) * 100:+.0f}%"))
+    print(f"{SERIES:,} series per scrape, {SCRAPES} scrapes {INTERVAL:g}s apart")
+    print_table(("interfaces", "payload MB", "cpu only ms", "+ resources ms", "added"), rows)
+    print(f"last readings: {readings.breakdown()}")
+    print(f"{'OK' if worst * 1e3 <= SCRAPE_BUDGET_MS else 'OVER BUDGET'}: "
+          f"slowest {worst * 1e3:.2f} ms/scrape vs budget {SCRAPE_BUDGET_MS:g} ms")
+    if worst * 1e3 > SCRAPE_BUDGET_MS:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Benchmark: exporter load and dashboard-side CPU with 1 vs 50 open dashboard sessions.
+
+  per-session scrape - every session scrapes Node Exporter and runs its own rate
+                       engine once a second (the old get_cpu_percentage)
+  shared channel     - the agent scrapes once a second and publishes the sample;
+                       every session reads /samples from the agent
+
+Dashboard CPU is the process CPU time spent by the simulated sessions' data
+fetching (Streamlit rendering is the same in both modes and not included).
+
+    python detection-agent/benchmarks/bench_sample_channel.py
+"""
+import asyncio
+import multiprocessing
+import threading
+import time
+
+import requests
+
+import _bench  # noqa: F401  (puts the agent modules on sys.path)
+from _bench import print_table
+from fake_servers import free_port, make_exporter_app, serve_in_process
+
+from cpu_rate import CpuRateEngine
+from prom_parser import fetch_cpu_seconds
+from sample_channel import SampleChannel, fetch_samples, make_app, start_server
+from scrape_scheduler import ScrapeScheduler, ScrapeTarget
+
+SESSIONS = (1, 50)
+RUN_SECONDS = 10.0
+REFRESH_SECONDS = 1.0
+NUM_CPUS = 16
+
+
+def _agent_side(exporter_url: str, port: int, seconds: float):
+    """Scheduler + sample channel, as run by the agent (separate process)."""
+    async def main():
+        channel = SampleChannel()
+
+        async def on_sample(state, snapshot):
+            if snapshot is not None:
+                channel.publish(state.target.name, snapshot)
+
+        runner = await start_server(make_app(channel), "127.0.0.1", port)
+        stop = asyncio.Event()
+        asyncio.get_running_loop().call_later(seconds, stop.set)
+        scheduler = ScrapeScheduler([ScrapeTarget("localhost", exporter_url, REFRESH_SECONDS)], on_sample, jitter=0.0)
+        await scheduler.run(stop)
+        await runner.cleanup()
+
+    asyncio.run(main())
+
+
+def run_sessions(sessions: int, refresh) -> float:
+    """Runs `sessions` threads calling refresh(http) every REFRESH_SECONDS; returns CPU seconds used."""
+    stop = threading.Event()
+
+    def session_loop():
+        http = requests.Session()
+        state = {}
+        next_tick = time.monotonic()
+        while not stop.is_set():
+            try:
+                refresh(http, state)
+            except requests.RequestException:
+                pass
+            next_tick += REFRESH_SECONDS
+            stop.wait(max(0.0, next_tick - time.monotonic()))
+
+    threads = [threading.Thread(target=session_loop) for _ in range(sessions)]
+    cpu_start = time.process_time()
+    for thread in threads:
+        thread.start()
+    time.sleep(RUN_SECONDS)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return time.process_time() - cpu_start
+
+
+def exporter_requests(base_url: str) -> int:
+    return requests.get(f"{base_url}/stats", timeout=2).json()["requests"]
+
+
+def main():
+    rows = []
+    with serve_in_process(make_exporter_app, num_cpus=NUM_CPUS, filler_series=1500) as base_url:
+        exporter_url = f"{base_url}/targets/0/metrics"
+
+        def scrape_directly(http, state):
+            engine = state.setdefault("engine", CpuRateEngine())
+            engine.update(fetch_cpu_seconds(exporter_url, timeout=0.5))
+
+        for sessions in SESSIONS:
+            before = exporter_requests(base_url)
+            cpu = run_sessions(sessions, scrape_directly)
+            requests_made = exporter_requests(base_url) - before
+            rows.append(("per-session scrape", sessions, f"{requests_made / RUN_SECONDS:.1f}",
+                         f"{cpu / RUN_SECONDS * 100:.1f}%"))
+
+        for sessions in SESSIONS:
+            port = free_port()
+            agent = multiprocessing.Process(target=_agent_side, args=(exporter_url, port, RUN_SECONDS + 3), daemon=True)
+            agent.start()
+            time.sleep(1.5)  # agent up and primed
+            samples_url = f"http://127.0.0.1:{port}/samples"
+
+            def read_channel(http, state):
+                fetch_samples(samples_url, "localhost", session=http)
+
+            before = exporter_requests(base_url)
+            cpu = run_sessions(sessions, read_channel)
+            requests_made = exporter_requests(base_url) - before
+            agent.join(5)
+            rows.append(("shared channel", sessions, f"{requests_made / RUN_SECONDS:.1f}",
+                         f"{cpu / RUN_SECONDS * 100:.1f}%"))
+
+    print(f"{NUM_CPUS}-core exporter, sessions refresh every {REFRESH_SECONDS}s, {RUN_SECONDS}s per run")
+    print_table(("mode", "sessions", "exporter req/s", "dashboard CPU"), rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Benchmark: ScrapeScheduler throughput and scheduling drift against a local fake exporter.
+
+10% of the targets answer after a 2s delay, to show that slow exporters do not
+delay the rest of the fleet.
+
+    python detection-agent/benchmarks/bench_scrape_scheduler.py
+"""
+import asyncio
+import statistics
+
+import _bench  # noqa: F401  (puts the agent modules on sys.path)
+from _bench import print_table
+from fake_servers import make_exporter_app, serve_in_process
+
+from scrape_scheduler import ScrapeScheduler, ScrapeTarget
+
+FLEET_SIZES = (10, 100, 1000)
+INTERVAL_SECONDS = 1.0
+RUN_SECONDS = 8.0
+SLOW_FRACTION = 0.1
+SLOW_DELAY_SECONDS = 2.0
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))] if ordered else 0.0
+
+
+async def run_fleet(base_url: str, size: int):
+    targets = []
+    for i in range(size):
+        path = "slow" if i < size * SLOW_FRACTION else "targets"
+        targets.append(ScrapeTarget(name=f"node-{i}", url=f"{base_url}/{path}/{i}/metrics", interval=INTERVAL_SECONDS))
+
+    async def on_sample(state, snapshot):
+        pass
+
+    scheduler = ScrapeScheduler(targets, on_sample, max_concurrency=256, timeout=5.0, jitter=0.1)
+    stop = asyncio.Event()
+    asyncio.get_running_loop().call_later(RUN_SECONDS, stop.set)
+    await scheduler.run(stop)
+    return scheduler
+
+
+def main():
+    rows = []
+    with serve_in_process(make_exporter_app, num_cpus=8, filler_series=500, slow_delay=SLOW_DELAY_SECONDS) as base_url:
+        for size in FLEET_SIZES:
+            scheduler = asyncio.run(run_fleet(base_url, size))
+            drift = list(scheduler.drift_seconds)
+            rows.append((
+                size,
+                scheduler.scrape_count,
+                f"{scheduler.scrape_count / RUN_SECONDS:.0f}",
+                scheduler.error_count,
+                f"{statistics.median(drift) * 1e3:.1f}",
+                f"{percentile(drift, 0.99) * 1e3:.1f}",
+                f"{max(drift) * 1e3:.1f}",
+            ))
+    print(f"interval={INTERVAL_SECONDS}s, run={RUN_SECONDS}s, {SLOW_FRACTION:.0%} of targets respond after {SLOW_DELAY_SECONDS}s")
+    print_table(("targets", "scrapes", "scrapes/s", "errors", "drift p50 ms", "drift p99 ms", "drift max ms"), rows)
+
+
+if __name__ == "__main__":
+    main()
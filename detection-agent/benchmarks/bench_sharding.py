@@ -0,0 +1,204 @@
+"""
+Benchmark: sharded agent throughput against local fake Node Exporter servers, and
+how fast the shards recover when a worker dies.
+
+Scaling: a fleet of TARGETS targets on a 1s interval (more than one core can
+scrape) is split by ShardCoordinator over 1, 2, 4, ... worker processes (up to the
+host's cores), each running a ScrapeScheduler and a SpikeDetector per target, as
+the agent's shard workers do. The exporters serve NUM_CPUS cores (the CPU family
+every scrape parses and rates) and run in SERVERS processes of their own. Reported
+per worker count: scrapes handled per second over RUN_SECONDS once the shards
+have settled, speedup over one worker, efficiency (speedup / workers) and the CPU
+the workers used (cores busy). Scaling stops at the number of cores the host has
+left after the exporters.
+
+Failover: 3 workers on a fleet they can scrape comfortably; the leader is killed
+(SIGKILL: its lease has to expire) or stopped (SIGTERM: it gives the lease back).
+Reported: seconds until every one of its targets has been scraped again by the
+others, and until another worker serves the aggregate view.
+
+    python detection-agent/benchmarks/bench_sharding.py
+"""
+import asyncio
+import multiprocessing
+import os
+import signal
+import sqlite3
+import statistics
+import tempfile
+import time
+from contextlib import ExitStack
+
+import requests
+
+import _bench  # noqa: F401  (puts the agent modules on sys.path)
+from _bench import print_table
+from fake_servers import free_port, make_exporter_app, serve_in_process
+
+from detectors import DetectorConfig, SpikeDetector, metric_value
+from scrape_scheduler import ScrapeScheduler, ScrapeTarget
+from sharding import ShardCoordinator, ShardMembership, assign_targets
+
+TARGETS = 2_000
+INTERVAL = 1.0
+NUM_CPUS = 64
+FILLER_SERIES = 1_000
+SERVERS = max(1, (os.cpu_count() or 1) // 4)
+WORKER_COUNTS = [n for n in (1, 2, 4, 8, 16, 32) if n <= max(2, os.cpu_count() or 1)]
+RUN_SECONDS = 5.0
+FAILOVER_TARGETS = 150
+HEARTBEAT_SECONDS = 2  # detection_agent.SHARD_HEARTBEAT_SECONDS
+LEASE_SECONDS = 10  # detection_agent.SHARD_LEASE_SECONDS
+SETTLE_SECONDS = 2 * HEARTBEAT_SECONDS + 2 * INTERVAL  # join, first share, first scrapes spread over an interval
+DETECTOR = DetectorConfig(threshold=75, sustain_seconds=10, clear_below=60, clear_seconds=20, ewma_alpha=0.05)
+
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+async def _work(worker: str, lease_file: str, targets, aggregate_port: int, measure, results):
+    detectors = {target.name: SpikeDetector(DETECTOR) for target in targets}
+
+    async def on_sample(state, snapshot):
+        if snapshot is not None:
+            detectors[state.target.name].update(time.time(), metric_value(snapshot, DETECTOR.metric))
+
+    scheduler = ScrapeScheduler([], on_sample, max_concurrency=64, timeout=5.0, jitter=0.1)
+    membership = ShardMembership(lease_file, worker, LEASE_SECONDS)
+    coordinator = ShardCoordinator(membership, targets, scheduler.set_targets, "", "127.0.0.1", aggregate_port,
+                                   HEARTBEAT_SECONDS)
+    stop = asyncio.Event()
+    tasks = [asyncio.create_task(scheduler.run(stop)), asyncio.create_task(coordinator.run(stop))]
+    try:
+        if measure is None:
+            await asyncio.gather(*tasks)
+            return
+        start, end = measure
+        await asyncio.sleep(max(0.0, start - time.time()))
+        scrapes, cpu = scheduler.scrape_count, time.process_time()
+        await asyncio.sleep(max(0.0, end - time.time()))
+        drift = list(scheduler.drift_seconds)[-len(scheduler.states):]
+        results.put((scheduler.scrape_count - scrapes, time.process_time() - cpu, len(scheduler.states),
+                     statistics.median(drift) if drift else 0.0))
+    finally:
+        stop.set()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        membership.close()
+
+
+def worker_main(worker: str, lease_file: str, targets, aggregate_port: int, measure=None, results=None):
+    """A shard worker process: scrapes its share until `measure` (start, end) is over, or until SIGTERM."""
+    signal.signal(signal.SIGTERM, _interrupt)
+    try:
+        asyncio.run(_work(worker, lease_file, targets, aggregate_port, measure, results))
+    except KeyboardInterrupt:
+        pass
+
+
+def fleet(base_urls, size: int):
+    return [ScrapeTarget(name=f"node-{i}", url=f"{base_urls[i % len(base_urls)]}/targets/{i}/metrics",
+                         interval=INTERVAL) for i in range(size)]
+
+
+def run_scaling(base_urls, workers: int):
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    targets = fleet(base_urls, TARGETS)
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.time() + 2.0 + SETTLE_SECONDS  # + process start
+        measure = (start, start + RUN_SECONDS)
+        processes = [context.Process(target=worker_main, args=(f"w{n}", os.path.join(tmp, "shards.sqlite3"), targets,
+                                                                free_port(), measure, results))
+                     for n in range(workers)]
+        for process in processes:
+            process.start()
+        rows = [results.get(timeout=60 + SETTLE_SECONDS + RUN_SECONDS) for _ in processes]
+        for process in processes:
+            process.join(10)
+    scrapes = sum(row[0] for row in rows)
+    cpu = sum(row[1] for row in rows)
+    shares = sorted(row[2] for row in rows)
+    return scrapes / RUN_SECONDS, cpu / RUN_SECONDS, shares, max(row[3] for row in rows)
+
+
+def _seconds(value) -> str:
+    return f"{value:.1f}" if value is not None else "not in 3 leases"
+
+
+def last_requests(base_urls):
+    last = {}
+    for url in base_urls:
+        last.update(requests.get(f"{url}/stats", timeout=5).json()["last_request"])
+    return {int(n): t for n, t in last.items()}
+
+
+def run_failover(base_urls, how: str):
+    """Seconds until the leader's targets are scraped again, and until the aggregate view is back."""
+    context = multiprocessing.get_context("spawn")
+    targets = fleet(base_urls, FAILOVER_TARGETS)
+    port = free_port()
+    workers = [f"w{n}" for n in range(3)]
+    with tempfile.TemporaryDirectory() as tmp:
+        lease_file = os.path.join(tmp, "shards.sqlite3")
+        processes = {worker: context.Process(target=worker_main, args=(worker, lease_file, targets, port))
+                     for worker in workers}
+        for process in processes.values():
+            process.start()
+        try:
+            time.sleep(2.0 + SETTLE_SECONDS)
+            with sqlite3.connect(lease_file) as db:
+                leader = db.execute("SELECT worker FROM leader").fetchone()[0]
+            orphaned = [int(target.name.split("-")[1]) for target in assign_targets(targets, workers)[leader]]
+            killed = time.time()
+            os.kill(processes[leader].pid, signal.SIGKILL if how == "killed" else signal.SIGTERM)
+            recovered = served = None
+            while time.time() - killed < 3 * LEASE_SECONDS and (recovered is None or served is None):
+                time.sleep(0.1)
+                if recovered is None:
+                    last = last_requests(base_urls)
+                    if all(last.get(n, 0) > killed for n in orphaned):
+                        recovered = time.time() - killed
+                if served is None:
+                    try:
+                        view = requests.get(f"http://127.0.0.1:{port}/shards", timeout=0.5).json()
+                        if view["leader"] not in (None, leader):
+                            served = time.time() - killed
+                    except (requests.RequestException, ValueError):
+                        pass
+        finally:
+            for process in processes.values():
+                if process.is_alive():
+                    process.terminate()
+            for process in processes.values():
+                process.join(10)
+    return how, len(orphaned), _seconds(recovered), _seconds(served)
+
+
+def main():
+    with ExitStack() as stack:
+        base_urls = [stack.enter_context(serve_in_process(make_exporter_app, num_cpus=NUM_CPUS,
+                                                          filler_series=FILLER_SERIES))
+                     for _ in range(SERVERS)]
+        rows = []
+        baseline = None
+        for workers in WORKER_COUNTS:
+            throughput, cores, shares, drift = run_scaling(base_urls, workers)
+            baseline = baseline or throughput
+            speedup = throughput / baseline
+            rows.append((workers, f"{shares[0]}-{shares[-1]}", f"{throughput:.0f}", f"{speedup:.2f}x",
+                         f"{speedup / workers:.0%}", f"{cores:.2f}", f"{drift:.2f}"))
+        print(f"{TARGETS:,} targets every {INTERVAL:g}s ({TARGETS / INTERVAL:,.0f} scrapes/s wanted), {NUM_CPUS} cores "
+              f"per exporter, {SERVERS} exporter process(es), {os.cpu_count()} core(s) on this host")
+        print_table(("workers", "targets per worker", "scrapes/s", "speedup", "efficiency", "cores busy",
+                     "worst median lag s"), rows)
+
+        print()
+        print(f"failover: 3 workers, {FAILOVER_TARGETS} targets every {INTERVAL:g}s, heartbeat {HEARTBEAT_SECONDS}s, "
+              f"lease {LEASE_SECONDS}s; the leader goes away")
+        print_table(("leader", "its targets", "all scraped again after s", "aggregate view back after s"),
+                    [run_failover(base_urls, how) for how in ("stopped", "killed")])
+
+
+if __name__ == "__main__":
+    main()
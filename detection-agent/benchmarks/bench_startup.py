@@ -0,0 +1,137 @@
+"""
+Benchmark: agent cold start against a budget.
+
+Starts `python detection_agent.py` against a fake Node Exporter (one target; a
+fresh exporter and working directory every run) and measures the time from process spawn to
+the first scrape reaching the exporter, with a Gemini key set and in degraded
+mode (no key). Then breaks the import of detection_agent down the way
+`python -X importtime` reports it, and shows what is no longer paid at startup
+(the GenAI SDK, loaded at the first LLM call or by the warm-up; pandas, loaded
+by the dashboard's first chart).
+
+Exits with status 1 when the median time to first scrape is over
+FIRST_SCRAPE_BUDGET_SECONDS, so it can guard startup in CI.
+
+    python detection-agent/benchmarks/bench_startup.py
+"""
+import json
+import os
+import shutil
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+import _bench  # noqa: F401  (puts the agent modules on sys.path)
+from _bench import AGENT_DIR, print_table
+from fake_servers import free_port, make_exporter_app, serve_in_process
+
+FIRST_SCRAPE_BUDGET_SECONDS = 0.75
+RUNS = 5
+TOP_IMPORTS = 8
+SCENARIOS = (("gemini key set", {"GEMINI_API_KEY": "bench"}), ("degraded (no key)", {}))
+
+
+def agent_env(extra: dict) -> dict:
+    env = {key: value for key, value in os.environ.items() if key not in ("GEMINI_API_KEY", "GOOGLE_API_KEY")}
+    env.update(extra)
+    env.update({"AGENT_TIMESERIES_DIR": "", "AGENT_TARGETS_FILE": "targets.json", "PYTHONDONTWRITEBYTECODE": "1",
+                "SLACK_WEBHOOK_URL": "", "AGENT_NOTIFY_WEBHOOK_URL": ""})
+    return env
+
+
+def time_to_first_scrape(extra_env: dict) -> float:
+    """Seconds from spawning the agent to the exporter seeing its first scrape."""
+    with serve_in_process(make_exporter_app) as url:
+        return _time_to_first_scrape(url, extra_env)
+
+
+def _time_to_first_scrape(url: str, extra_env: dict) -> float:
+    workdir = tempfile.mkdtemp(prefix="bench-startup-")
+    with open(os.path.join(workdir, "targets.json"), "w") as f:
+        json.dump([{"name": "node-0", "url": f"{url}/targets/0/metrics"}], f)
+    env = agent_env({**extra_env, "AGENT_SAMPLES_PORT": str(free_port())})
+
+    start = time.time()
+    agent = subprocess.Popen([sys.executable, os.path.join(AGENT_DIR, "detection_agent.py")], cwd=workdir, env=env,
+                             stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            first_request = requests.get(f"{url}/stats", timeout=5).json()["first_request"]
+            if first_request is not None:
+                return first_request - start
+            if agent.poll() is not None:
+                raise RuntimeError(f"agent exited with status {agent.returncode} before scraping")
+            time.sleep(0.05)  # the exporter timestamps the scrape; polling slower leaves the CPU to the agent
+    finally:
+        agent.send_signal(signal.SIGINT)
+        try:
+            agent.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            agent.kill()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def import_times(statement: str, extra_env: dict):
+    """(self, cumulative) microseconds per module from `python -X importtime -c statement`."""
+    workdir = tempfile.mkdtemp(prefix="bench-startup-")
+    env = agent_env(extra_env)
+    env["PYTHONPATH"] = AGENT_DIR
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", statement], cwd=workdir, env=env,
+                            capture_output=True, text=True)
+    shutil.rmtree(workdir, ignore_errors=True)
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules.append((name[1:].rstrip(), int(self_us), int(cumulative_us)))  # "| name", indented per level
+    return modules, result.returncode == 0
+
+
+def main():
+    rows = []
+    medians = {}
+    for name, extra_env in SCENARIOS:
+        times = [time_to_first_scrape(extra_env) for _ in range(RUNS)]
+        medians[name] = statistics.median(times)
+        rows.append((name, f"{medians[name]:.3f}", f"{min(times):.3f}", f"{max(times):.3f}"))
+    print(f"time to first scrape, {RUNS} runs (budget {FIRST_SCRAPE_BUDGET_SECONDS:g}s)")
+    print_table(("scenario", "median s", "min s", "max s"), rows)
+
+    modules, _ = import_times("import detection_agent", {"GEMINI_API_KEY": "bench"})
+    # A module's imports are listed before it; its direct ones are indented one level (2 spaces)
+    end = next(i for i, (name, _self, _cumulative) in enumerate(modules) if name == "detection_agent")
+    start = max((i for i, (name, _self, _cumulative) in enumerate(modules[:end]) if not name.startswith(" ")),
+                default=-1) + 1
+    total = modules[end][2]
+    direct = [(name.strip(), cumulative) for name, _self, cumulative in modules[start:end]
+              if name.startswith("  ") and not name.startswith("   ")]
+    print()
+    print(f"import detection_agent: {total / 1e3:.0f} ms; heaviest direct imports (cumulative):")
+    print_table(("module", "ms"), [(name, f"{us / 1e3:.0f}") for name, us in
+                                   sorted(direct, key=lambda item: -item[1])[:TOP_IMPORTS]])
+
+    deferred = []
+    for module, where in (("google.genai", "first LLM call / warm-up"), ("pandas", "dashboard's first chart")):
+        modules, ok = import_times(f"import {module}", {})
+        cumulative = next((c for name, _self, c in modules if name.strip() == module), 0) if ok else 0
+        deferred.append((module, f"{cumulative / 1e3:.0f}" if ok else "not installed", where))
+    print()
+    print("no longer imported at startup:")
+    print_table(("module", "ms", "loaded at"), deferred)
+
+    worst = max(medians.values())
+    print()
+    print(f"{'OK' if worst <= FIRST_SCRAPE_BUDGET_SECONDS else 'OVER BUDGET'}: "
+          f"slowest median {worst:.3f}s vs budget {FIRST_SCRAPE_BUDGET_SECONDS:g}s")
+    if worst > FIRST_SCRAPE_BUDGET_SECONDS:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Benchmark: TimeSeriesStore append cost, window query latency and memory, against
+the old Python-list chart buffer (append + pop(0)).
+
+    python detection-agent/benchmarks/bench_timeseries.py
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+import _bench  # noqa: F401  (puts the agent modules on sys.path)
+from _bench import best_of, print_table
+
+from timeseries import DEFAULT_TIERS, POINT_DTYPE, TimeSeriesStore
+
+SAMPLE_INTERVAL = 1.0       # seconds between samples (worst case: 1s scrapes)
+HISTORY_SECONDS = 3 * 86400  # fill three days so every tier has wrapped
+WINDOWS = (("10 min", 600), ("1 h", 3600), ("24 h", 86400))
+
+
+def fill(store: TimeSeriesStore, now: float) -> float:
+    rng = random.Random(0)
+    n = int(HISTORY_SECONDS / SAMPLE_INTERVAL)
+    start = time.perf_counter()
+    for i in range(n):
+        store.append("node-1/cpu_total", now - HISTORY_SECONDS + i * SAMPLE_INTERVAL, 20 + rng.random() * 60)
+    return (time.perf_counter() - start) / n
+
+
+def main():
+    now = time.time()
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, path in (("memory", None), ("mmap", os.path.join(tmp, "ts"))):
+            store = TimeSeriesStore(path)
+            append = fill(store, now)
+            for window_label, seconds in WINDOWS:
+                window = store.query("node-1/cpu_total", now - seconds)
+                latency = best_of(lambda: store.query("node-1/cpu_total", now - seconds), repeat=200)
+                rows.append((label, window_label, window.tier, len(window.times), f"{latency * 1e6:.0f}",
+                             f"{append * 1e6:.1f}"))
+            if path:
+                store.flush()
+                reader = TimeSeriesStore(path, readonly=True)
+                window = reader.query("node-1/cpu_total", now - 86400)
+                latency = best_of(lambda: reader.query("node-1/cpu_total", now - 86400), repeat=200)
+                rows.append(("mmap reader", "24 h", window.tier, len(window.times), f"{latency * 1e6:.0f}", "-"))
+
+    per_series = sum(spec.capacity for spec in DEFAULT_TIERS) * POINT_DTYPE.itemsize
+    points_24h = int(86400 / SAMPLE_INTERVAL)
+    history = [0.0] * points_24h
+    legacy = best_of(lambda: (history.append(1.0), history.pop(0)), repeat=5, number=1000)
+    legacy_bytes = sys.getsizeof(history) + points_24h * sys.getsizeof(1.0)
+
+    print(f"{HISTORY_SECONDS // 86400} days of samples every {SAMPLE_INTERVAL:.0f}s")
+    print_table(("store", "window", "tier", "points", "query us", "append us"), rows)
+    print(f"\nstore size per series: {per_series / 1024:.0f} KB (all tiers)")
+    print(f"old list buffer holding 24h raw: {legacy_bytes / 1024:.0f} KB, append+pop(0) {legacy * 1e6:.1f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Benchmark: post-remediation verification, fixed 20s sleep vs adaptive sampling.
+
+Each scenario replays a spike on a 2-VCPU node (20% background, one core pinned
+while it runs) and starts verification at the moment of the restart:
+
+    healthy     the restart ends the spike
+    slow drain  the load keeps running 4s into verification (slow container stop)
+    relapse     the load comes back 3s after the restart and stays
+
+The old check primes a counter baseline, sleeps CHECK_INTERVAL_SECONDS * 2 and
+takes one sample (a 20s average); the new one is detection_agent.verify_stability.
+Reported: verdict, time to verdict and the CPU % it reports.
+
+    python detection-agent/benchmarks/bench_verify.py
+"""
+import asyncio
+import contextlib
+import os
+import shutil
+import tempfile
+import time
+
+import _bench  # noqa: F401  (puts the agent modules on sys.path)
+from _bench import print_table
+from fake_servers import serve_in_process
+from replay import CpuTrace, Spike, make_replay_exporter_app
+
+NUM_CPUS = 2
+LEGACY_WAIT_SECONDS = 20  # CHECK_INTERVAL_SECONDS * 2
+RESTART_AT = 10.0  # trace offset where verification starts
+SCENARIOS = (
+    ("healthy", (Spike(start=0, duration=RESTART_AT),)),
+    ("slow drain", (Spike(start=0, duration=RESTART_AT + 4),)),
+    ("relapse", (Spike(start=0, duration=RESTART_AT), Spike(start=RESTART_AT + 3, duration=120))),
+)
+
+
+def legacy_verify(agent, url: str):
+    """The pre-change verify_stability: one sample 20s after priming, bound 50% of threshold x VCPUs."""
+    from cpu_rate import CpuRateEngine
+    from prom_parser import fetch_cpu_seconds
+
+    start = time.monotonic()
+    engine = CpuRateEngine()
+    engine.update(fetch_cpu_seconds(url, timeout=5))
+    time.sleep(LEGACY_WAIT_SECONDS)
+    snapshot = engine.update(fetch_cpu_seconds(url, timeout=5))
+    bound = agent.CPU_THRESHOLD_PERCENT * snapshot.num_cpus * 0.5
+    status = "STABLE" if snapshot.total_percent < bound else "UNSTABLE"
+    return status, time.monotonic() - start, snapshot.total_percent
+
+
+async def run_scenario(agent, url: str):
+    from scrape_scheduler import ScrapeTarget
+
+    target = ScrapeTarget("node-0", f"{url}/targets/0/metrics", 10)
+    legacy = asyncio.create_task(asyncio.to_thread(legacy_verify, agent, target.url))
+    start = time.monotonic()
+    result, total_percent = await agent.verify_stability(target)
+    adaptive = (result.status, time.monotonic() - start, total_percent, result.curve)
+    return await legacy, adaptive
+
+
+def main():
+    workdir = tempfile.mkdtemp(prefix="bench-verify-")  # the agent's SQLite files land here
+    os.chdir(workdir)
+    os.environ["AGENT_TIMESERIES_DIR"] = ""
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        import detection_agent as agent
+
+    rows, curves = [], []
+    for name, spikes in SCENARIOS:
+        trace = CpuTrace.synthetic(NUM_CPUS, 20.0, spikes)
+        epoch = time.time() + 1.0 - RESTART_AT  # verification starts one second from now
+        with serve_in_process(make_replay_exporter_app, trace=trace, epoch=epoch) as url:
+            time.sleep(max(0.0, epoch + RESTART_AT - time.time()))
+            (old_status, old_seconds, old_cpu), (new_status, new_seconds, new_cpu, curve) = \
+                asyncio.run(run_scenario(agent, url))
+        rows.append((name, old_status, f"{old_seconds:.1f}", f"{old_cpu:.1f}",
+                     new_status, f"{new_seconds:.1f}", f"{new_cpu:.1f}"))
+        curves.append(f"{name}: " + " ".join(f"{value:.0f}" for _, value in curve))
+
+    print(f"{NUM_CPUS} VCPUs, spike pins one core (~110% total), settle below "
+          f"{agent.DETECTOR_DEFAULTS.clear_below:g}, escalate at {agent.DETECTOR_DEFAULTS.threshold:g}")
+    print_table(("scenario", "old verdict", "old s", "old cpu %", "new verdict", "new s", "new cpu %"), rows)
+    print()
+    print("adaptive convergence curves (total CPU % per 1s sample):")
+    for line in curves:
+        print("  " + line)
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,373 @@
+"""
+Local fake servers for benchmarks: a multi-target Node Exporter, Loki
+(query_range only, or a busy host that evaluates simple LogQL), a Docker Engine
+API (served on a Unix socket) and a webhook.
+
+Each server runs in its own process so its CPU cost never shows up in the
+agent-side numbers being measured.
+"""
+import asyncio
+import contextlib
+import heapq
+import json
+import math
+import multiprocessing
+import os
+import re
+import socket
+import time
+
+from aiohttp import web
+
+from synthetic import CPU_MODES
+
+# Fraction of each core's time spent per mode; counters advance in real time.
+_MODE_SHARE = {"idle": 0.7, "user": 0.2, "system": 0.06, "iowait": 0.02, "steal": 0.01, "irq": 0.005, "softirq": 0.005, "nice": 0.0}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def make_exporter_app(num_cpus: int = 4, filler_series: int = 200, slow_delay: float = 0.0) -> web.Application:
+    """
+    Node Exporter look-alike serving /targets/{n}/metrics for any n.
+    /slow/{n}/metrics answers the same payload after `slow_delay` seconds.
+    /stats returns the number of metrics requests served so far, when the first came in
+    and when each target was last scraped.
+    """
+    started = time.time()
+    filler = "".join(f'node_network_receive_bytes_total{{device="eth{i}"}} {i * 1000}\n' for i in range(filler_series))
+    cache = {"tick": None, "body": b""}
+    served = {"requests": 0, "first_request": None, "last_request": {}}
+
+    def render() -> bytes:
+        tick = round(time.time() - started, 1)
+        if cache["tick"] != tick:
+            lines = ["# TYPE node_cpu_seconds_total counter"]
+            for cpu in range(num_cpus):
+                for mode in CPU_MODES:
+                    lines.append(f'node_cpu_seconds_total{{cpu="{cpu}",mode="{mode}"}} {1e5 + tick * _MODE_SHARE[mode]:.3f}')
+            cache["tick"], cache["body"] = tick, ("\n".join(lines) + "\n" + filler).encode()
+        return cache["body"]
+
+    async def metrics(request: web.Request) -> web.Response:
+        served["requests"] += 1
+        served["first_request"] = served["first_request"] or time.time()
+        served["last_request"][request.match_info["n"]] = time.time()
+        return web.Response(body=render(), content_type="text/plain")
+
+    async def slow_metrics(request: web.Request) -> web.Response:
+        served["requests"] += 1
+        await asyncio.sleep(slow_delay)
+        return web.Response(body=render(), content_type="text/plain")
+
+    app = web.Application()
+    app.router.add_get("/targets/{n}/metrics", metrics)
+    app.router.add_get("/slow/{n}/metrics", slow_metrics)
+    app.router.add_get("/stats", lambda request: web.json_response(served))
+    return app
+
+
+_LOG_TEMPLATES = (
+    "{ts} - INFO - [cpu-test-app] Health check successful.",
+    "{ts} - INFO - [cpu-test-app] GET /health 200 in {n}ms",
+    "{ts} - WARNING - [cpu-test-app] Slow response from upstream db-{n} ({n}ms)",
+    "{ts} - ERROR - [cpu-test-app] **CRITICAL ERROR: Beginning CPU-intensive calculation.** Iterations: 500000000",
+    "{ts} - INFO - [cpu-test-app] CPU calculation finished. Duration: {n}.00s",
+)
+
+
+def make_loki_app(lines_per_second: float = 100.0, streams: int = 8, latency: float = 0.0) -> web.Application:
+    """
+    Loki look-alike for /loki/api/v1/query_range (forward direction only).
+    Every job produces `lines_per_second` lines spread round-robin over `streams`
+    streams on a fixed time grid, so any window can be served without storing logs.
+    """
+    period_ns = int(1e9 / lines_per_second)
+
+    async def query_range(request: web.Request) -> web.StreamResponse:
+        query = request.query.get("query", "")
+        start = int(request.query["start"])
+        end = int(request.query["end"])
+        limit = int(request.query.get("limit", 100))
+        job_match = re.search(r'job="([^"]+)"', query)
+        job = job_match.group(1) if job_match else "unknown"
+        if latency:
+            await asyncio.sleep(latency)
+
+        first = max(0, math.ceil(start / period_ns))
+        last = min(math.ceil(end / period_ns), first + limit)  # exclusive
+        by_stream = {}
+        for i in range(first, last):
+            ts = i * period_ns
+            template = _LOG_TEMPLATES[0 if i % 10 else (i // 10) % len(_LOG_TEMPLATES)]
+            by_stream.setdefault(i % streams, []).append([str(ts), template.format(ts=ts, n=i % 997)])
+
+        response = web.StreamResponse(headers={"Content-Type": "application/json"})
+        await response.prepare(request)
+        await response.write(b'{"status":"success","data":{"resultType":"streams","result":[')
+        for n, (stream, values) in enumerate(sorted(by_stream.items())):
+            chunk = json.dumps({"stream": {"job": job, "stream": f"s{stream}"}, "values": values})
+            await response.write(((b"," if n else b"") + chunk.encode()))
+        await response.write(b']}}')
+        await response.write_eof()
+        return response
+
+    app = web.Application()
+    app.router.add_get("/loki/api/v1/query_range", query_range)
+    return app
+
+
+_QUOTED = r'"(?:[^"\\]|\\.)*"'
+_MATCHER_RE = re.compile(r'(\w+)\s*(=~|!~|!=|=)\s*(' + _QUOTED + ')')
+_LINE_FILTER_RE = re.compile(r'(\|=|\|~|!=|!~)\s*(' + _QUOTED + ')')
+_TOPK_RE = re.compile(r'^topk\((\d+), sum by \((\w+)\) \(count_over_time\((.*) \[(\d+)s\]\)\)\)$')
+
+
+def _parse_log_query(query: str):
+    """(labels predicate, line predicate) for a LogQL selector with line filters."""
+    selector_end = query.index("}")
+    matchers = [(label, op, json.loads(value)) for label, op, value in _MATCHER_RE.findall(query[:selector_end])]
+    filters = [(op, json.loads(text)) for op, text in _LINE_FILTER_RE.findall(query[selector_end + 1:])]
+    regexes = {text: re.compile(text) for op, text in filters if op in ("|~", "!~")}
+
+    def labels_match(labels: dict) -> bool:
+        for label, op, value in matchers:
+            actual = labels.get(label, "")
+            if op == "=" and actual != value or op == "!=" and actual == value:
+                return False
+            if op in ("=~", "!~") and (re.fullmatch(value, actual) is None) == (op == "=~"):
+                return False
+        return True
+
+    def line_match(line: str) -> bool:
+        for op, text in filters:
+            if op == "|=" and text not in line or op == "!=" and text in line:
+                return False
+            if op in ("|~", "!~") and (regexes[text].search(line) is None) == (op == "|~"):
+                return False
+        return True
+
+    return labels_match, line_match
+
+
+def make_busy_loki_app(containers: int = 50, lines_per_second: float = 1000.0) -> web.Application:
+    """
+    Loki look-alike for a busy host that evaluates the LogQL subset logql.py emits:
+    selectors with = != =~ !~ matchers, |= != |~ !~ line filters (query_range), and
+    topk(k, sum by (label) (count_over_time(... [Ns]))) on the instant query endpoint.
+    job="containerlogs" spreads `lines_per_second` round-robin over app-0 .. app-N
+    (label container): INFO request lines, a WARNING every 100th line per container,
+    an upstream ERROR every 20th from app-1 and, from app-7 (the CPU hog), the
+    cpu-test-app spike line every 50th. job="varlogs" is syslog at a tenth of the
+    rate. /stats returns requests, lines and bytes served per endpoint.
+    Line filters are evaluated once per template and stream (lines of a template only
+    differ in numbers), so serving cost is mostly generating and encoding lines.
+    """
+    period_ns = int(1e9 / lines_per_second)
+    syslog_period_ns = period_ns * 10
+    stats = {"query_range": 0, "query": 0, "lines": 0, "bytes": 0}
+
+    def container_line(c: int, k: int, ts: int):
+        """(template key, line)"""
+        if c == 7 and k % 50 == 0:
+            return (c, "spike"), _LOG_TEMPLATES[3].format(ts=ts).replace("cpu-test-app", "app-7")
+        if c == 1 and k % 20 == 0:
+            return (c, "error"), f"{ts} - ERROR - [app-1] upstream payments-api timed out after {k % 997}ms"
+        if (k + c) % 100 == 0:
+            return (c, "warning"), f"{ts} - WARNING - [app-{c}] Slow response from upstream db-{k % 7} ({k % 997}ms)"
+        return (c, "info"), f"{ts} - INFO - [app-{c}] GET /api/items/{k % 997} 200 in {k % 97}ms"
+
+    def select(job: str, labels_match, line_match, start: int, end: int):
+        """(labels, ts, line) in time order for the matching streams and lines in [start, end)."""
+        matches = {}  # template key -> line filters pass
+
+        def keep(key, line) -> bool:
+            if key not in matches:
+                matches[key] = line_match(line)
+            return matches[key]
+
+        if job == "varlogs":
+            labels = {"job": "varlogs", "filename": "/var/log/syslog"}
+            if labels_match(labels):
+                for i in range(max(0, math.ceil(start / syslog_period_ns)), math.ceil(end / syslog_period_ns)):
+                    ts = i * syslog_period_ns
+                    line = f"{ts} ip-10-0-0-1 systemd[1]: Started Session {i % 997} of User ubuntu."
+                    if keep("syslog", line):
+                        yield labels, ts, line
+            return
+        matched = [c for c in range(containers)
+                   if labels_match({"job": job, "container": f"app-{c}"})]
+        first, last = max(0, math.ceil(start / period_ns)), math.ceil(end / period_ns)
+        if len(matched) == containers:
+            indices = range(first, last)
+        else:
+            indices = heapq.merge(*(range(first + (c - first) % containers, last, containers) for c in matched))
+        stream_labels = {c: {"job": job, "container": f"app-{c}"} for c in matched}
+        for i in indices:
+            c, ts = i % containers, i * period_ns
+            key, line = container_line(c, i // containers, ts)
+            if keep(key, line):
+                yield stream_labels[c], ts, line
+
+    def job_of(query: str) -> str:
+        job = re.search(r'job="([^"]+)"', query)
+        return job.group(1) if job else "unknown"
+
+    async def query_range(request: web.Request) -> web.StreamResponse:
+        query = request.query.get("query", "")
+        start, end = int(request.query["start"]), int(request.query["end"])
+        limit = int(request.query.get("limit", 100))
+        labels_match, line_match = _parse_log_query(query)
+        by_stream = {}
+        taken = 0
+        for labels, ts, line in select(job_of(query), labels_match, line_match, start, end):
+            by_stream.setdefault(id(labels), (labels, []))[1].append([str(ts), line])
+            taken += 1
+            if taken == limit:
+                break
+
+        response = web.StreamResponse(headers={"Content-Type": "application/json"})
+        await response.prepare(request)
+        chunks = [b'{"status":"success","data":{"resultType":"streams","result":[']
+        for n, (labels, values) in enumerate(by_stream.values()):
+            chunks.append((b"," if n else b"") + json.dumps({"stream": labels, "values": values}).encode())
+        chunks.append(b']}}')
+        for chunk in chunks:
+            await response.write(chunk)
+        await response.write_eof()
+        stats["query_range"] += 1
+        stats["lines"] += taken
+        stats["bytes"] += sum(len(chunk) for chunk in chunks)
+        return response
+
+    async def instant_query(request: web.Request) -> web.Response:
+        match = _TOPK_RE.match(request.query.get("query", ""))
+        if match is None:
+            return web.json_response({"status": "error", "error": "unsupported query"}, status=400)
+        k, by, log_query, window = int(match.group(1)), match.group(2), match.group(3), int(match.group(4))
+        time_ns = int(request.query["time"])
+        labels_match, line_match = _parse_log_query(log_query)
+        counts = {}
+        for labels, _ts, _line in select(job_of(log_query), labels_match, line_match, time_ns - window * 10**9, time_ns):
+            counts[labels.get(by, "")] = counts.get(labels.get(by, ""), 0) + 1
+        top = sorted(counts.items(), key=lambda item: -item[1])[:k]
+        body = json.dumps({"status": "success", "data": {"resultType": "vector", "result": [
+            {"metric": {by: value} if value else {}, "value": [time_ns / 1e9, str(count)]} for value, count in top]}})
+        stats["query"] += 1
+        stats["bytes"] += len(body)
+        return web.Response(text=body, content_type="application/json")
+
+    app = web.Application()
+    app.router.add_get("/loki/api/v1/query_range", query_range)
+    app.router.add_get("/loki/api/v1/query", instant_query)
+    app.router.add_get("/stats", lambda request: web.json_response(stats))
+    return app
+
+
+def make_docker_app(restart_delay: float = 0.5, on_restart=None) -> web.Application:
+    """
+    Docker Engine API look-alike: /_ping and POST /containers/{name}/restart, which
+    takes `restart_delay` seconds (the stop/start a real daemon does) and answers 204.
+    Containers named "missing-*" do not exist (404). `on_restart(name)` is awaited
+    after each restart. /stats returns restarts served, the peak number in progress
+    at once, and [time, name] per restart.
+    """
+    stats = {"restarts": 0, "in_progress": 0, "max_in_progress": 0, "calls": []}
+
+    async def restart(request: web.Request) -> web.Response:
+        name = request.match_info["name"]
+        if name.startswith("missing-"):
+            return web.json_response({"message": f"No such container: {name}"}, status=404)
+        stats["in_progress"] += 1
+        stats["max_in_progress"] = max(stats["max_in_progress"], stats["in_progress"])
+        try:
+            await asyncio.sleep(restart_delay)
+        finally:
+            stats["in_progress"] -= 1
+        if on_restart is not None:
+            await on_restart(name)
+        stats["restarts"] += 1
+        stats["calls"].append([time.time(), name])
+        return web.Response(status=204)
+
+    app = web.Application()
+    app.router.add_get("/_ping", lambda request: web.Response(text="OK"))
+    app.router.add_post("/containers/{name}/restart", restart)
+    app.router.add_get("/stats", lambda request: web.json_response(stats))
+    return app
+
+
+def make_webhook_app(latency: float = 0.0, fail_first: int = 0) -> web.Application:
+    """
+    Slack-style incoming webhook: POST /hook takes `latency` seconds and answers
+    200, or 500 (at once) for the first `fail_first` requests. /stats
+    returns requests seen, messages accepted and the "text"/"summary" of each.
+    """
+    stats = {"requests": 0, "received": 0, "texts": []}
+
+    async def hook(request: web.Request) -> web.Response:
+        body = await request.json()
+        stats["requests"] += 1
+        if stats["requests"] <= fail_first:
+            return web.Response(status=500, text="upstream error")
+        await asyncio.sleep(latency)
+        stats["received"] += 1
+        stats["texts"].append(body.get("text") or body.get("summary"))
+        return web.Response(text="ok")
+
+    app = web.Application()
+    app.router.add_post("/hook", hook)
+    app.router.add_get("/stats", lambda request: web.json_response(stats))
+    return app
+
+
+def _serve(factory, port: int, kwargs: dict):
+    web.run_app(factory(**kwargs), host="127.0.0.1", port=port, print=None, handle_signals=True)
+
+
+def _serve_unix(factory, path: str, kwargs: dict):
+    web.run_app(factory(**kwargs), path=path, print=None, handle_signals=True)
+
+
+@contextlib.contextmanager
+def serve_in_process(factory, **kwargs):
+    """Runs `factory(**kwargs)` as an aiohttp app in a child process; yields its base URL."""
+    port = free_port()
+    proc = multiprocessing.Process(target=_serve, args=(factory, port, kwargs), daemon=True)
+    proc.start()
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        with contextlib.suppress(OSError), socket.create_connection(("127.0.0.1", port), timeout=0.2):
+            break
+        time.sleep(0.05)
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        proc.terminate()
+        proc.join(5)
+
+
+@contextlib.contextmanager
+def serve_unix_in_process(factory, path: str, **kwargs):
+    """Like serve_in_process, on a Unix socket at `path`; yields a "unix://" endpoint."""
+    with contextlib.suppress(FileNotFoundError):
+        os.unlink(path)
+    proc = multiprocessing.Process(target=_serve_unix, args=(factory, path, kwargs), daemon=True)
+    proc.start()
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        with contextlib.suppress(OSError), socket.socket(socket.AF_UNIX) as sock:
+            sock.connect(path)
+            break
+        time.sleep(0.05)
+    try:
+        yield f"unix://{path}"
+    finally:
+        proc.terminate()
+        proc.join(5)
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(path)
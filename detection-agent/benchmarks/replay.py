@@ -0,0 +1,291 @@
+"""
+Record-and-replay harness: runs the real agent loop without EC2, Loki, Gemini or Docker.
+
+  - CpuTrace: busy cores over time, synthetic (a baseline plus cpu-spike-app
+    /spike runs) or recorded from a real Node Exporter (record / CpuTrace.from_csv)
+  - make_replay_exporter_app / make_replay_loki_app: Node Exporter and Loki
+    look-alikes whose counters and log lines are computed from the trace, so any
+    scrape time or query window is answered exactly and without stored state
+  - StubAnalyzer: stand-in for the Gemini call with a fixed latency
+  - make_replay_docker_app: fake Docker Engine API (served on a Unix socket) whose
+    restart of "app-<n>" ends member n's running spike on the replay exporter
+
+Every fleet member n replays the same trace shifted by target_offset(n, spread)
+seconds, so a large fleet does not spike in lockstep.
+
+Record a trace from a live exporter (CSV rows "timestamp,value", the agent's
+aggregate CPU %, the same format bench_detectors.py reads):
+
+    python detection-agent/benchmarks/replay.py record http://host:9100/metrics 600 trace.csv
+"""
+import bisect
+import csv
+import math
+import sys
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import aiohttp
+from aiohttp import web
+
+import _bench  # noqa: F401  (puts the agent modules on sys.path)
+from fake_servers import make_docker_app
+from synthetic import CPU_MODES
+
+from analyzers import AnalysisInput, AnalysisResult, Analyzer
+from cpu_rate import CpuRateEngine
+from prom_parser import fetch_cpu_seconds
+
+SPIKE_START_LINE = "{ts} - ERROR - [{app}] **CRITICAL ERROR: Beginning CPU-intensive calculation.** Iterations: 500000000"
+SPIKE_END_LINE = "{ts} - INFO - [{app}] CPU calculation finished. Duration: {duration:.2f}s"
+HEALTH_LINE = "{ts} - INFO - [{app}] Health check successful."
+SYSLOG_LINE = "{ts} ip-10-0-0-{n} systemd[1]: Started Session {n} of User ubuntu."
+
+
+@dataclass
+class Spike:
+    """One cpu-spike-app /spike run, `start` seconds into the trace."""
+    start: float
+    duration: float
+    core: int = 0
+    # False: the app logs nothing about it, so only the LLM stand-in can explain it
+    logged: bool = True
+    # False: the load is already part of a recorded trace; only the log lines are replayed
+    load: bool = True
+
+
+def target_offset(n: int, spread: float) -> float:
+    """Start delay of fleet member n, spread evenly (golden ratio) over [0, spread)."""
+    return math.fmod(n * 0.6180339887, 1.0) * spread
+
+
+class CpuTrace:
+    """
+    Background load as (offset seconds, busy cores) steps, each held until the next
+    and spread evenly over the cores, plus spikes that pin one core at 100%.
+    """
+
+    def __init__(self, num_cpus: int, steps: Sequence[Tuple[float, float]], spikes: Sequence[Spike] = ()):
+        if not steps:
+            raise ValueError("A trace needs at least one step")
+        self.num_cpus = num_cpus
+        ordered = sorted(steps)
+        self.times = [t for t, _ in ordered]
+        self.levels = [min(max(level, 0.0), num_cpus) for _, level in ordered]
+        # Busy core-seconds accumulated from the first step up to each step
+        self._cumulative = [0.0]
+        for i in range(1, len(self.times)):
+            self._cumulative.append(self._cumulative[-1] + self.levels[i - 1] * (self.times[i] - self.times[i - 1]))
+        self.spikes = sorted(spikes, key=lambda spike: spike.start)
+
+    @classmethod
+    def synthetic(cls, num_cpus: int = 2, baseline_percent: float = 20.0, spikes: Sequence[Spike] = ()) -> "CpuTrace":
+        """Constant background load (agent aggregate scale, 0-(100 x cores)) plus `spikes`."""
+        return cls(num_cpus, [(0.0, baseline_percent / 100)], spikes)
+
+    @classmethod
+    def from_csv(cls, path: str, num_cpus: int) -> "CpuTrace":
+        """
+        Loads "timestamp,value[,incident]" rows (value = aggregate CPU %). Rows flagged
+        incident=1 become logged spikes whose load is already in the recording.
+        """
+        steps, spikes = [], []
+        first, open_start = None, None
+        with open(path, newline='') as f:
+            for row in csv.reader(f):
+                if not row or not row[0].replace('.', '', 1).isdigit():
+                    continue  # header
+                t, value = float(row[0]), float(row[1])
+                first = t if first is None else first
+                steps.append((t - first, value / 100))
+                flagged = len(row) > 2 and row[2].strip() == "1"
+                if flagged and open_start is None:
+                    open_start = t - first
+                elif not flagged and open_start is not None:
+                    spikes.append(Spike(open_start, t - first - open_start, load=False))
+                    open_start = None
+        if open_start is not None:
+            spikes.append(Spike(open_start, steps[-1][0] - open_start, load=False))
+        return cls(num_cpus, steps, spikes)
+
+    def _background(self, t: float) -> float:
+        """Busy core-seconds of the background load in [0, t]."""
+        if t <= self.times[0]:
+            return 0.0
+        i = bisect.bisect_right(self.times, t) - 1
+        return self._cumulative[i] + self.levels[i] * (t - self.times[i])
+
+    @staticmethod
+    def spike_end(spike: Spike, restarts: Sequence[float] = ()) -> float:
+        """Where the spike stops: its natural end, or the first restart while it ran."""
+        end = spike.start + spike.duration
+        return min([r for r in restarts if spike.start <= r < end] + [end])
+
+    def busy_seconds(self, core: int, t: float, restarts: Sequence[float] = ()) -> float:
+        """Busy seconds of one core in [0, t]; `restarts` are trace offsets of container restarts."""
+        if t <= 0:
+            return 0.0
+        busy = self._background(t) / self.num_cpus
+        for spike in self.spikes:
+            if spike.start >= t:
+                break
+            if not spike.load or spike.core != core:
+                continue
+            end = min(self.spike_end(spike, restarts), t)
+            if end > spike.start:
+                # The pinned core is 100% busy instead of its share of the background
+                busy += (end - spike.start) - (self._background(end) - self._background(spike.start)) / self.num_cpus
+        return busy
+
+
+# --- FAKE SERVERS ---
+
+def make_replay_exporter_app(trace: CpuTrace, epoch: float, spread: float = 0.0) -> web.Application:
+    """
+    Node Exporter look-alike replaying `trace` from wall time `epoch`.
+    /targets/{n}/metrics       node_cpu_seconds_total of fleet member n
+    POST /targets/{n}/restart  a container restart: ends member n's running spike
+    /stats                     metrics requests and restarts served so far
+    """
+    restarts: Dict[int, List[float]] = {}
+    served = {"requests": 0, "restarts": 0}
+
+    async def metrics(request: web.Request) -> web.Response:
+        served["requests"] += 1
+        n = int(request.match_info["n"])
+        t = time.time() - epoch - target_offset(n, spread)
+        elapsed = max(t, 0.0)
+        lines = ["# TYPE node_cpu_seconds_total counter"]
+        for cpu in range(trace.num_cpus):
+            busy = trace.busy_seconds(cpu, t, restarts.get(n, ()))
+            seconds = {"user": busy * 0.9, "system": busy * 0.1, "idle": elapsed - busy}
+            for mode in CPU_MODES:
+                lines.append(f'node_cpu_seconds_total{{cpu="{cpu}",mode="{mode}"}} {1e5 + seconds.get(mode, 0.0):.3f}')
+        return web.Response(text="\n".join(lines) + "\n", content_type="text/plain")
+
+    async def restart(request: web.Request) -> web.Response:
+        served["restarts"] += 1
+        n = int(request.match_info["n"])
+        restarts.setdefault(n, []).append(time.time() - epoch - target_offset(n, spread))
+        return web.json_response({"restarted": n})
+
+    app = web.Application()
+    app.router.add_get("/targets/{n}/metrics", metrics)
+    app.router.add_post("/targets/{n}/restart", restart)
+    app.router.add_get("/stats", lambda request: web.json_response(served))
+    return app
+
+
+def make_replay_loki_app(trace: CpuTrace, epoch: float, targets: int = 1, spread: float = 0.0,
+                         lines_per_second: float = 5.0) -> web.Application:
+    """
+    Loki look-alike for /loki/api/v1/query_range (forward direction). job="containerlogs"
+    carries health checks plus every fleet member's /spike ERROR/INFO lines;
+    job="varlogs" carries background syslog lines. Stream selectors beyond the job and
+    line filters are ignored, and /loki/api/v1/query answers with an empty vector.
+    """
+    period_ns = int(1e9 / lines_per_second)
+    epoch_ns = int(epoch * 1e9)
+    spike_lines = []
+    for n in range(targets):
+        offset_ns = epoch_ns + int(target_offset(n, spread) * 1e9)
+        for spike in trace.spikes:
+            if spike.logged:
+                start_ns = offset_ns + int(spike.start * 1e9)
+                end_ns = start_ns + int(spike.duration * 1e9)
+                spike_lines.append((start_ns, SPIKE_START_LINE.format(ts=start_ns, app=f"app-{n}")))
+                spike_lines.append((end_ns, SPIKE_END_LINE.format(ts=end_ns, app=f"app-{n}", duration=spike.duration)))
+    spike_lines.sort()
+    spike_times = [ts for ts, _ in spike_lines]
+
+    async def query_range(request: web.Request) -> web.Response:
+        query = request.query.get("query", "")
+        start = int(request.query["start"])
+        end = int(request.query["end"])
+        limit = int(request.query.get("limit", 100))
+        container = 'job="containerlogs"' in query
+
+        lines = []
+        for i in range(max(0, math.ceil(start / period_ns)), math.ceil(end / period_ns)):
+            ts = i * period_ns
+            template = HEALTH_LINE if container else SYSLOG_LINE
+            lines.append((ts, template.format(ts=ts, app="cpu-test-app", n=i % 97)))
+        if container:
+            lo, hi = bisect.bisect_left(spike_times, start), bisect.bisect_left(spike_times, end)
+            lines.extend(spike_lines[lo:hi])
+        lines.sort()
+        values = [[str(ts), line] for ts, line in lines[:limit]]
+        job = "containerlogs" if container else "varlogs"
+        return web.json_response({"status": "success", "data": {"resultType": "streams", "result": [
+            {"stream": {"job": job}, "values": values}]}})
+
+    async def instant_query(request: web.Request) -> web.Response:
+        return web.json_response({"status": "success", "data": {"resultType": "vector", "result": []}})
+
+    app = web.Application()
+    app.router.add_get("/loki/api/v1/query_range", query_range)
+    app.router.add_get("/loki/api/v1/query", instant_query)
+    return app
+
+
+# --- STUBS ---
+
+class StubAnalyzer(Analyzer):
+    """Stands in for the LLM analyzer: answers after `latency` seconds, always with the same verdict."""
+    name = "llm"
+
+    def __init__(self, latency: float = 2.0, reason: str = "Replay: unexplained CPU load in the container",
+                 confidence: int = 85):
+        self.latency = latency
+        self.reason = reason
+        self.confidence = confidence
+        self.calls = 0
+
+    def analyze(self, data: AnalysisInput) -> Optional[AnalysisResult]:
+        self.calls += 1
+        time.sleep(self.latency)
+        raw_text = f"REASON: {self.reason}\nCONFIDENCE: {self.confidence}"
+        return AnalysisResult(self.name, self.reason, self.confidence, raw_text=raw_text)
+
+
+def make_replay_docker_app(exporter_url: str, restart_delay: float = 1.0) -> web.Application:
+    """
+    Fake Docker Engine API for the agent's remediation executor: a restart takes
+    `restart_delay` seconds, then tells the replay exporter that the container
+    restarted. Containers are named "app-<n>".
+    """
+    async def on_restart(name: str):
+        n = name.rsplit("-", 1)[-1]
+        async with aiohttp.ClientSession() as session:
+            async with session.post(f"{exporter_url}/targets/{n}/restart") as response:
+                response.raise_for_status()
+
+    return make_docker_app(restart_delay, on_restart)
+
+
+# --- RECORDING ---
+
+def record(metrics_url: str, seconds: float, path: str, interval: float = 10.0) -> int:
+    """Scrapes a live Node Exporter for `seconds` and writes its aggregate CPU % as a replayable CSV."""
+    engine = CpuRateEngine()
+    rows = 0
+    deadline = time.time() + seconds
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(("timestamp", "value"))
+        while time.time() < deadline:
+            snapshot = engine.update(fetch_cpu_seconds(metrics_url, timeout=5))
+            if snapshot is not None:
+                writer.writerow((f"{time.time():.3f}", f"{snapshot.total_percent:.2f}"))
+                rows += 1
+            time.sleep(interval)
+    return rows
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 5 or sys.argv[1] != "record":
+        print("usage: replay.py record METRICS_URL SECONDS OUT.csv [INTERVAL]")
+        sys.exit(2)
+    interval = float(sys.argv[5]) if len(sys.argv) > 5 else 10.0
+    print(f"Recorded {record(sys.argv[2], float(sys.argv[3]), sys.argv[4], interval)} samples to {sys.argv[4]}")
@@ -0,0 +1,112 @@
+"""Synthetic Node Exporter payloads for benchmarks and fake servers."""
+import random
+
+CPU_MODES = ("idle", "iowait", "irq", "nice", "softirq", "steal", "system", "user")
+# Share of each core's time per mode, for payloads `elapsed` seconds later
+CPU_MODE_SHARES = {"idle": 0.6, "iowait": 0.02, "irq": 0.01, "nice": 0.0, "softirq": 0.02, "steal": 0.0,
+                   "system": 0.1, "user": 0.25}
+MEMORY_FIELDS = ("Active", "Active_anon", "Active_file", "AnonHugePages", "AnonPages", "Bounce", "Buffers", "Cached",
+                 "CommitLimit", "Committed_AS", "DirectMap1G", "DirectMap2M", "DirectMap4k", "Dirty", "HugePages_Free",
+                 "HugePages_Rsvd", "HugePages_Surp", "HugePages_Total", "Hugepagesize", "Inactive", "Inactive_anon",
+                 "Inactive_file", "KernelStack", "Mapped", "MemAvailable", "MemFree", "MemTotal", "Mlocked", "NFS_Unstable",
+                 "PageTables", "SReclaimable", "SUnreclaim", "Shmem", "Slab", "SwapCached", "SwapFree", "SwapTotal",
+                 "Unevictable", "VmallocChunk", "VmallocTotal", "VmallocUsed", "Writeback", "WritebackTmp")
+NUM_DISKS = 16
+
+
+def node_exporter_payload(num_series: int, num_cpus: int = 96, seed: int = 0, resources: bool = False,
+                          interfaces: int = 1000, elapsed: float = 0.0) -> str:
+    """
+    Builds an exposition payload with roughly `num_series` samples.
+    node_cpu_seconds_total gets num_cpus * 8 series; the rest is filler spread over
+    network/filesystem/disk families so the parser has to skip most of the body.
+    `resources` adds the families the resource detectors read, as a real exporter
+    has them: every node_memory_* gauge, load averages, per-disk I/O time and
+    error/drop counters for `interfaces` interfaces (within `num_series`).
+    Counters advance by `elapsed` seconds of steady load, so two payloads of the
+    same seed can be fed to the rate engines in turn.
+    """
+    rng = random.Random(seed)
+    lines = [
+        "# HELP node_cpu_seconds_total Seconds the CPUs spent in each mode.",
+        "# TYPE node_cpu_seconds_total counter",
+    ]
+    for cpu in range(num_cpus):
+        for mode in CPU_MODES:
+            value = rng.uniform(1e3, 1e6) if mode == "idle" else rng.uniform(0, 1e4)
+            value += elapsed * CPU_MODE_SHARES[mode]
+            lines.append(f'node_cpu_seconds_total{{cpu="{cpu}",mode="{mode}"}} {value:.2f}')
+
+    filler_families = (
+        ("node_network_receive_bytes_total", "device", "eth"),
+        ("node_filesystem_avail_bytes", "mountpoint", "/mnt/vol"),
+        ("node_disk_read_bytes_total", "device", "nvme"),
+        ("node_cpu_scaling_frequency_hertz", "cpu", ""),
+    )
+    network_families = ("node_network_receive_errs_total", "node_network_transmit_errs_total",
+                        "node_network_receive_drop_total", "node_network_transmit_drop_total")
+    resource_series = len(MEMORY_FIELDS) + 3 + 2 * NUM_DISKS + len(network_families) * interfaces if resources else 0
+    remaining = max(0, num_series - num_cpus * len(CPU_MODES) - resource_series)
+    per_family = remaining // len(filler_families)
+    for family, label, prefix in filler_families:
+        lines.append(f"# HELP {family} Synthetic filler series.")
+        lines.append(f"# TYPE {family} gauge")
+        for i in range(per_family):
+            lines.append(f'{family}{{{label}="{prefix}{i}"}} {rng.uniform(0, 1e9):.6e}')
+    if not resources:
+        return "\n".join(lines) + "\n"
+
+    for field in MEMORY_FIELDS:
+        value = 256 * 2**30 if field == "MemTotal" else 100 * 2**30 if field == "MemAvailable" else rng.uniform(0, 2**36)
+        lines.append(f"node_memory_{field}_bytes {value:.6e}")
+    for minutes in (1, 5, 15):
+        lines.append(f"node_load{minutes} {num_cpus * 0.5:.2f}")
+    for family, busy in (("node_disk_io_time_seconds_total", 0.3), ("node_disk_io_time_weighted_seconds_total", 1.5)):
+        for disk in range(NUM_DISKS):
+            lines.append(f'{family}{{device="nvme{disk}n1"}} {rng.uniform(0, 1e6) + elapsed * busy:.3f}')
+    for family in network_families:
+        lines.append(f"# TYPE {family} counter")
+        for i in range(interfaces):
+            lines.append(f'{family}{{device="eth{i}"}} {rng.uniform(0, 1e4) + elapsed * 0.001:.3f}')
+    return "\n".join(lines) + "\n"
+
+
+def container_id(n: int) -> str:
+    """Deterministic 64-hex container id for container n."""
+    return f"{n:012x}" + "ab" * 26
+
+
+def cadvisor_payload(usage_seconds: dict, seed: int = 0) -> str:
+    """
+    cAdvisor-style /metrics for {container name: CPU seconds}: about 40 series per
+    container over the CPU, memory, network and filesystem families, like a real one.
+    """
+    rng = random.Random(seed)
+    families = (
+        ("container_cpu_usage_seconds_total", lambda name, used: [('cpu="total"', used)]),
+        ("container_cpu_user_seconds_total", lambda name, used: [("", used * 0.8)]),
+        ("container_cpu_system_seconds_total", lambda name, used: [("", used * 0.2)]),
+        ("container_memory_usage_bytes", lambda name, used: [("", rng.uniform(1e7, 1e9))]),
+        ("container_memory_rss", lambda name, used: [("", rng.uniform(1e7, 1e9))]),
+        ("container_network_receive_bytes_total",
+         lambda name, used: [(f'interface="eth{i}"', rng.uniform(0, 1e10)) for i in range(2)]),
+        ("container_network_transmit_bytes_total",
+         lambda name, used: [(f'interface="eth{i}"', rng.uniform(0, 1e10)) for i in range(2)]),
+        ("container_fs_reads_bytes_total",
+         lambda name, used: [(f'device="/dev/nvme0n{i}"', rng.uniform(0, 1e10)) for i in range(4)]),
+        ("container_fs_writes_bytes_total",
+         lambda name, used: [(f'device="/dev/nvme0n{i}"', rng.uniform(0, 1e10)) for i in range(4)]),
+        ("container_blkio_device_usage_total",
+         lambda name, used: [(f'device="/dev/nvme0n{i}",operation="{op}"', rng.uniform(0, 1e10))
+                             for i in range(4) for op in ("Read", "Write", "Sync", "Async")]),
+    )
+    lines = []
+    for family, series in families:
+        lines.append(f"# HELP {family} Synthetic cAdvisor series.")
+        lines.append(f"# TYPE {family} counter")
+        for n, (name, used) in enumerate(usage_seconds.items()):
+            base = f'id="/system.slice/docker-{container_id(n)}.scope",image="app:1.{n % 7}",name="{name}"'
+            for extra, value in series(name, used):
+                labels = f"{extra},{base}" if extra else base
+                lines.append(f"{family}{{{labels}}} {value:.6e}")
+    return "\n".join(lines) + "\n"
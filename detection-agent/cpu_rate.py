@@ -0,0 +1,177 @@
+"""
+Per-core / per-mode CPU rate engine for node_cpu_seconds_total counters.
+
+Counters are kept in preallocated NumPy arrays laid out as [cpu, mode], so each
+scrape is one vectorized delta instead of a Python loop of sums. The core count
+comes from the scraped data, and counter resets (host reboot, CPU hotplug) are
+detected per core instead of producing negative or huge percentages.
+"""
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from prom_parser import CpuSeconds
+
+IDLE_MODE = "idle"
+
+
+@dataclass
+class CpuSnapshot:
+    """
+    CPU usage over one scrape interval.
+    Percentages use the agent's aggregate scale: 0 - (100 * num_cpus).
+    """
+    num_cpus: int
+    total_percent: float
+    per_core_percent: Dict[str, float]
+    mode_percent: Dict[str, float]
+    reset_cores: Tuple[str, ...] = field(default_factory=tuple)
+
+    @property
+    def hottest_core(self) -> Tuple[str, float]:
+        """(cpu id, busy %) of the busiest core, on a 0-100 scale."""
+        if not self.per_core_percent:
+            return ("", 0.0)
+        cpu = max(self.per_core_percent, key=self.per_core_percent.__getitem__)
+        return cpu, self.per_core_percent[cpu]
+
+    @property
+    def average_percent(self) -> float:
+        """Average busy % across cores, on a 0-100 scale."""
+        return self.total_percent / self.num_cpus if self.num_cpus else 0.0
+
+    @property
+    def iowait_percent(self) -> float:
+        return self.mode_percent.get("iowait", 0.0)
+
+    @property
+    def steal_percent(self) -> float:
+        return self.mode_percent.get("steal", 0.0)
+
+    @property
+    def system_percent(self) -> float:
+        return self.mode_percent.get("system", 0.0)
+
+    def breakdown(self) -> str:
+        """Short human-readable summary used in agent logs and the dashboard."""
+        cpu, busiest = self.hottest_core
+        return (
+            f"hottest core cpu{cpu} {busiest:.1f}%, system {self.system_percent:.1f}%, "
+            f"iowait {self.iowait_percent:.1f}%, steal {self.steal_percent:.1f}%"
+        )
+
+
+def _cpu_sort_key(cpu: str):
+    return (0, int(cpu), "") if cpu.isdigit() else (1, 0, cpu)
+
+
+class CpuRateEngine:
+    """
+    Turns successive node_cpu_seconds_total scrapes into CpuSnapshots.
+    One engine holds the counter state for one Node Exporter target.
+    """
+
+    def __init__(self):
+        self.cpus: List[str] = []
+        self.modes: List[str] = []
+        self._keys: List[Tuple[str, str]] = []
+        self._prev = np.zeros((0, 0))
+        self._curr = np.zeros((0, 0))
+        self._delta = np.zeros((0, 0))
+        self._idle_col = -1
+        self._has_baseline = False
+
+    @property
+    def num_cpus(self) -> int:
+        return len(self.cpus)
+
+    def reset(self):
+        """Drops the baseline; the next update() only re-primes the counters."""
+        self._has_baseline = False
+
+    def _rebuild_layout(self, cpu_seconds: CpuSeconds):
+        """(Re)allocates the [cpu, mode] arrays for the set of series in this scrape."""
+        self.cpus = sorted({cpu for cpu, _mode in cpu_seconds}, key=_cpu_sort_key)
+        self.modes = sorted({mode for _cpu, mode in cpu_seconds})
+        shape = (len(self.cpus), len(self.modes))
+        self._keys = [(cpu, mode) for cpu in self.cpus for mode in self.modes]
+        self._prev = np.zeros(shape)
+        self._curr = np.zeros(shape)
+        self._delta = np.zeros(shape)
+        self._idle_col = self.modes.index(IDLE_MODE) if IDLE_MODE in self.modes else -1
+
+    def _load(self, cpu_seconds: CpuSeconds) -> bool:
+        """Copies the scrape into the current-counter array. False if the layout changed."""
+        if len(cpu_seconds) != len(self._keys):
+            return False
+        try:
+            self._curr.reshape(-1)[:] = [cpu_seconds[key] for key in self._keys]
+        except KeyError:
+            return False
+        return True
+
+    def update(self, cpu_seconds: CpuSeconds) -> Optional[CpuSnapshot]:
+        """
+        Feeds one scrape (as returned by prom_parser.fetch_cpu_seconds).
+        Returns None while priming: on the first scrape, after a layout change, or when
+        every core's counters reset at once (e.g. host reboot).
+        """
+        if not cpu_seconds:
+            return None
+
+        if not self._load(cpu_seconds):
+            self._rebuild_layout(cpu_seconds)
+            self._load(cpu_seconds)
+            self._has_baseline = False
+
+        if not self._has_baseline:
+            self._prev, self._curr = self._curr, self._prev
+            self._has_baseline = True
+            return None
+
+        delta = np.subtract(self._curr, self._prev, out=self._delta)
+
+        # A core whose summed counters went backwards was reset; its delta covers an
+        # unknown interval, so it sits this sample out and is re-based from here on.
+        # Individual modes (notably iowait) can tick slightly backwards on some kernels
+        # without a reset, so those are clamped to zero instead.
+        row_totals = delta.sum(axis=1)
+        reset_rows = row_totals < 0
+        np.maximum(delta, 0.0, out=delta)
+        row_totals = delta.sum(axis=1)
+        valid = ~reset_rows & (row_totals > 0)
+
+        self._prev, self._curr = self._curr, self._prev
+
+        if not valid.any():
+            if reset_rows.all():
+                return None
+            return CpuSnapshot(self.num_cpus, 0.0, {}, {}, self._reset_cores(reset_rows))
+
+        # Per-core busy ratio (everything except idle counts as busy, as before).
+        valid_delta = delta[valid]
+        valid_totals = row_totals[valid]
+        if self._idle_col >= 0:
+            core_busy = 1.0 - valid_delta[:, self._idle_col] / valid_totals
+        else:
+            core_busy = np.ones(len(valid_totals))
+        valid_cpus = [cpu for cpu, ok in zip(self.cpus, valid) if ok]
+        per_core = {cpu: round(float(busy) * 100, 2) for cpu, busy in zip(valid_cpus, core_busy)}
+
+        # Mode shares of the total capacity, scaled to the 0 - (100 * num_cpus) range.
+        scale = 100.0 * self.num_cpus / valid_totals.sum()
+        mode_totals = valid_delta.sum(axis=0) * scale
+        mode_percent = {mode: float(value) for mode, value in zip(self.modes, mode_totals)}
+        total = 100.0 * self.num_cpus - mode_percent.get(IDLE_MODE, 0.0)
+
+        return CpuSnapshot(
+            num_cpus=self.num_cpus,
+            total_percent=min(max(total, 0.0), 100.0 * self.num_cpus),
+            per_core_percent=per_core,
+            mode_percent=mode_percent,
+            reset_cores=self._reset_cores(reset_rows),
+        )
+
+    def _reset_cores(self, reset_rows: np.ndarray) -> Tuple[str, ...]:
+        return tuple(cpu for cpu, was_reset in zip(self.cpus, reset_rows) if was_reset)
@@ -1,157 +1,384 @@
+import asyncio
+import functools
+import importlib.util
+import multiprocessing
 import os
+import signal
+import socket
+import threading
 import time
-import requests
-import json
-import subprocess
+import aiohttp
+import ijson
 from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Sequence, Tuple, Union
 
-# Import the Google GenAI library
-from google import genai
-from google.genai.errors import APIError
+from analyzers import AnalysisInput, AnalyzerChain, LlmAnalyzer, RuleAnalyzer, StatisticalAnalyzer, load_rules
+from attribution import (CadvisorSource, CgroupSource, container_rates, is_pod_container, make_source, name_containers,
+                         top_containers)
+from cpu_rate import CpuRateEngine, CpuSnapshot
+from detectors import BreachForecaster, DetectorConfig, SpikeDetector, metric_value
+from incident_pipeline import Incident, IncidentPipeline
+from incident_store import IncidentStore
+from llm_broker import OUTCOMES as LLM_OUTCOMES, LlmBroker, LlmUnavailable
+from instrumentation import (BREACH_WARNINGS, ERRORS, RCA_CONFIDENCE, REGISTRY, REMEDIATIONS, REMEDIATIONS_SKIPPED,
+                             RESOURCE_DETECTIONS, SPIKES_DETECTED, STAGE_SECONDS, configure_logging, get_logger)
+from log_reducer import LogReducer
+from logql import LogQuery, LogQueryPlan, line_filter_regex, plan_job
+from notifier import Notification, NotificationDispatcher, SlackSink, WebhookSink
+from prom_parser import CPU_SECONDS_FAMILY, group_by_labels
+from rca_cache import RcaCache
+from sample_channel import SampleChannel, make_app, start_server
+from loki_client import stream_logs
+from remediation import DEFAULT_DOCKER_ENDPOINT, DockerApiError, RemediationExecutor, RemediationRequest
+from resource_rates import INCIDENT_TYPES, RESOURCE_FAMILIES, RESOURCES, ResourceRateEngine
+from scrape_scheduler import ScrapeScheduler, ScrapeTarget, TargetState, fetch_families_async, load_targets
+from sharding import ShardCoordinator, ShardMembership
+from stability import StabilityConfig, StabilityResult, StabilityVerifier
+from timeseries import TimeSeriesStore, cpu_total_series
 
 # --- CONFIGURATION ---
 NODE_EXPORTER_URL = "http://localhost:9100/metrics"
 LOKI_URL = "http://localhost:3100/loki/api/v1/query_range"
+LOKI_INSTANT_URL = "http://localhost:3100/loki/api/v1/query"
 # CPU threshold (e.g., 75% for this POC running on a t3.small with 2 VCPUs)
 CPU_THRESHOLD_PERCENT = 75 
 # How long to wait between checks (seconds)
 CHECK_INTERVAL_SECONDS = 10 
+# Spike detection defaults (per-target overrides: "detector" in targets.json). A spike must stay
+# above the threshold for SUSTAIN seconds (two samples at the default interval) and, with the
+# EWMA test on, stand out from the target's own baseline; once fired it re-arms only after
+# CPU has stayed below CLEAR_BELOW for CLEAR seconds.
+# Early warning is off by default; set "forecast_horizon_seconds" (45 works well at a 10s interval,
+# see benchmarks/bench_forecast.py) to start RCA on a pre-incident when CPU is projected to cross
+# the threshold. The pre-incident waits before remediation until the spike is detected, and is
+# closed as FALSE_ALARM if that has not happened FORECAST_CONFIRM_GRACE_SECONDS after the
+# projected breach plus the sustain time. Slow ramps are mostly learnt by the EWMA baseline, so
+# the forecaster pays off with ewma_z=None.
+DETECTOR_DEFAULTS = DetectorConfig(
+    metric="total",
+    threshold=CPU_THRESHOLD_PERCENT,
+    sustain_seconds=10,
+    clear_below=CPU_THRESHOLD_PERCENT * 0.8,
+    clear_seconds=20,
+    ewma_alpha=0.05,
+    ewma_z=3.0,
+    forecast_horizon_seconds=None,
+)
+FORECAST_CONFIRM_GRACE_SECONDS = 30
+# Memory, disk, network and load detection on the same scrape (see resource_rates.py): % of memory used,
+# % busy of the busiest disk, network errors per second and the 1-minute load per CPU. Plain sustained
+# thresholds with hysteresis. Per-target overrides go under "resources" in targets.json (null turns
+# one off; a resource missing here can be turned on there). Empty: only CPU is parsed and detected.
+RESOURCE_DETECTORS = ("memory", "disk", "network", "load")
+RESOURCE_DETECTOR_DEFAULTS = {
+    "memory": DetectorConfig(threshold=90, sustain_seconds=30, clear_below=85, clear_seconds=30),
+    "disk": DetectorConfig(threshold=90, sustain_seconds=30, clear_below=70, clear_seconds=30),
+    "network": DetectorConfig(threshold=10, sustain_seconds=20, clear_below=1, clear_seconds=30),
+    "load": DetectorConfig(threshold=2.0, sustain_seconds=60, clear_below=1.5, clear_seconds=30),
+}
 # The duration of logs to retrieve before the spike time (seconds)
 LOG_WINDOW_SECONDS = 300 
+# Loki fetch: shard width, parallel shard queries per job, lines per page, overall timeout
+LOKI_SHARD_SECONDS = 60
+LOKI_MAX_CONCURRENT_QUERIES = 4
+LOKI_PAGE_LIMIT = 5000
+LOKI_TIMEOUT_SECONDS = 30
+# Query pushdown (see logql.py): a topk metric query picks the LOKI_NOISY_STREAMS containers with the
+# most warning-or-worse lines; raw lines are pulled only for those (filtered) and for the attributed
+# containers (unfiltered), by the LOKI_CONTAINER_LABEL stream label. False pulls both jobs whole.
+LOKI_PUSHDOWN = True
+LOKI_CONTAINER_LABEL = "container"
+LOKI_NOISY_STREAMS = 3
+# Estimated token budget for the reduced logs in the RCA prompt (shared by both jobs)
+LOG_TOKEN_BUDGET = 8000
 # Time offset for Prometheus (Node Exporter) metric scraping (1 second)
 METRIC_TIME_OFFSET_SECONDS = 1 
 # Container name to target for remediation (our test app)
 TARGET_CONTAINER_NAME = "cpu-test-app"
-# Number of VCPUs on the EC2 instance (t3.small has 2)
-NUM_VCPUS = 2 
+# Per-container CPU attribution: the busiest container during the spike is analysed and restarted
+# instead of the configured one. A cAdvisor /metrics URL or a cgroup v2 root (e.g. /sys/fs/cgroup)
+# for targets without their own "containers" setting; "" = off.
+CONTAINER_METRICS = os.getenv("AGENT_CONTAINER_METRICS", "")
+ATTRIBUTION_WINDOW_SECONDS = 1.0  # between the two usage readings; overlaps the Loki ingestion wait
+ATTRIBUTION_TOP_N = 5
+ATTRIBUTION_MIN_PERCENT = 10.0  # below this (% of one core) the busiest container is not blamed
+# Attribution ranks containers by CPU, which says nothing about memory, disk or network incidents. Only these
+# incidents restart a container; the others are notify-only (a restart fixes no NIC or disk, and nothing
+# says which container is to blame)
+ATTRIBUTED_RESOURCES = ("cpu", "load")
+# Optional JSON list of Node Exporter targets (see scrape_scheduler.load_targets).
+# Without it the agent monitors NODE_EXPORTER_URL only.
+TARGETS_FILE = os.getenv("AGENT_TARGETS_FILE", "targets.json")
+# Fleet scraping: max in-flight scrapes, per-scrape timeout, +/- interval jitter fraction
+MAX_CONCURRENT_SCRAPES = 64
+SCRAPE_TIMEOUT_SECONDS = 5
+SCRAPE_JITTER = 0.1
+# Sharded mode: this many worker processes split the targets (rendezvous hashing over the workers holding
+# a lease in SHARD_LEASE_FILE); the leader serves the dashboards' aggregate view. 0 = one process.
+SHARD_WORKERS = int(os.getenv("AGENT_SHARD_WORKERS", "0"))
+SHARD_LEASE_FILE = os.getenv("AGENT_SHARD_LEASE_FILE", "shards.sqlite3")
+SHARD_HEARTBEAT_SECONDS = 2
+SHARD_LEASE_SECONDS = 10  # a worker that has not renewed its lease for this long is dead; its targets move
+SHARD_RESTART_DELAY_SECONDS = 5
+# Delay before querying Loki so Promtail has shipped the spike's logs
+LOG_INGESTION_DELAY_SECONDS = 5
+# Post-remediation verification: sample every second until the detector metric has stayed below the
+# target's clear level for VERIFY_SETTLE_SECONDS, or is back over its threshold for VERIFY_ESCALATE_SECONDS
+VERIFY_SAMPLE_INTERVAL_SECONDS = 1.0
+VERIFY_SETTLE_SECONDS = 5
+VERIFY_GRACE_SECONDS = 5  # restart warm-up: a briefly busy new container is not an escalation
+VERIFY_ESCALATE_SECONDS = 5
+VERIFY_MAX_SECONDS = 60
+# Incident pipeline: per-stage queue bound and worker counts
+INCIDENT_QUEUE_SIZE = 32
+# Remediation workers only wait on the executor; its caps below bound the actual restarts
+INCIDENT_STAGE_WORKERS = {"attribution": 8, "log_fetch": 4, "analysis": 2, "confirm": 32, "remediation": 16, "verify": 8,
+                          "notify": 2}
+PIPELINE_METRICS_INTERVAL_SECONDS = 60
+# Remediation: Docker Engine API (pooled, over the socket; docker CLI as fallback), in parallel
+# across targets. Per-target "docker" endpoints in targets.json override DOCKER_ENDPOINT.
+DOCKER_ENDPOINT = os.getenv("DOCKER_HOST", DEFAULT_DOCKER_ENDPOINT)
+REMEDIATION_MAX_CONCURRENT = 8
+REMEDIATION_MAX_PER_HOST = 1
+REMEDIATION_COOLDOWN_SECONDS = 300  # the same container is not restarted again within this
+REMEDIATION_RATE_LIMIT = 10  # restarts per REMEDIATION_RATE_WINDOW_SECONDS across the fleet
+REMEDIATION_RATE_WINDOW_SECONDS = 60
+REMEDIATION_STOP_TIMEOUT_SECONDS = 10
+# Log what would be restarted, without restarting anything
+REMEDIATION_DRY_RUN = os.getenv("AGENT_REMEDIATION_DRY_RUN", "").lower() in ("1", "true", "yes")
+
+# Notifications: queued by the notify stage and delivered by one dispatcher task. The first one after a
+# quiet period goes out at once; later ones within NOTIFY_COALESCE_SECONDS are sent as one summary.
+NOTIFY_QUEUE_SIZE = 256
+NOTIFY_COALESCE_SECONDS = 60
+NOTIFY_TIMEOUT_SECONDS = 10
+NOTIFY_RETRIES = 3
+
+# Local endpoint the dashboard reads CPU samples from (so viewers never scrape Node Exporter)
+SAMPLE_CHANNEL_HOST = os.getenv("AGENT_SAMPLES_HOST", "127.0.0.1")
+SAMPLE_CHANNEL_PORT = int(os.getenv("AGENT_SAMPLES_PORT", "9101"))
+SAMPLE_CHANNEL_HISTORY = 60
+# CPU history (raw/10s/1m ring buffers), memory-mapped here so the dashboard can chart it.
+# Set AGENT_TIMESERIES_DIR="" to keep it in memory only.
+TIMESERIES_DIR = os.getenv("AGENT_TIMESERIES_DIR", "timeseries") or None
+# Incident history (append-only SQLite). The legacy JSON history is imported once on startup.
+INCIDENT_STORE_FILE = "incidents.sqlite3"
 REMEDIATION_HISTORY_FILE = "remediation_history.json"
+LLM_MODEL = os.getenv("AGENT_LLM_MODEL", "gemini-2.5-flash")
+# LLM broker: at most LLM_MAX_CONCURRENT Gemini calls at once and LLM_REQUESTS_PER_MINUTE (bursts of
+# LLM_BURST) to stay within quota. A call is hedged once it is slower than the recent p95; one not answered
+# within LLM_DEADLINE_SECONDS goes to LLM_FALLBACK_MODEL (None: the local analyzers' best result stands).
+LLM_MAX_CONCURRENT = 4
+LLM_REQUESTS_PER_MINUTE = 60
+LLM_BURST = 5
+LLM_DEADLINE_SECONDS = 30
+LLM_HEDGE = True
+LLM_FALLBACK_MODEL = os.getenv("AGENT_LLM_FALLBACK_MODEL", "gemini-2.5-flash-lite") or None
+LLM_FALLBACK_DEADLINE_SECONDS = 15
+# RCA cache: entry lifetime, LRU size, max SimHash distance for near-duplicates (None = exact only)
+RCA_CACHE_FILE = "rca_cache.sqlite3"
+RCA_CACHE_TTL_SECONDS = 6 * 3600
+RCA_CACHE_MAX_ENTRIES = 1000
+RCA_CACHE_NEAR_DUPLICATE_BITS = 3
+# Analyzers run in this order; the first result at or above the threshold decides, so the
+# LLM is only called when the local rule/statistical analyzers are not confident.
+# The same threshold gates auto-remediation.
+ANALYZER_CHAIN = ("rules", "statistical", "llm")
+ANALYZER_CONFIDENCE_THRESHOLD = 80
+# Optional JSON list of extra/replacement rules (see analyzers.load_rules)
+ANALYZER_RULES_FILE = os.getenv("AGENT_RULES_FILE", "analyzer_rules.json")
 
-# Initialize the Gemini client
-try:
-    client = genai.Client()
-except Exception as e:
-    print(f"Error initializing Gemini client: {e}")
-    exit(1)
+# Structured JSON log lines on stdout (AGENT_LOG_FORMAT=text for the classic console look)
+configure_logging()
+log = get_logger("detection")
 
-# --- CORE FUNCTIONS ---
+# The Gemini client is created, and the GenAI SDK (about half a second of imports) loaded, on first use
+# or by the warm-up LLM_WARMUP_DELAY_SECONDS after startup, so monitoring starts without waiting for it
+LLM_WARMUP_DELAY_SECONDS = 5
+_llm_client = None
+_llm_client_lock = threading.Lock()
 
-def calculate_cpu_usage(metrics_data: str) -> float:
-    """
-    Calculates the total user/system CPU utilization percentage from Node Exporter data.
-    This uses the 'delta' method, simulating Prometheus rate calculation over a short period.
-    NOTE: For a true instantaneous rate, we would need two scraped points. 
-    For this POC, we'll track 'mode=idle' time over the check interval.
-    """
-    
-    # 1. Get current idle time (sum of all cores)
-    idle_time_total = 0.0
-    
-    for line in metrics_data.split('\n'):
-        if line.startswith('node_cpu_seconds_total') and 'mode="idle"' in line:
-            # Format: node_cpu_seconds_total{cpu="0",mode="idle"} 4119.35
-            try:
-                # Extract the value after the last space
-                value = float(line.split()[-1])
-                idle_time_total += value
-            except ValueError:
-                continue
-
-    # 2. Get the previous idle time (using a simple global variable for POC)
-    if not hasattr(calculate_cpu_usage, 'prev_idle_time'):
-        calculate_cpu_usage.prev_idle_time = idle_time_total
-        calculate_cpu_usage.prev_total_time = sum(float(line.split()[-1]) for line in metrics_data.split('\n') if line.startswith('node_cpu_seconds_total') and 'mode=' in line)
-        return 0.0 # Not enough data for initial calculation
-
-    # 3. Calculate time difference
-    # Total time is the sum of all mode times for all VCPUs
-    current_total_time = sum(float(line.split()[-1]) for line in metrics_data.split('\n') if line.startswith('node_cpu_seconds_total') and 'mode=' in line)
-
-    idle_delta = idle_time_total - calculate_cpu_usage.prev_idle_time
-    total_delta = current_total_time - calculate_cpu_usage.prev_total_time
-    
-    # Safety check
-    if total_delta == 0:
-        return 0.0
-        
-    # Total CPU time used by non-idle modes
-    used_cpu_delta = total_delta - idle_delta 
-    
-    # Total possible CPU time (Total VCPUs * time interval)
-    # The 'total_delta' already represents the total possible time since it sums all modes.
-    
-    # CPU Usage = (Used Time / Total Possible Time) * 100
-    # The total delta needs to be divided by the number of modes (8 modes per cpu * 2 cpus = 16)
-    # A simpler, more robust metric is (1 - (Idle Delta / Total CPU Time))
-    
-    # Calculate percentage busy time relative to the total VCPU time (NUM_VCPUS * elapsed time)
-    # total_delta is the sum of all mode times, so for 2 VCPUs, it's already 2x the wall clock time.
-    
-    # Ratio of busy time to total time available (per VCPU, then multiplied by 100)
-    cpu_usage = (1 - (idle_delta / total_delta)) * NUM_VCPUS * 100 
 
-    # 4. Update state for next check
-    calculate_cpu_usage.prev_idle_time = idle_time_total
-    calculate_cpu_usage.prev_total_time = current_total_time
-    
-    # Since we are using an approximation, limit to 100% per core.
-    return min(cpu_usage, 100.0 * NUM_VCPUS)
+def llm_configured() -> bool:
+    """An API key is set and the GenAI SDK is installed (checked without importing it)."""
+    if not (os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY")):
+        return False
+    try:
+        return importlib.util.find_spec("google.genai") is not None
+    except ModuleNotFoundError:
+        return False
+
+
+def get_llm_client():
+    """The shared Gemini client; raises if the SDK cannot be imported or the client not created."""
+    global _llm_client
+    with _llm_client_lock:
+        if _llm_client is None:
+            from google import genai
+            # The HTTP timeout ends calls the broker gave up on, so they do not hold its slots
+            _llm_client = genai.Client(http_options={"timeout": int(LLM_DEADLINE_SECONDS * 1000)})
+        return _llm_client
+
+
+# Without an LLM the agent runs degraded: local analyzers only (see build_analyzer_chain)
+LLM_AVAILABLE = llm_configured()
+
+incident_store = IncidentStore(INCIDENT_STORE_FILE)
+
+# Latest computed samples, served to dashboards
+sample_channel = SampleChannel(history=SAMPLE_CHANNEL_HISTORY)
+cpu_history = TimeSeriesStore(TIMESERIES_DIR)
 
-def get_incident_logs(spike_time: datetime) -> tuple[str, str]:
+# Repeat incidents (same log templates, target and model) reuse a cached RCA
+rca_cache = RcaCache(
+    RCA_CACHE_FILE,
+    ttl_seconds=RCA_CACHE_TTL_SECONDS,
+    max_entries=RCA_CACHE_MAX_ENTRIES,
+    near_duplicate_bits=RCA_CACHE_NEAR_DUPLICATE_BITS,
+)
+
+def build_notifier() -> NotificationDispatcher:
+    """Dispatcher with a sink per configured endpoint (SLACK_WEBHOOK_URL, AGENT_NOTIFY_WEBHOOK_URL)."""
+    sinks = []
+    if os.getenv("SLACK_WEBHOOK_URL"):
+        sinks.append(SlackSink(os.environ["SLACK_WEBHOOK_URL"], NOTIFY_COALESCE_SECONDS))
+    if os.getenv("AGENT_NOTIFY_WEBHOOK_URL"):
+        sinks.append(WebhookSink(os.environ["AGENT_NOTIFY_WEBHOOK_URL"], NOTIFY_COALESCE_SECONDS))
+    if not sinks:
+        log.warning("SLACK_WEBHOOK_URL not set. Skipping notifications.")
+    return NotificationDispatcher(
+        sinks,
+        queue_size=NOTIFY_QUEUE_SIZE,
+        coalesce_seconds=NOTIFY_COALESCE_SECONDS,
+        timeout=NOTIFY_TIMEOUT_SECONDS,
+        retries=NOTIFY_RETRIES,
+    )
+
+
+# Container CPU sources by spec, kept across incidents (cgroup file handles, cAdvisor sessions)
+container_sources: Dict[str, Union[CgroupSource, CadvisorSource]] = {}
+
+notifier = build_notifier()
+
+remediation_executor = RemediationExecutor(
+    DOCKER_ENDPOINT,
+    max_concurrent=REMEDIATION_MAX_CONCURRENT,
+    max_per_host=REMEDIATION_MAX_PER_HOST,
+    cooldown_seconds=REMEDIATION_COOLDOWN_SECONDS,
+    rate_limit=REMEDIATION_RATE_LIMIT,
+    rate_window_seconds=REMEDIATION_RATE_WINDOW_SECONDS,
+    dry_run=REMEDIATION_DRY_RUN,
+    stop_timeout=REMEDIATION_STOP_TIMEOUT_SECONDS,
+)
+
+# --- CORE FUNCTIONS ---
+
+async def get_incident_logs(spike_time: datetime,
+                            suspects: Sequence[str] = ()) -> Tuple[str, str, List[str], List[LogReducer]]:
     """
     Queries Loki for logs in the time window leading up to the spike.
-    It checks both container logs and system logs for the incident time.
-    Returns: (container_logs_str, system_logs_str)
+    It checks both container logs and system logs for the incident time, fetching
+    both jobs at once, each split into parallel time shards and paginated past
+    Loki's line limit. With LOKI_PUSHDOWN the filtering happens in Loki: container
+    logs only for the `suspects` (attributed containers) and the streams logging the
+    most errors, system logs only at warning or worse.
+    Records stream straight into a LogReducer, which collapses
+    them into ranked templates that fit the prompt's token budget, so memory is
+    flat for any window size.
+    Returns: (container_logs_str, system_logs_str, log_signature, reducers) - reduced
+    summaries, the top template texts of both jobs (used to fingerprint repeat
+    incidents) and the reducers themselves, whose templates feed the local analyzers
     """
     
     # Loki uses nanoseconds since epoch for time range
     end_time_ns = int(spike_time.timestamp() * 1e9)
     start_time_ns = int((spike_time - timedelta(seconds=LOG_WINDOW_SECONDS)).timestamp() * 1e9)
     
-    print(f"[{datetime.now().isoformat()}] Fetching logs from Loki: {spike_time - timedelta(seconds=LOG_WINDOW_SECONDS)} to {spike_time}")
-
-    def query_loki(job_label: str) -> str:
-        """Helper to execute the Loki query."""
-        loki_query = f'{{job="{job_label}"}}'
-        params = {
-            'query': loki_query,
-            'limit': 5000, # Limit the number of lines
-            'start': start_time_ns,
-            'end': end_time_ns,
-            'direction': 'forward'
-        }
+    log.info(f"Fetching logs from Loki: {spike_time - timedelta(seconds=LOG_WINDOW_SECONDS)} to {spike_time}")
+
+    async def plan(session: aiohttp.ClientSession, job_label: str, stream_label: Optional[str]) -> LogQueryPlan:
+        if not LOKI_PUSHDOWN:
+            return LogQueryPlan(job_label, [LogQuery.job(job_label)], fallback=True)
+        try:
+            with STAGE_SECONDS.time("loki_plan"):
+                return await plan_job(session, LOKI_INSTANT_URL, job_label, end_time_ns, LOG_WINDOW_SECONDS,
+                                      LOKI_LINE_FILTER, stream_label, suspects, LOKI_NOISY_STREAMS)
+        except (aiohttp.ClientError, asyncio.TimeoutError, KeyError, ValueError) as e:
+            ERRORS.inc("loki")
+            log.warning(f"Loki metric query failed for job '{job_label}' ({e!r}); pulling the whole job.")
+            return LogQueryPlan(job_label, [LogQuery.job(job_label)], fallback=True)
+
+    async def query_loki(session: aiohttp.ClientSession, job_label: str,
+                         stream_label: Optional[str] = None) -> Tuple[str, Optional[LogReducer]]:
+        """Helper to plan and execute the Loki queries and reduce the result."""
+        reducer = LogReducer(start_time_ns, end_time_ns)
+
+        async def pull(query: LogQuery):
+            async for record in stream_logs(session, LOKI_URL, query.render(), start_time_ns, end_time_ns,
+                                            shard_seconds=LOKI_SHARD_SECONDS,
+                                            max_concurrency=LOKI_MAX_CONCURRENT_QUERIES,
+                                            page_limit=LOKI_PAGE_LIMIT):
+                reducer.add(record.timestamp_ns, record.line)
         
         try:
-            response = requests.get(LOKI_URL, params=params)
-            response.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
-            data = response.json()
-            
-            log_output = []
-            if data['data']['resultType'] == 'streams':
-                for stream in data['data']['result']:
-                    for timestamp, line in stream['values']:
-                        # Convert timestamp from nanoseconds to microseconds, then seconds
-                        dt = datetime.fromtimestamp(int(timestamp) / 1e9) 
-                        log_output.append(f"[{dt.isoformat()}] {line.strip()}")
-            
-            return "\n".join(log_output)
+            query_plan = await plan(session, job_label, stream_label)
+            with STAGE_SECONDS.time("loki_query"):
+                for query in query_plan.queries:
+                    await pull(query)
+                if not reducer.total_lines and not query_plan.fallback:
+                    # The selected streams logged nothing (e.g. attribution names that are not Loki labels)
+                    query_plan.fallback = True
+                    query_plan.queries.append(LogQuery.job(job_label).filter("|~", LOKI_LINE_FILTER))
+                    await pull(query_plan.queries[-1])
+            log.info(f"Loki query plan: {query_plan.describe()}")
             
-        except requests.exceptions.RequestException as e:
-            print(f"Error querying Loki for job '{job_label}': {e}")
-            return f"Error: Could not retrieve logs from Loki for job {job_label}."
+        except (aiohttp.ClientError, asyncio.TimeoutError, ijson.JSONError) as e:
+            ERRORS.inc("loki")
+            log.error(f"Error querying Loki for job '{job_label}': {e!r}")
+            return f"Error: Could not retrieve logs from Loki for job {job_label}.", None
+
+        # Each job gets half of the prompt's log budget
+        reduced = reducer.render(LOG_TOKEN_BUDGET // 2)
+        log.info(f"Log reduction ({job_label}): {reducer.describe(reduced)}")
+        return reduced, reducer
     
-    container_logs = query_loki("containerlogs")
-    system_logs = query_loki("varlogs")
+    timeout = aiohttp.ClientTimeout(total=LOKI_TIMEOUT_SECONDS)
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        (container_logs, container_reducer), (system_logs, system_reducer) = await asyncio.gather(
+            query_loki(session, "containerlogs", LOKI_CONTAINER_LABEL),
+            query_loki(session, "varlogs"),
+        )
     
-    return container_logs, system_logs
+    reducers = [reducer for reducer in (container_reducer, system_reducer) if reducer is not None]
+    log_signature = [template for reducer in reducers for template in reducer.signature()]
+    return container_logs, system_logs, log_signature, reducers
 
 
-def analyze_logs_with_llm(logs: str) -> str:
-    """Sends the retrieved logs to the Gemini API for root cause analysis."""
+# Per incident type: (the problem, when it started, what to look for) in the RCA prompt
+RCA_PROMPT_SYMPTOMS = {
+    "cpu": ("high CPU usage", "The CPU spike started",
+            "repeating queries, memory errors, or excessive logging"),
+    "memory": ("memory pressure (available memory running out)", "Memory usage crossed the threshold",
+               "leaks, unbounded caches or queues, large allocations, OOM kills or swapping"),
+    "disk": ("disk I/O saturation", "The disk became saturated",
+             "heavy reads or writes, log floods, compactions or backups, swapping, or filesystem errors"),
+    "network": ("network errors on the node's interfaces", "The interface errors started",
+                "link or driver errors, MTU mismatches, connection resets, or packet floods"),
+    "load": ("a high load average (many runnable or blocked tasks)", "The load rose",
+             "process or thread storms, lock contention, or tasks blocked on I/O"),
+}
+
+
+def analyze_logs_with_llm(logs: str, resource: str = "cpu") -> str:
+    """Sends the retrieved logs to the Gemini API for root cause analysis of one incident type."""
+    problem, started, patterns = RCA_PROMPT_SYMPTOMS[resource]
     
     llm_prompt = f"""
-    Analyze these application and system logs to identify the possible cause of high CPU usage. 
-    The CPU spike started around the time these logs were collected. 
-    Look for patterns like repeating queries, memory errors, or excessive logging.
+    Analyze these application and system logs to identify the possible cause of {problem}. 
+    {started} around the time these logs were collected. 
+    Look for patterns like {patterns}.
+    The logs are pre-summarized: each line is one log template, most significant first, shown as
+    [first seen .. last seen] xCOUNT SEVERITY: template, where <*> marks variable parts.
     
     Provide your response in two parts:
     1. **REASON**: A clear, concise reason for the spike. Say 'UNCLEAR' if you cannot determine the cause.
@@ -166,283 +393,828 @@ def analyze_logs_with_llm(logs: str) -> str:
     --- END OF LOGS ---
     """
     
-    print(f"[{datetime.now().isoformat()}] Sending logs to Gemini for analysis...")
-    
+    log.info(f"Sending logs to Gemini for analysis ({INCIDENT_TYPES[resource]})...")
+
     try:
-        response = client.models.generate_content(
-            model='gemini-2.5-flash',
-            contents=llm_prompt,
-            # Adjust temperature for less creative, more factual analysis
-            config={"temperature": 0.1} 
-        )
-        return response.text
-    except APIError as e:
-        print(f"Gemini API Error: {e}")
+        return llm_broker.complete(llm_prompt)
+    except LlmUnavailable as e:
+        log.error(f"Gemini analysis unavailable: {e}")
         return "LLM_ERROR: Could not complete analysis due to API issue."
+
+
+def gemini_generate(prompt: str, model: str) -> str:
+    """One Gemini call (the broker's backend); raises on any failure."""
+    try:
+        client = get_llm_client()
+        with STAGE_SECONDS.time("llm"):
+            response = client.models.generate_content(
+                model=model,
+                contents=prompt,
+                # Adjust temperature for less creative, more factual analysis
+                config={"temperature": 0.1} 
+            )
+        return response.text
+    except Exception as e:
+        ERRORS.inc("llm")
+        log.error(f"Gemini API Error ({model}): {e!r}")
+        raise
+
+
+def build_llm_brokers() -> Tuple[LlmBroker, Optional[LlmBroker]]:
+    """The broker for LLM_MODEL and, when configured, the one for LLM_FALLBACK_MODEL it falls back to."""
+    fallback = None
+    if LLM_FALLBACK_MODEL and LLM_FALLBACK_MODEL != LLM_MODEL:
+        fallback = LlmBroker(
+            functools.partial(gemini_generate, model=LLM_FALLBACK_MODEL),
+            max_concurrent=LLM_MAX_CONCURRENT,
+            deadline_seconds=LLM_FALLBACK_DEADLINE_SECONDS,
+            requests_per_minute=LLM_REQUESTS_PER_MINUTE,
+            burst=LLM_BURST,
+            hedge=False,
+            name="llm_fallback",
+        )
+    broker = LlmBroker(
+        functools.partial(gemini_generate, model=LLM_MODEL),
+        max_concurrent=LLM_MAX_CONCURRENT,
+        deadline_seconds=LLM_DEADLINE_SECONDS,
+        requests_per_minute=LLM_REQUESTS_PER_MINUTE,
+        burst=LLM_BURST,
+        hedge=LLM_HEDGE,
+        fallback=fallback.complete if fallback is not None else None,
+    )
+    return broker, fallback
+
+
+llm_broker, llm_fallback_broker = build_llm_brokers()
+
+
+def build_analyzer_chain() -> AnalyzerChain:
+    """Builds the analyzers named in ANALYZER_CHAIN, in order."""
+    backends = {
+        "rules": lambda: RuleAnalyzer(load_rules(ANALYZER_RULES_FILE)),
+        "statistical": lambda: StatisticalAnalyzer(max_confidence=ANALYZER_CONFIDENCE_THRESHOLD - 1),
+        "llm": lambda: LlmAnalyzer(analyze_logs_with_llm, LLM_MODEL, rca_cache, ANALYZER_CONFIDENCE_THRESHOLD),
+    }
+    names = [name for name in ANALYZER_CHAIN if name != "llm" or LLM_AVAILABLE]
+    if len(names) < len(ANALYZER_CHAIN):
+        log.warning("No LLM available (GEMINI_API_KEY not set or google-genai not installed): running in degraded "
+                    f"mode, root cause analysis by {', '.join(names) or 'nothing'} only.")
+    return AnalyzerChain([backends[name]() for name in names], ANALYZER_CONFIDENCE_THRESHOLD)
+
+
+analyzer_chain = build_analyzer_chain()
+# Loki line filter: warning-or-worse lines, plus any line an analyzer rule could match
+LOKI_LINE_FILTER = line_filter_regex([rule.pattern for rule in load_rules(ANALYZER_RULES_FILE)])
         
         
 # detection_agent.py (Add a new function)
 def log_remediation_history(incident_data: dict):
-    """Appends the incident and remediation details to a JSON file."""
+    """Appends the incident and remediation details to the incident store (one atomic insert)."""
     try:
-        if not os.path.exists(REMEDIATION_HISTORY_FILE):
-            history = []
-        else:
-            with open(REMEDIATION_HISTORY_FILE, 'r') as f:
-                history = json.load(f)
-        
-        history.append(incident_data)
-        
-        with open(REMEDIATION_HISTORY_FILE, 'w') as f:
-            json.dump(history, f, indent=4, default=str) # Use default=str for datetime objects
-        
-        print(f"[{datetime.now().isoformat()}] History logged successfully.")
+        seq = incident_store.append(incident_data)
+        log.info(f"History logged successfully (incident #{seq}).")
     except Exception as e:
-        print(f"[{datetime.now().isoformat()}] ERROR logging history: {e}")
+        ERRORS.inc("history")
+        log.error(f"Could not log history: {e}")
         
         
-def send_slack_notification(incident_summary: str, details: str):
-    """Sends a formatted notification to the configured Slack webhook."""
-    SLACK_WEBHOOK_URL = os.getenv("SLACK_WEBHOOK_URL")
-    if not SLACK_WEBHOOK_URL:
-        print(f"[{datetime.now().isoformat()}] WARNING: SLACK_WEBHOOK_URL not set. Skipping notification.")
-        return
+async def verify_stability(target: ScrapeTarget, resource: str = "cpu") -> Tuple[StabilityResult, float]:
+    """
+    Samples the node every VERIFY_SAMPLE_INTERVAL_SECONDS right after remediation until the
+    incident's detector metric (CPU, or the resource it was about) has settled below its clear
+    level, or climbs back over its threshold (see stability.py). Uses its own rate engines,
+    primed right after the restart, so every sample is post-remediation only and the scheduler's
+    counter baseline is left alone. Returns the verdict and the last total CPU %.
+    """
+    if resource == "cpu":
+        detector = DetectorConfig.from_dict(target.detector, DETECTOR_DEFAULTS)
+        families = (CPU_SECONDS_FAMILY,)
+    else:
+        detector = resource_detector_config(target, resource)
+        families = (CPU_SECONDS_FAMILY,) + RESOURCE_FAMILIES[resource]
+    verifier = StabilityVerifier(StabilityConfig(
+        settle_below=detector.clear_below if detector.clear_below is not None else detector.threshold,
+        escalate_above=detector.threshold,
+        sample_interval=VERIFY_SAMPLE_INTERVAL_SECONDS,
+        settle_seconds=VERIFY_SETTLE_SECONDS,
+        grace_seconds=VERIFY_GRACE_SECONDS,
+        escalate_seconds=VERIFY_ESCALATE_SECONDS,
+        max_seconds=VERIFY_MAX_SECONDS,
+    ))
+    engine = CpuRateEngine()
+    resources = ResourceRateEngine()
+    total_percent = 0.0
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=SCRAPE_TIMEOUT_SECONDS)) as session:
+        start = time.monotonic()
+        next_due = start
+        while True:
+            value = None
+            try:
+                scraped = await fetch_families_async(session, target.url, families)
+                snapshot = engine.update(group_by_labels(scraped[CPU_SECONDS_FAMILY], "cpu", "mode"))
+                if resource != "cpu":
+                    value = resources.update(scraped, time.time(), engine.num_cpus).value(resource)
+                elif snapshot is not None:
+                    value = metric_value(snapshot, detector.metric)
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                ERRORS.inc("verify")
+                log.warning(f"Stability check sample failed: {e!r}", extra={"target": target.name})
+                snapshot = None
+            elapsed = time.monotonic() - start
+            if snapshot is not None:
+                total_percent = snapshot.total_percent
+            if value is not None:
+                verdict = verifier.update(elapsed, value)
+                if verdict is not None:
+                    return verifier.result(verdict), total_percent
+            elif elapsed >= VERIFY_MAX_SECONDS:
+                return verifier.result("TIMEOUT"), total_percent
+            # Fixed cadence from the start, so a slow scrape does not stretch the windows
+            next_due += VERIFY_SAMPLE_INTERVAL_SECONDS
+            await asyncio.sleep(max(0.0, next_due - time.monotonic()))
 
-    # Using the 'blocks' format for a cleaner message
-    payload = {
-        "text": f"?? DevOps AI Agent Incident: {incident_summary}",
-        "blocks": [
-            {
-                "type": "header",
-                "text": {
-                    "type": "plain_text",
-                    "text": f"?? Automated Incident Report: CPU Spike ??"
-                }
-            },
-            {
-                "type": "section",
-                "fields": [
-                    { "type": "mrkdwn", "text": f"*Time:* {datetime.now().isoformat()}" },
-                    { "type": "mrkdwn", "text": f"*Summary:* {incident_summary}" }
-                ]
-            },
-            {
-                "type": "divider"
-            },
-            {
-                "type": "section",
-                "text": {
-                    "type": "mrkdwn",
-                    "text": f"*Detailed Analysis & Action Taken:*"
-                }
-            },
-            {
-                "type": "section",
-                "text": {
-                    "type": "mrkdwn",
-                    "text": f"```{details}```"
-                }
-            }
-        ]
-    }
-    
+
+# --- INCIDENT PIPELINE STAGES ---
+
+async def attribution_stage(incident: Incident) -> bool:
+    """Stage 1: ranks the node's containers by CPU so the one actually burning it is analysed and restarted."""
+    target = incident.target
+    if not target.containers or incident.resource not in ATTRIBUTED_RESOURCES:
+        return True
+    source = container_sources.get(target.containers)
+    if source is None:
+        source = container_sources[target.containers] = make_source(target.containers)
     try:
-        response = requests.post(
-            SLACK_WEBHOOK_URL, 
-            data=json.dumps(payload),
-            headers={'Content-Type': 'application/json'}
+        with STAGE_SECONDS.time("container_cpu"):
+            before = await source.read()
+        start = time.monotonic()
+        await asyncio.sleep(ATTRIBUTION_WINDOW_SECONDS)
+        with STAGE_SECONDS.time("container_cpu"):
+            after = await source.read()
+        rates = container_rates(before, after, time.monotonic() - start)
+    except (OSError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+        ERRORS.inc("attribution")
+        log.warning(f"Container CPU attribution failed ({target.containers}): {e!r}", extra={"target": target.name})
+        return True  # falls back to the configured container
+    if isinstance(source, CgroupSource) and rates:
+        # cgroups only know container ids; Loki labels, restarts and notifications use names
+        try:
+            rates = name_containers(rates, await remediation_executor.container_names(target.docker))
+        except (DockerApiError, aiohttp.ClientError, asyncio.TimeoutError, OSError, KeyError, ValueError) as e:
+            ERRORS.inc("attribution")
+            log.warning(f"Could not name containers through the Docker API; keeping their ids: {e!r}",
+                        extra={"target": target.name})
+
+    incident.top_containers = [(name, round(percent, 1)) for name, percent in top_containers(rates, ATTRIBUTION_TOP_N)
+                               if percent >= 0.1]
+    busiest = ", ".join(f"{name} {percent:.1f}%" for name, percent in incident.top_containers) or "none"
+    log.info(f"Busiest containers ({len(rates)} measured): {busiest}",
+             extra={"target": target.name, "top_containers": incident.top_containers})
+    return True
+
+
+def log_suspects(incident: Incident) -> List[str]:
+    """Containers whose full logs are pulled: the attributed ones, else the target's configured container."""
+    suspects = [name for name, percent in incident.top_containers if percent >= ATTRIBUTION_MIN_PERCENT]
+    return suspects or [incident.target.container or TARGET_CONTAINER_NAME]
+
+
+async def fetch_logs_stage(incident: Incident) -> bool:
+    """Stage 2: waits out Promtail/Loki ingestion (without blocking), then pulls the logs."""
+    target = incident.target
+    remaining = LOG_INGESTION_DELAY_SECONDS - (datetime.now() - incident.detected_at).total_seconds()
+    if remaining > 0:
+        log.info(f"Waiting {remaining:.1f}s for Promtail/Loki ingestion...", extra={"target": target.name})
+        await asyncio.sleep(remaining)
+
+    # Query up to now, i.e. AFTER the ingestion delay
+    spike_time = datetime.now()
+    (incident.container_logs, incident.system_logs,
+     incident.log_signature, incident.log_reducers) = await get_incident_logs(spike_time, log_suspects(incident))
+    return True
+
+
+def analysis_stage(incident: Incident) -> bool:
+    """Stage 3: root cause analysis (local analyzers, then LLM). Stops the incident if confidence is too low."""
+    target = incident.target
+
+    if incident.resource not in ATTRIBUTED_RESOURCES:
+        incident.remediation_action = ""  # notify-only, see ATTRIBUTED_RESOURCES
+        busiest = None
+    else:
+        incident.remediation_action = "docker restart"
+        busiest = incident.top_containers[0] if incident.top_containers else None
+    if busiest is not None and is_pod_container(busiest[0]):
+        log.warning(f"Busiest container {busiest[0]} is a Kubernetes pod container, not a Docker container; "
+                    f"not restarting it", extra={"target": target.name})
+        busiest = None
+    if busiest is not None and busiest[1] >= ATTRIBUTION_MIN_PERCENT:
+        # The container measured burning the most CPU during the spike
+        incident.remediation_target = busiest[0]
+        log.info(f"Identified Cause Source (Attribution): CONTAINER ({busiest[0]}, {busiest[1]:.1f}% CPU)",
+                 extra={"target": target.name})
+    elif incident.remediation_action:
+        # ? NEW: Default remediation assumption (the target's configured container)
+        incident.remediation_target = target.container or TARGET_CONTAINER_NAME
+        log.info(f"Identified Cause Source (Heuristic): CONTAINER ({incident.remediation_target})", extra={"target": target.name})
+
+    # ? NEW: Additional subtle heuristic
+    if len(incident.container_logs) < 100:
+        log.warning("Container logs are minimal. Analyzing full logs.", extra={"target": target.name})
+        # We still allow the analyzers to decide root cause
+
+    # 4. Analysis: rules -> statistical -> LLM, stopping at the first confident result
+    result = analyzer_chain.analyze(AnalysisInput(
+        target_name=target.name,
+        container_logs=incident.container_logs,
+        system_logs=incident.system_logs,
+        log_signature=incident.log_signature,
+        reducers=incident.log_reducers,
+        snapshot=incident.snapshot,
+        top_containers=incident.top_containers,
+        resource=incident.resource,
+    ))
+    incident.analysis = result
+    incident.root_cause = result.reason
+    incident.confidence = result.confidence
+    incident.llm_response_text = result.raw_text
+    incident.rca_cached = result.cached
+    # The reducers are only needed by the analyzers; free their templates now
+    incident.log_reducers = []
+
+    consulted = ", ".join(f"{name}={'-' if conf is None else conf} ({ms:.1f}ms)" for name, conf, ms in result.trace)
+    RCA_CONFIDENCE.observe(result.confidence, result.analyzer)
+    log.info(f"Analysis Result ({result.analyzer}, {result.elapsed_ms:.1f}ms; {consulted}): "
+             f"Root Cause: {incident.root_cause} | Confidence: {incident.confidence}%",
+             extra={"target": target.name, "analyzer": result.analyzer, "root_cause": incident.root_cause,
+                    "confidence": incident.confidence, "evidence": result.evidence[:3]})
+
+    # 5. Auto Remediation Logic
+    if incident.resource not in ATTRIBUTED_RESOURCES:
+        REMEDIATIONS_SKIPPED.inc("not_actionable")
+        log.info(f"SKIPPING REMEDIATION: a container restart does not fix {INCIDENT_TYPES[incident.resource]}; "
+                 f"notifying only.", extra={"target": target.name})
+        incident.status = "SKIPPED"
+        return True  # passes through remediation and verification untouched, to be notified
+    if not incident.remediation_action:
+        REMEDIATIONS_SKIPPED.inc("no_action")
+        log.info("SKIPPING REMEDIATION: No remediation action selected.", extra={"target": target.name})
+        incident.status = "SKIPPED"
+        return False
+    if not result.actionable:
+        REMEDIATIONS_SKIPPED.inc("not_actionable")
+        log.info("SKIPPING REMEDIATION: Cause is outside the container; a restart would not help.", extra={"target": target.name})
+        incident.status = "SKIPPED"
+        return False
+    if incident.confidence < ANALYZER_CONFIDENCE_THRESHOLD:
+        REMEDIATIONS_SKIPPED.inc("low_confidence")
+        log.info(f"SKIPPING REMEDIATION: Analysis confidence ({incident.confidence}%) too low.", extra={"target": target.name})
+        incident.status = "SKIPPED"
+        return False
+    return True
+
+
+async def confirm_stage(incident: Incident) -> bool:
+    """Stage 4: holds a pre-incident until its spike is detected (or it proves a false alarm); others pass."""
+    warning = incident.warning
+    if warning is None or incident.confirmation is None:
+        return True
+    target = incident.target
+    detector = DetectorConfig.from_dict(target.detector, DETECTOR_DEFAULTS)
+    deadline = warning.breach_at + detector.sustain_seconds + FORECAST_CONFIRM_GRACE_SECONDS
+    if not incident.confirmation.is_set():
+        try:
+            await asyncio.wait_for(incident.confirmation.wait(), max(0.0, deadline - time.time()))
+        except asyncio.TimeoutError:
+            incident.status = "FALSE_ALARM"
+            log.info(f"EARLY WARNING NOT CONFIRMED: no spike detected {deadline - warning.breach_at:.0f}s past the "
+                     f"projected breach. Nothing restarted.", extra={"target": target.name})
+            return False
+    log.info(f"Forecast spike confirmed {incident.detected_at.timestamp() - warning.timestamp:.0f}s after the "
+             f"early warning; going straight to remediation.", extra={"target": target.name})
+    return True
+
+
+async def remediation_stage(incident: Incident) -> bool:
+    """Stage 5: restarts the container (or unit) through the remediation executor."""
+    target = incident.target
+    if not incident.remediation_action:
+        return True  # notify-only incident (see analysis_stage)
+    log.info(f"--- REMEDIATION ACTION: {incident.remediation_action} on {incident.remediation_target} ---",
+             extra={"target": target.name})
+    outcome = await remediation_executor.execute(RemediationRequest(
+        target.name, incident.remediation_target, incident.remediation_action, target.docker,
+    ))
+    incident.remediation_outcome = outcome
+    REMEDIATIONS.inc(outcome.backend or "none", outcome.status)
+    extra = {"target": target.name, "backend": outcome.backend, "elapsed": round(outcome.elapsed, 3)}
+
+    if outcome.status == "SKIPPED":
+        REMEDIATIONS_SKIPPED.inc(outcome.reason)
+        log.info(f"SKIPPING REMEDIATION: {outcome.detail}", extra=extra)
+        incident.status = "SKIPPED"
+        return False
+    if outcome.status == "DRY_RUN":
+        log.info(f"DRY RUN: {outcome.detail}", extra=extra)
+        incident.status = "DRY_RUN"
+        return True  # still notified, so the dry run shows what would have happened
+    if outcome.status != "SUCCESS":
+        ERRORS.inc("remediation")
+        log.error(f"REMEDIATION FAILED. Error:\n{outcome.detail}", extra=extra)
+        incident.status = "FAILED"
+        return False
+    log.info(f"Remediation successful{' (joined a restart in flight)' if outcome.joined else ''}. "
+             f"Output:\n{outcome.detail}", extra=extra)
+    incident.status = "SUCCESS"
+    return True
+
+
+async def verify_stage(incident: Incident) -> bool:
+    """Stage 6: post-remediation stability check on the incident's node; escalates if CPU climbs back."""
+    if incident.status in ("DRY_RUN", "SKIPPED"):
+        return True  # nothing was restarted
+    target = incident.target
+    result, incident.post_remediation_cpu = await verify_stability(target, incident.resource)
+    incident.stability = result
+    extra = {"target": target.name, "verify_status": result.status, "verify_seconds": round(result.elapsed, 2)}
+    if result.status == "STABLE":
+        log.info(f"STABILITY VERIFIED after {result.elapsed:.1f}s: CPU usage is now "
+                 f"{incident.post_remediation_cpu:.2f}%, below threshold.", extra=extra)
+    elif result.status == "UNSTABLE":
+        incident.status = "UNSTABLE"
+        log.warning(f"STABILITY ISSUE: CPU is back at {incident.post_remediation_cpu:.2f}% "
+                    f"{result.elapsed:.1f}s after remediation. Manual review needed.", extra=extra)
+    else:
+        log.warning(f"STABILITY UNCONFIRMED: CPU did not settle within {result.elapsed:.0f}s "
+                    f"(now {incident.post_remediation_cpu:.2f}%). Manual review may be needed.", extra=extra)
+    return True
+
+
+async def notify_stage(incident: Incident) -> bool:
+    """Stage 7: queues the notification (delivered by the dispatcher) and records the remediation history."""
+    post_remediation_cpu = incident.post_remediation_cpu or 0.0
+    verb = "would be restarted (dry run)" if incident.status == "DRY_RUN" else "restarted"
+    if incident.remediation_action:
+        incident_summary = (
+            f"Container '{incident.remediation_target}' {verb} due to {INCIDENT_TYPES[incident.resource]}. "
+            f"RCA Confidence: {incident.confidence}%."
         )
-        response.raise_for_status()
-        print(f"[{datetime.now().isoformat()}] ? Slack notification sent successfully.")
-    except requests.exceptions.RequestException as e:
-        print(f"[{datetime.now().isoformat()}] ERROR sending Slack notification: {e}")
-        
-    
+    else:
+        incident_summary = (
+            f"{INCIDENT_TYPES[incident.resource].capitalize()} on {incident.target.name}; nothing restarted "
+            f"(a container restart does not fix it). RCA Confidence: {incident.confidence}%."
+        )
+    stability = incident.stability
+    if stability is not None and stability.status == "UNSTABLE":
+        incident_summary += " CPU climbed back after the restart: manual review needed."
+
+    details_text = (
+        f"Root Cause: {incident.root_cause}\n"
+        f"Analyzer: {incident.analysis.analyzer if incident.analysis else 'none'}\n"
+        f"Action: {incident.remediation_action}\n"
+        f"Status: {incident.status}\n"
+        f"Post-Remediation CPU: {post_remediation_cpu:.2f}%\n"
+        f"Verification: {f'{stability.status} after {stability.elapsed:.1f}s' if stability else 'n/a'}\n"
+        f"LLM Response:\n{incident.llm_response_text or 'n/a (decided locally)'}"
+    )
+
+    notifier.submit(Notification(incident_summary, details_text, incident.target.name, incident.status,
+                                 INCIDENT_TYPES[incident.resource]))
+
+    # NEW: Log the complete history of the event
+    incident_data = {
+        "timestamp": datetime.now(),
+        "node": incident.target.name,
+        "status": incident.status,
+        "resource": incident.resource,
+        "cpu_peak": post_remediation_cpu, # Use the lowest value post-remediation
+        "root_cause": incident.root_cause,
+        "confidence": incident.confidence,
+        "analyzer": incident.analysis.analyzer if incident.analysis else "none",
+        "action": incident.remediation_action,
+        "target": incident.remediation_target,
+        "top_containers": incident.top_containers,
+        "summary": incident_summary,
+        # Convergence curve: (seconds after remediation, detector metric) per verification sample
+        "verification": {"status": stability.status, "seconds": round(stability.elapsed, 2),
+                         "curve": stability.curve} if stability else None,
+    }
+    await asyncio.to_thread(log_remediation_history, incident_data)
+    return True
 
-def remediate(tool_target: str, action: str, root_cause: str, remediation_confidence: int, llm_response_text: str):
+
+# --- MAIN LOOP ---
+
+def build_detectors(targets: List[ScrapeTarget]) -> Dict[str, SpikeDetector]:
+    """One detector per target: DETECTOR_DEFAULTS overlaid with the target's own settings."""
+    return {
+        target.name: SpikeDetector(DetectorConfig.from_dict(target.detector, DETECTOR_DEFAULTS))
+        for target in targets
+    }
+
+
+def resource_detector_config(target: ScrapeTarget, resource: str) -> Optional[DetectorConfig]:
     """
-    Executes the remediation action (e.g., docker restart or systemctl restart),
-    verifies stability, and sends a Slack notification.
+    RESOURCE_DETECTOR_DEFAULTS for `resource` overlaid with the target's "resources" entry;
+    None when the resource is not detected on this target.
     """
-    print(f"[{datetime.now().isoformat()}] --- REMEDIATION ACTION: {action} on {tool_target} ---")
+    if resource in target.resources:
+        if target.resources[resource] is None:
+            return None
+    elif resource not in RESOURCE_DETECTORS:
+        return None
+    return DetectorConfig.from_dict(target.resources.get(resource), RESOURCE_DETECTOR_DEFAULTS[resource])
 
-    # Build command
-    if action == "docker restart":
-        command = ["docker", "restart", tool_target]
-    elif action == "systemctl restart":
-        command = ["sudo", "systemctl", "restart", tool_target]
-    else:
-        print(f"[{datetime.now().isoformat()}] ERROR: Unknown remediation action: {action}")
+
+def build_resource_detectors(targets: List[ScrapeTarget]) -> Dict[str, Dict[str, SpikeDetector]]:
+    """Per target: one detector per resource detected on it (see RESOURCE_DETECTORS)."""
+    detectors = {}
+    for target in targets:
+        unknown = set(target.resources) - set(RESOURCES)
+        if unknown:
+            raise ValueError(f"Unknown resources for {target.name}: {', '.join(sorted(unknown))} "
+                             f"(expected {', '.join(RESOURCES)})")
+        detectors[target.name] = {}
+        for resource in RESOURCES:
+            config = resource_detector_config(target, resource)
+            if config is not None:
+                detectors[target.name][resource] = SpikeDetector(config)
+    return detectors
+
+
+def build_forecasters(targets: List[ScrapeTarget]) -> Dict[str, BreachForecaster]:
+    """Early warning for the targets whose detector settings have a forecast horizon."""
+    forecasters = {}
+    for target in targets:
+        config = DetectorConfig.from_dict(target.detector, DETECTOR_DEFAULTS)
+        if config.forecast_horizon_seconds is not None:
+            forecasters[target.name] = BreachForecaster(config)
+    return forecasters
+
+
+def detect_resource_incidents(pipeline: IncidentPipeline, detectors: Dict[str, SpikeDetector], state: TargetState,
+                              sample_time: datetime, snapshot: CpuSnapshot):
+    """Memory, disk, network and load detection on the readings parsed from the same scrape."""
+    resources = state.last_resources
+    if resources is None:
+        return
+    target = state.target
+    for resource, detector in detectors.items():
+        value = resources.value(resource)
+        if value is None:
+            continue  # counters still priming, or the exporter's collector is off
+        with STAGE_SECONDS.time("detect"):
+            detection = detector.update(sample_time.timestamp(), value)
+        if detection is None:
+            continue
+        RESOURCE_DETECTIONS.inc(target.name, resource)
+        log.warning(f"!!! {INCIDENT_TYPES[resource].upper()} DETECTED: {resources.describe(resource)} "
+                    f"(for {detection.timestamp - detection.onset:.0f}s: {detection.reason}) !!!",
+                    extra={"target": target.name, "resource": resource})
+        incident = Incident(target, sample_time, snapshot.total_percent, snapshot, resource=resource,
+                            resource_value=value)
+        if not pipeline.submit(incident) and incident.key in pipeline.in_flight:
+            log.info(f"Incident for {INCIDENT_TYPES[resource]} already in progress for this target; not queued again.",
+                     extra={"target": target.name})
+
+
+async def on_cpu_sample(pipeline: IncidentPipeline, detectors: Dict[str, SpikeDetector],
+                        forecasters: Dict[str, BreachForecaster],
+                        resource_detectors: Dict[str, Dict[str, SpikeDetector]], state: TargetState,
+                        snapshot: Optional[CpuSnapshot]):
+    """
+    Scheduler callback: spike detection (and early warning) for one scraped target, then the
+    resource detectors on the same scrape. Never blocks on RCA.
+    """
+    target = state.target
+    sample_time = datetime.now()
+    detector = detectors[target.name]
+    forecaster = forecasters.get(target.name)
+
+    # 1. Node Exporter was scraped by the scheduler; the first sample only primes the counters
+    if snapshot is None:
+        log.info(f"CPU counter baseline established ({state.engine.num_cpus} VCPUs). Continuing...", extra={"target": target.name})
         return
+    current_cpu_percent = snapshot.total_percent
+    value = metric_value(snapshot, detector.config.metric)
+    warning = None
+    with STAGE_SECONDS.time("detect"):
+        detection = detector.update(sample_time.timestamp(), value)
+        if forecaster is not None:
+            warning = forecaster.update(sample_time.timestamp(), value, detector)
+    detector_state = detector.state()
+    if forecaster is not None:
+        detector_state.update(forecaster.state())
+    sample_channel.publish(target.name, snapshot, sample_time.timestamp(), detector_state)
+    cpu_history.append(cpu_total_series(target.name), sample_time.timestamp(), current_cpu_percent)
+
+    resources = state.last_resources.breakdown() if state.last_resources is not None else ""
+    log.info(f"Current Total CPU Usage: {current_cpu_percent:.2f}% ({snapshot.breakdown()})" +
+             (f" | {resources}" if resources else ""),
+             extra={"target": target.name, "cpu_percent": round(current_cpu_percent, 2)})
+    if snapshot.reset_cores:
+        log.warning(f"Counter reset on cpu {', '.join(snapshot.reset_cores)}; excluded from this sample.", extra={"target": target.name})
+
+    # 2. Spike Detection Logic (sustained, baseline-aware, with hysteresis; see detectors.py)
+    if detection is not None:
+        SPIKES_DETECTED.inc(target.name)
+        log.warning(f"!!! HIGH CPU SPIKE DETECTED: {current_cpu_percent:.2f}% "
+                    f"(anomalous for {detection.timestamp - detection.onset:.0f}s: {detection.reason}) !!!",
+                    extra={"target": target.name, "cpu_percent": round(current_cpu_percent, 2)})
+        predicted = pipeline.confirm(target.name)
+        if predicted is not None:
+            predicted.detected_at, predicted.cpu_percent, predicted.snapshot = sample_time, current_cpu_percent, snapshot
+            log.info(f"Spike was forecast {sample_time.timestamp() - predicted.warning.timestamp:.0f}s ago; "
+                     f"its RCA is already under way.", extra={"target": target.name})
+        elif not pipeline.submit(Incident(target, sample_time, current_cpu_percent, snapshot)) and target.name in pipeline.in_flight:
+            log.info("Incident already in progress for this target; not queued again.", extra={"target": target.name})
+    elif warning is not None:
+        BREACH_WARNINGS.inc(target.name)
+        log.warning(f"CPU PROJECTED TO BREACH {warning.threshold:g} in {warning.breach_in:.0f}s ({warning.reason}); "
+                    f"starting RCA ahead of the spike.",
+                    extra={"target": target.name, "cpu_percent": round(current_cpu_percent, 2)})
+        pipeline.submit(Incident(target, sample_time, current_cpu_percent, snapshot, status="PREDICTED",
+                                 warning=warning, confirmation=asyncio.Event()))
+    elif detector.firing:
+        log.info(f"CPU spike ongoing (already detected). Waiting for it to clear below {detector.clear_below:g}.", extra={"target": target.name})
+    elif detector.pending:
+        log.info(f"CPU above threshold for {sample_time.timestamp() - detector.anomalous_since:.0f}s "
+                 f"({detector.last_reason}); waiting {detector.config.sustain_seconds:g}s before acting.", extra={"target": target.name})
+    else:
+        log.info(f"CPU usage nominal ({detector.last_reason}). Continuing...", extra={"target": target.name})
 
+    if resource_detectors.get(target.name):
+        detect_resource_incidents(pipeline, resource_detectors[target.name], state, sample_time, snapshot)
+
+
+async def report_pipeline_metrics(pipeline: IncidentPipeline):
+    """Logs incident queue depth and stage latency while there is incident activity."""
+    last_completed = -1
+    while True:
+        await asyncio.sleep(PIPELINE_METRICS_INTERVAL_SECONDS)
+        if pipeline.in_flight or pipeline.completed != last_completed:
+            last_completed = pipeline.completed
+            log.info(f"Incident pipeline: {pipeline.format_metrics()}")
+            cache = rca_cache.stats()
+            log.info(f"RCA cache: hits={cache['hits']} near={cache['near_hits']} "
+                     f"misses={cache['misses']} avg_lookup={cache['avg_lookup_ms']:.2f}ms")
+            log.info(f"Analyzer decisions: {analyzer_chain.format_stats()}")
+            if "llm" in analyzer_chain.decisions:
+                log.info(f"LLM broker: {llm_broker.format_stats()}")
+
+
+def register_runtime_metrics(pipeline: IncidentPipeline, scheduler: ScrapeScheduler):
+    """Exposes state the agent already keeps (queues, scrape and cache counters) on /metrics."""
+    REGISTRY.gauge("agent_targets", "Monitored Node Exporter targets.", lambda: len(scheduler.states))
+    REGISTRY.gauge("agent_scrapes_total", "Successful scrapes.", lambda: scheduler.scrape_count, kind="counter")
+    REGISTRY.gauge("agent_incidents_in_flight", "Incidents somewhere in the pipeline.", lambda: len(pipeline.in_flight))
+    REGISTRY.gauge("agent_incident_queue_depth", "Incidents waiting per pipeline stage.",
+                   lambda: {(stage.name,): stage.queue.qsize() for stage in pipeline.stages}, ("stage",))
+    REGISTRY.gauge("agent_incidents_deduplicated_total", "Detections not queued: incident already in flight.",
+                   lambda: pipeline.deduplicated, kind="counter")
+    REGISTRY.gauge("agent_incidents_dropped_total", "Detections not queued: incident queue full.",
+                   lambda: pipeline.dropped, kind="counter")
+    REGISTRY.gauge("agent_notification_queue_depth", "Notifications waiting for the dispatcher.",
+                   lambda: notifier.pending())
+    REGISTRY.gauge("agent_llm_available", "1 when an LLM analyzer is configured, 0 in degraded mode.",
+                   lambda: int(LLM_AVAILABLE and "llm" in ANALYZER_CHAIN))
+
+    brokers = [broker for broker in (llm_broker, llm_fallback_broker) if broker is not None]
+    REGISTRY.gauge("agent_llm_calls_total", "LLM broker calls by broker and outcome (" + ", ".join(LLM_OUTCOMES) + ").",
+                   lambda: {(broker.name, outcome): broker.counts[outcome] for broker in brokers
+                            for outcome in LLM_OUTCOMES}, ("broker", "outcome"), kind="counter")
+    REGISTRY.gauge("agent_llm_in_flight", "LLM backend calls running, including abandoned ones still holding a slot.",
+                   lambda: {(broker.name,): broker.in_flight() for broker in brokers}, ("broker",))
+
+    def cache_lookups():
+        stats = rca_cache.stats()
+        return {("hit",): stats["hits"], ("near_hit",): stats["near_hits"], ("miss",): stats["misses"]}
+
+    REGISTRY.gauge("agent_rca_cache_lookups_total", "RCA cache lookups by result.", cache_lookups, ("result",),
+                   kind="counter")
+
+
+async def warm_up_llm():
+    """Loads the GenAI SDK and creates the client off the event loop once monitoring is running."""
+    await asyncio.sleep(LLM_WARMUP_DELAY_SECONDS)
     try:
-        # Execute the command
-        result = subprocess.run(command, check=True, capture_output=True, text=True)
-        print(f"[{datetime.now().isoformat()}] Remediation successful. Output:\n{result.stdout.strip()}")
+        with STAGE_SECONDS.time("llm_init"):
+            await asyncio.to_thread(get_llm_client)
+    except Exception as e:
+        ERRORS.inc("llm")
+        log.warning(f"Gemini client unavailable ({e!r}); LLM analysis will fail until it can be created.")
 
-        # 4. Verify System Stability Post-Remediation
-        post_remediation_cpu = verify_stability()  # Returns current CPU% after waiting
 
-        # 5. Prepare and Send Notification
-        incident_summary = (
-            f"Container '{tool_target}' restarted due to CPU spike. "
-            f"RCA Confidence: {remediation_confidence}%."
-        )
+def assign_shard(scheduler: ScrapeScheduler, targets: List[ScrapeTarget]):
+    """ShardCoordinator callback: scrape this worker's share; targets that moved away leave its sample channel."""
+    added, removed = scheduler.set_targets(targets)
+    for name in removed:
+        sample_channel.drop(name)
+    if added or removed:
+        log.info(f"Shard rebalanced: +{len(added)} / -{len(removed)} target(s), now monitoring {len(scheduler.states)}")
 
-        details_text = (
-            f"Root Cause: {root_cause}\n"
-            f"Action: {action}\n"
-            f"Status: SUCCESS\n"
-            f"Post-Remediation CPU: {post_remediation_cpu:.2f}%\n"
-            f"LLM Response:\n{llm_response_text}"
-        )
 
-        send_slack_notification(incident_summary, details_text)
-        
-        # NEW: Log the complete history of the event
-        incident_data = {
-            "timestamp": datetime.now(),
-            "status": "SUCCESS",
-            "cpu_peak": post_remediation_cpu, # Use the lowest value post-remediation
-            "root_cause": root_cause,
-            "confidence": remediation_confidence,
-            "action": action,
-            "target": tool_target,
-            "summary": incident_summary
-        }
-        log_remediation_history(incident_data)
-        
+async def run_agent(targets: List[ScrapeTarget], detectors: Dict[str, SpikeDetector],
+                    forecasters: Dict[str, BreachForecaster],
+                    resource_detectors: Dict[str, Dict[str, SpikeDetector]],
+                    shard: Optional[ShardMembership] = None):
+    """
+    Runs the scrape scheduler and the incident pipeline side by side. With `shard`, this
+    process is one shard worker: it scrapes only its share of `targets` (see sharding.py).
+    """
+    pipeline = IncidentPipeline(
+        {
+            "attribution": attribution_stage,
+            "log_fetch": fetch_logs_stage,
+            "analysis": analysis_stage,
+            "confirm": confirm_stage,
+            "remediation": remediation_stage,
+            "verify": verify_stage,
+            "notify": notify_stage,
+        },
+        queue_size=INCIDENT_QUEUE_SIZE,
+        workers=INCIDENT_STAGE_WORKERS,
+    )
+    pipeline.start()
+    notifier.start()
+    reporter = asyncio.create_task(report_pipeline_metrics(pipeline))
+    warmup = asyncio.create_task(warm_up_llm()) if LLM_AVAILABLE and "llm" in ANALYZER_CHAIN else None
 
-    except subprocess.CalledProcessError as e:
-        print(f"[{datetime.now().isoformat()}] REMEDIATION FAILED. Error:\n{e.stderr.strip()}")
+    scheduler = ScrapeScheduler(
+        targets if shard is None else [],  # a shard worker learns its share on its first heartbeat
+        functools.partial(on_cpu_sample, pipeline, detectors, forecasters, resource_detectors),
+        max_concurrency=MAX_CONCURRENT_SCRAPES,
+        timeout=SCRAPE_TIMEOUT_SECONDS,
+        jitter=SCRAPE_JITTER,
+        resources=any(resource_detectors.values()),
+    )
+    register_runtime_metrics(pipeline, scheduler)
 
-    except FileNotFoundError:
-        print(f"[{datetime.now().isoformat()}] ERROR: Command not found. Is Docker/systemctl installed?")
-        
-        
-def verify_stability() -> float:
-    """Waits and checks CPU usage again after remediation."""
-    print(f"[{datetime.now().isoformat()}] Waiting {CHECK_INTERVAL_SECONDS * 2} seconds for stability check...")
-    time.sleep(CHECK_INTERVAL_SECONDS * 2)
+    # The agent's own /metrics is served next to the dashboard's /samples. Shard workers serve theirs on
+    # a free port; the leader's aggregate view takes SAMPLE_CHANNEL_PORT.
+    app = make_app(sample_channel)
+    app.router.add_get("/metrics", REGISTRY.handle_metrics)
+    samples_url = ""
+    try:
+        sample_server = await start_server(app, SAMPLE_CHANNEL_HOST, SAMPLE_CHANNEL_PORT if shard is None else 0)
+        host, port = sample_server.addresses[0][:2]
+        samples_url = f"http://{host}:{port}/samples"
+        log.info(f"Serving samples for the dashboard and agent metrics on {samples_url} and /metrics")
+    except OSError as e:
+        sample_server = None
+        log.warning(f"Could not start the sample channel ({e}); dashboards will show no live CPU and /metrics is unavailable.")
 
+    coordinator = coordinating = None
+    stop_coordinating = asyncio.Event()
+    if shard is not None:
+        # Restarts are recorded in the lease file, so the cooldown and rate limit hold across the workers
+        remediation_executor.ledger = shard
+        coordinator = ShardCoordinator(shard, targets, functools.partial(assign_shard, scheduler), samples_url,
+                                       SAMPLE_CHANNEL_HOST, SAMPLE_CHANNEL_PORT, SHARD_HEARTBEAT_SECONDS)
+        REGISTRY.gauge("agent_shard_workers", "Live shard workers, as seen by this worker.",
+                       lambda: len(coordinator.view.workers))
+        REGISTRY.gauge("agent_shard_leader", "1 when this worker serves the aggregate view.",
+                       lambda: int(coordinator.leading))
+        REGISTRY.gauge("agent_shard_rebalances_total", "Target reassignments on this worker.",
+                       lambda: coordinator.rebalances, kind="counter")
+        coordinating = asyncio.create_task(coordinator.run(stop_coordinating))
     try:
-        response = requests.get(NODE_EXPORTER_URL)
-        metrics_data = response.text
-        current_cpu = calculate_cpu_usage(metrics_data)
+        await scheduler.run()
+    finally:
+        if coordinating is not None:
+            stop_coordinating.set()
+            await asyncio.gather(coordinating, return_exceptions=True)
+        reporter.cancel()
+        if warmup is not None:
+            warmup.cancel()
+        await pipeline.stop()
+        if shard is not None:
+            shard.close()  # after the pipeline: its remediations use the restart ledger
+        await remediation_executor.close()
+        await notifier.close()
+        llm_broker.close()
+        if llm_fallback_broker is not None:
+            llm_fallback_broker.close()
+        for source in container_sources.values():
+            await source.close()
+        if sample_server is not None:
+            await sample_server.cleanup()
+        cpu_history.flush()
 
-        # Stability threshold = 50% of the detection threshold
-        stability_threshold = CPU_THRESHOLD_PERCENT * NUM_VCPUS * 0.5
 
-        if current_cpu < stability_threshold:
-            print(f"[{datetime.now().isoformat()}] STABILITY VERIFIED: CPU usage is now {current_cpu:.2f}%, below threshold.")
-        else:
-            print(f"[{datetime.now().isoformat()}] STABILITY ISSUE: CPU is still high at {current_cpu:.2f}%. Manual review may be needed.")
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt
 
-        return current_cpu  # Important: we return the CPU value so remediation summary is correct
 
-    except Exception as e:
-        print(f"[{datetime.now().isoformat()}] Error during stability check: {e}")
-        return 0.0
+def run_shard_worker(worker: str):
+    """Entry point of a shard worker process (a fresh interpreter, see run_shard_supervisor)."""
+    # Ctrl+C reaches the supervisor, which stops each worker once with SIGTERM; handled like Ctrl+C, so the
+    # worker gives its lease back instead of letting it expire
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, _interrupt)
+    run_detection_loop(worker)
 
 
+def run_shard_supervisor(workers: int):
+    """
+    Runs `workers` shard worker processes and restarts any that dies. A worker keeps
+    its id across restarts, so one back within SHARD_LEASE_SECONDS gets the same
+    targets back and nothing moves; the others cover its targets until then.
+    """
+    # spawn, not fork: each worker opens its own SQLite handles, sockets and event loop
+    context = multiprocessing.get_context("spawn")
+    prefix = f"{socket.gethostname()}-{os.getpid()}"
+    processes: Dict[str, multiprocessing.Process] = {}
 
-# --- MAIN LOOP ---
+    def start(worker: str):
+        process = context.Process(target=run_shard_worker, args=(worker,), name=f"shard-{worker}")
+        process.start()
+        processes[worker] = process
 
-def run_detection_loop():
-    """Main function to continuously monitor and act."""
-    print(f"[{datetime.now().isoformat()}] Starting CPU Spike Detection Agent. Monitoring...")
-    print(f"[{datetime.now().isoformat()}] Threshold: {CPU_THRESHOLD_PERCENT}% of total VCPU capacity ({NUM_VCPUS} VCPUs)")
+    signal.signal(signal.SIGTERM, _interrupt)
+    for n in range(workers):
+        start(f"{prefix}/{n}")
+    log.info(f"Started {workers} shard workers (leases in {SHARD_LEASE_FILE}); the leader serves the aggregate "
+             f"view on http://{SAMPLE_CHANNEL_HOST}:{SAMPLE_CHANNEL_PORT}/samples")
+    try:
+        while True:
+            time.sleep(SHARD_RESTART_DELAY_SECONDS)
+            for worker, process in list(processes.items()):
+                if not process.is_alive():
+                    ERRORS.inc("shard")
+                    log.error(f"Shard worker {worker} exited (code {process.exitcode}); restarting it.")
+                    start(worker)
+    except KeyboardInterrupt:
+        log.info("Stopping shard workers...")
+    finally:
+        for process in processes.values():
+            if process.is_alive():
+                process.terminate()
+        for process in processes.values():
+            process.join(SHARD_LEASE_SECONDS)
+            if process.is_alive():
+                process.kill()
 
-    while True:
-        spike_detected = False
-        spike_time = datetime.now()
 
+def run_detection_loop(worker: Optional[str] = None):
+    """
+    Main function to continuously monitor and act on every configured target. With
+    SHARD_WORKERS it supervises that many shard workers instead, each of which runs
+    this with its `worker` id.
+    """
+    targets = load_targets(TARGETS_FILE, NODE_EXPORTER_URL, CHECK_INTERVAL_SECONDS, TARGET_CONTAINER_NAME,
+                           CONTAINER_METRICS)
+
+    if worker is None:
         try:
-            # 1. Scrape Node Exporter Metrics
-            response = requests.get(NODE_EXPORTER_URL)
-            metrics_data = response.text
-            current_cpu_percent = calculate_cpu_usage(metrics_data)
-
-            print(f"[{spike_time.isoformat()}] Current Total CPU Usage: {current_cpu_percent:.2f}%")
-
-            # 2. Spike Detection Logic
-            if current_cpu_percent > CPU_THRESHOLD_PERCENT:
-                spike_detected = True
-                print(f"[{spike_time.isoformat()}] !!! HIGH CPU SPIKE DETECTED: {current_cpu_percent:.2f}% !!!")
-
-                # ? NEW: Add ingestion delay before retrieving logs
-                LOG_INGESTION_DELAY_SECONDS = 5
-                print(f"[{spike_time.isoformat()}] Waiting {LOG_INGESTION_DELAY_SECONDS}s for Promtail/Loki ingestion...")
-                time.sleep(LOG_INGESTION_DELAY_SECONDS)
-
-                # Update spike time AFTER delay
-                spike_time = datetime.now()
-
-                # 3. Retrieve Logs
-                container_logs, system_logs = get_incident_logs(spike_time)
-                
-                # NEW: Combine logs for LLM - much better for detection                
-                logs_for_llm = (
-                    "--- SYSTEM LOGS ---\n" + system_logs +
-                    "\n--- CONTAINER LOGS ---\n" + container_logs
-                )
-
-                # ? NEW: Default remediation assumption (test container)
-                remediation_target = TARGET_CONTAINER_NAME
-                remediation_action = "docker restart"
-                print(f"[{spike_time.isoformat()}] Identified Cause Source (Heuristic): CONTAINER ({remediation_target})")
-
-                # ? NEW: Additional subtle heuristic
-                if len(container_logs) < 100:
-                    print(f"[{spike_time.isoformat()}] WARNING: Container logs are minimal. Analyzing full logs.")
-                    # We still allow the LLM to decide root cause
-
-                # 4. LLM Analysis
-                llm_response_text = analyze_logs_with_llm(logs_for_llm)
-
-                # 5. Parse LLM Response
-                remediation_confidence = 0
-                root_cause = "Not determined"
-
-                for line in llm_response_text.split("\n"):
-                    if line.startswith("REASON:"):
-                        root_cause = line.split("REASON:")[1].strip()
-                    elif line.startswith("CONFIDENCE:"):
-                        try:
-                            remediation_confidence = int(line.split("CONFIDENCE:")[1].strip())
-                        except ValueError:
-                            pass
-
-                print(f"[{spike_time.isoformat()}] LLM Analysis Result:")
-                print(f"  Root Cause: {root_cause}")
-                print(f"  Confidence: {remediation_confidence}%")
-
-                # 6. Auto Remediation Logic
-                if remediation_action and remediation_confidence >= 80:
-                    remediate(remediation_target, remediation_action, root_cause, remediation_confidence, llm_response_text)
-                elif remediation_action and remediation_confidence < 80:
-                    print(f"[{spike_time.isoformat()}] SKIPPING REMEDIATION: LLM confidence ({remediation_confidence}%) too low.")
-                else:
-                    print(f"[{spike_time.isoformat()}] SKIPPING REMEDIATION: No remediation action selected.")
-
-            else:
-                print(f"[{spike_time.isoformat()}] CPU usage nominal. Continuing...")
-
-        except requests.exceptions.RequestException as e:
-            print(f"[{spike_time.isoformat()}] ERROR: Could not scrape Node Exporter: {e}")
-        except Exception as e:
-            print(f"[{spike_time.isoformat()}] UNEXPECTED ERROR: {e}")
-
-        # 7. Wait interval
-        if not spike_detected:
-            time.sleep(CHECK_INTERVAL_SECONDS)
-        else:
-            time.sleep(CHECK_INTERVAL_SECONDS * 3)
+            migrated = incident_store.migrate_json(REMEDIATION_HISTORY_FILE)
+            if migrated:
+                log.info(f"Migrated {migrated} incidents from {REMEDIATION_HISTORY_FILE} to {INCIDENT_STORE_FILE}.")
+        except (OSError, ValueError) as e:
+            log.error(f"Could not migrate {REMEDIATION_HISTORY_FILE}: {e}")
+
+        log.info(f"Starting CPU Spike Detection Agent. Monitoring {len(targets)} target(s)" +
+                 (f" across {SHARD_WORKERS} shard workers..." if SHARD_WORKERS > 0 else "..."))
+    else:
+        log.info(f"Starting shard worker {worker} for a share of {len(targets)} target(s)...")
+    try:
+        detectors = build_detectors(targets)
+        forecasters = build_forecasters(targets)
+        resource_detectors = build_resource_detectors(targets)
+    except (TypeError, ValueError) as e:
+        log.error(f"Invalid detector settings in {TARGETS_FILE}: {e}")
+        return
+
+    if worker is not None:
+        membership = ShardMembership(SHARD_LEASE_FILE, worker, SHARD_LEASE_SECONDS)
+        try:
+            asyncio.run(run_agent(targets, detectors, forecasters, resource_detectors, membership))
+        except KeyboardInterrupt:
+            log.info(f"Shard worker {worker} stopped.")
+        return
+
+    d = DETECTOR_DEFAULTS
+    log.info(f"Detector defaults: {d.metric} CPU > {d.threshold:g}% (0-(100 x VCPUs) scale, VCPU count read from Node Exporter) "
+             f"for {d.sustain_seconds:g}s, EWMA z >= {d.ewma_z:g}; re-arms below {d.clear_below:g}% after {d.clear_seconds:g}s")
+    if forecasters:
+        log.info(f"Early warning (trend forecast) on {len(forecasters)} target(s): "
+                 f"{', '.join(sorted(forecasters))}")
+    for resource in RESOURCES:
+        watched = sum(1 for per_target in resource_detectors.values() if resource in per_target)
+        if watched:
+            r = RESOURCE_DETECTOR_DEFAULTS[resource]
+            log.info(f"Detecting {INCIDENT_TYPES[resource]} on {watched} target(s): {resource} > {r.threshold:g} "
+                     f"for {r.sustain_seconds:g}s (defaults); re-arms below {r.clear_below:g} after {r.clear_seconds:g}s")
+
+    if SHARD_WORKERS > 0:
+        run_shard_supervisor(SHARD_WORKERS)
+        return
+    try:
+        asyncio.run(run_agent(targets, detectors, forecasters, resource_detectors))
+    except KeyboardInterrupt:
+        log.info("Detection agent stopped.")
 
 
 if __name__ == "__main__":
-    if not os.getenv("GEMINI_API_KEY"):
-        print("ERROR: GEMINI_API_KEY environment variable not set.")
-    else:
-        run_detection_loop()
+    run_detection_loop()
 
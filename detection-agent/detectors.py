@@ -0,0 +1,441 @@
+"""
+Streaming CPU spike detectors.
+
+A SpikeDetector turns one target's samples into spike onsets. A sample is
+anomalous when it is above the absolute `threshold` AND every configured
+statistical test agrees:
+
+  - EWMA: z-score against an exponentially weighted mean/variance baseline
+  - MAD:  robust z-score against the rolling median / median absolute deviation
+
+Anomalies must then persist for `sustain_seconds` before the detector fires
+(one noisy tick no longer starts a Loki + LLM + restart cycle), and a fired
+detector only re-arms after `clear_seconds` of samples that are below
+`clear_below` or, with a statistical test on, back within the target's own
+baseline (hysteresis). Every update is constant work per sample.
+
+A BreachForecaster (optional, per target) gives early warning instead: it fits
+a trend to the same metric (Holt's level + trend smoothing, or a least-squares
+line over the last few samples) and warns when the trend reaches the threshold
+within `forecast_horizon_seconds`, so RCA can start before the spike fires.
+"""
+import bisect
+import math
+from collections import deque
+from dataclasses import dataclass, fields
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from cpu_rate import CpuSnapshot
+
+METRICS = ("total", "average", "hottest_core")
+FORECAST_MODELS = ("holt", "linear")
+
+
+@dataclass
+class DetectorConfig:
+    """Per-target detection settings (see targets.json "detector")."""
+    # total: agent aggregate scale 0-(100 x cores); average: 0-100 across cores; hottest_core: 0-100
+    metric: str = "total"
+    threshold: float = 75.0
+    sustain_seconds: float = 0.0
+    # Hysteresis: once fired, stay fired until below this (default: threshold), or back at the
+    # statistical baseline, for clear_seconds
+    clear_below: Optional[float] = None
+    clear_seconds: float = 0.0
+    # EWMA baseline test (disabled when ewma_alpha is None)
+    ewma_alpha: Optional[float] = None
+    ewma_z: float = 3.0
+    # Rolling median/MAD test over the last mad_window samples (disabled when None)
+    mad_window: Optional[int] = None
+    mad_z: float = 3.5
+    # Samples before the statistical tests have an opinion (until then only the threshold applies)
+    warmup_samples: int = 10
+    # Floor for the baseline spread, in metric units, so a flat baseline does not make every blip infinite-z
+    min_spread: float = 2.0
+    # Early warning (disabled when forecast_horizon_seconds is None): warn when the trend model projects
+    # the threshold within the horizon for forecast_confirm samples in a row, from a level of at least
+    # forecast_min_level x threshold. holt: level/trend smoothing (forecast_alpha, forecast_beta);
+    # linear: least squares over the last forecast_window samples.
+    forecast_horizon_seconds: Optional[float] = None
+    forecast_model: str = "holt"
+    forecast_alpha: float = 0.5
+    forecast_beta: float = 0.3
+    forecast_window: int = 6
+    forecast_confirm: int = 2
+    forecast_min_level: float = 0.5
+
+    @classmethod
+    def from_dict(cls, values: Optional[Dict[str, Any]], defaults: Optional["DetectorConfig"] = None) -> "DetectorConfig":
+        """Overlays a JSON dict on `defaults`; unknown keys raise ValueError."""
+        base = {f.name: getattr(defaults, f.name) for f in fields(cls)} if defaults else {}
+        known = {f.name for f in fields(cls)}
+        unknown = set(values or {}) - known
+        if unknown:
+            raise ValueError(f"Unknown detector settings: {', '.join(sorted(unknown))}")
+        config = cls(**{**base, **(values or {})})
+        if config.metric not in METRICS:
+            raise ValueError(f"Unknown detector metric '{config.metric}' (expected one of {', '.join(METRICS)})")
+        if config.forecast_model not in FORECAST_MODELS:
+            raise ValueError(f"Unknown forecast model '{config.forecast_model}' "
+                             f"(expected one of {', '.join(FORECAST_MODELS)})")
+        return config
+
+
+def metric_value(snapshot: CpuSnapshot, metric: str) -> float:
+    if metric == "average":
+        return snapshot.average_percent
+    if metric == "hottest_core":
+        return snapshot.hottest_core[1]
+    return snapshot.total_percent
+
+
+class EwmaBaseline:
+    """Exponentially weighted mean and variance (West's incremental form)."""
+
+    def __init__(self, alpha: float):
+        self.alpha = alpha
+        self.mean = 0.0
+        self.var = 0.0
+        self.samples = 0
+
+    def zscore(self, value: float, min_spread: float) -> float:
+        return (value - self.mean) / max(math.sqrt(self.var), min_spread)
+
+    def update(self, value: float, alpha: Optional[float] = None):
+        alpha = self.alpha if alpha is None else alpha
+        if self.samples == 0:
+            self.mean = value
+        else:
+            diff = value - self.mean
+            incr = alpha * diff
+            self.mean += incr
+            self.var = (1 - alpha) * (self.var + diff * incr)
+        self.samples += 1
+
+
+class RollingMad:
+    """
+    Median and MAD over the last `window` samples. The window is kept sorted
+    (bisect), so the median is a lookup. The absolute deviations from the median
+    are then two sorted runs (below and above it), so the MAD is a selection
+    across them in O(log window), without building or sorting the deviations.
+    """
+
+    def __init__(self, window: int):
+        self.window = window
+        self._values: Deque[float] = deque()
+        self._sorted: List[float] = []
+
+    @property
+    def samples(self) -> int:
+        return len(self._values)
+
+    def update(self, value: float):
+        self._values.append(value)
+        bisect.insort(self._sorted, value)
+        if len(self._values) > self.window:
+            old = self._values.popleft()
+            del self._sorted[bisect.bisect_left(self._sorted, old)]
+
+    def median(self) -> float:
+        s = self._sorted
+        n = len(s)
+        if not n:
+            return 0.0
+        mid = n // 2
+        return s[mid] if n % 2 else (s[mid - 1] + s[mid]) / 2
+
+    def _deviation(self, med: float, split: int, k: int) -> float:
+        """The k-th smallest (0-based) |value - med|; values below med are s[:split]."""
+        s = self._sorted
+        # Deviations below med, nearest first: med - s[split - 1 - i]; above it: s[split + j] - med.
+        # Take i from below and k + 1 - i from above; find the i where the two runs meet.
+        lo, hi = max(0, k + 1 - (len(s) - split)), min(split, k + 1)
+        while lo < hi:
+            i = (lo + hi) // 2
+            if med - s[split - 1 - i] < s[split + k - i] - med:
+                lo = i + 1
+            else:
+                hi = i
+        return max(med - s[split - lo] if lo > 0 else 0.0, s[split + k - lo] - med if k >= lo else 0.0)
+
+    def mad(self) -> float:
+        n = len(self._sorted)
+        if not n:
+            return 0.0
+        med = self.median()
+        split = bisect.bisect_left(self._sorted, med)
+        mid = n // 2
+        if n % 2:
+            return self._deviation(med, split, mid)
+        return (self._deviation(med, split, mid - 1) + self._deviation(med, split, mid)) / 2
+
+    def zscore(self, value: float, min_spread: float) -> float:
+        # 1.4826 scales the MAD to a standard deviation for normally distributed noise
+        return (value - self.median()) / max(1.4826 * self.mad(), min_spread)
+
+
+@dataclass
+class Detection:
+    """A spike onset: fired at `timestamp`, anomalous since `onset`."""
+    timestamp: float
+    onset: float
+    value: float
+    reason: str
+
+
+class SpikeDetector:
+    """One target's detector state. Feed it every sample via update()."""
+
+    def __init__(self, config: DetectorConfig):
+        self.config = config
+        self.clear_below = config.threshold if config.clear_below is None else config.clear_below
+        self.ewma = EwmaBaseline(config.ewma_alpha) if config.ewma_alpha is not None else None
+        self.mad = RollingMad(config.mad_window) if config.mad_window is not None else None
+
+        self.firing = False
+        self.anomalous_since: Optional[float] = None
+        self._clear_since: Optional[float] = None
+        self.last_reason = ""
+        self.samples = 0
+        self.detections = 0
+
+    @property
+    def pending(self) -> bool:
+        """Anomalous, but not for sustain_seconds yet."""
+        return not self.firing and self.anomalous_since is not None
+
+    def _statistical(self) -> bool:
+        """True once a configured EWMA/MAD test is warmed up and has an opinion."""
+        warmup = self.config.warmup_samples
+        return ((self.ewma is not None and self.ewma.samples >= warmup) or
+                (self.mad is not None and self.mad.samples >= warmup))
+
+    def _test(self, value: float) -> bool:
+        config = self.config
+        if value <= config.threshold:
+            self.last_reason = f"{value:.1f} <= threshold {config.threshold:g}"
+            return False
+        reasons = [f"{value:.1f} > threshold {config.threshold:g}"]
+        if self.ewma is not None and self.ewma.samples >= config.warmup_samples:
+            z = self.ewma.zscore(value, config.min_spread)
+            if z < config.ewma_z:
+                self.last_reason = f"EWMA z={z:.1f} < {config.ewma_z:g} (baseline {self.ewma.mean:.1f})"
+                return False
+            reasons.append(f"EWMA z={z:.1f} (baseline {self.ewma.mean:.1f})")
+        if self.mad is not None and self.mad.samples >= config.warmup_samples:
+            z = self.mad.zscore(value, config.min_spread)
+            if z < config.mad_z:
+                self.last_reason = f"MAD z={z:.1f} < {config.mad_z:g} (median {self.mad.median():.1f})"
+                return False
+            reasons.append(f"MAD z={z:.1f} (median {self.mad.median():.1f})")
+        self.last_reason = ", ".join(reasons)
+        return True
+
+    def update(self, timestamp: float, value: float) -> Optional[Detection]:
+        """Returns a Detection when a spike fires; None otherwise (including while it stays fired)."""
+        self.samples += 1
+        anomalous = self._test(value)
+        statistical = self._statistical()
+
+        # Baselines learn from normal samples; during an anomaly they adapt 10x slower,
+        # so a spike does not absorb itself but a lasting level shift is eventually learned.
+        if self.ewma is not None:
+            self.ewma.update(value, self.ewma.alpha / 10 if anomalous else None)
+        if self.mad is not None:
+            self.mad.update(value)
+
+        if self.firing:
+            # Back to normal: below the clear level, or (for a busy target whose normal load
+            # is above the threshold) no longer anomalous against its own baseline
+            if value < self.clear_below or (statistical and not anomalous):
+                if self._clear_since is None:
+                    self._clear_since = timestamp
+                if timestamp - self._clear_since >= self.config.clear_seconds:
+                    self.firing = False
+                    self.anomalous_since = None
+                    self._clear_since = None
+            else:
+                self._clear_since = None
+            return None
+
+        if not anomalous:
+            self.anomalous_since = None
+            return None
+        if self.anomalous_since is None:
+            self.anomalous_since = timestamp
+        if timestamp - self.anomalous_since < self.config.sustain_seconds:
+            return None
+
+        self.firing = True
+        self._clear_since = None
+        self.detections += 1
+        return Detection(timestamp, self.anomalous_since, value, self.last_reason)
+
+    def state(self) -> Dict[str, Any]:
+        """Current state for the dashboard / logs."""
+        return {
+            "firing": self.firing,
+            "pending": self.pending,
+            "metric": self.config.metric,
+            "threshold": self.config.threshold,
+            "baseline": round(self.ewma.mean, 2) if self.ewma is not None else None,
+            "reason": self.last_reason,
+        }
+
+
+# --- FORECASTING ---
+
+class HoltTrend:
+    """
+    Holt's linear (double exponential) smoothing over irregularly spaced samples:
+    a smoothed level and a trend in metric units per second.
+    """
+
+    def __init__(self, alpha: float, beta: float):
+        self.alpha = alpha
+        self.beta = beta
+        self.level = 0.0
+        self.slope = 0.0
+        self.samples = 0
+        self._last = 0.0
+
+    def update(self, timestamp: float, value: float):
+        if self.samples == 0:
+            self.level = value
+        else:
+            dt = max(timestamp - self._last, 1e-3)
+            level = self.alpha * value + (1 - self.alpha) * (self.level + self.slope * dt)
+            self.slope = self.beta * (level - self.level) / dt + (1 - self.beta) * self.slope
+            self.level = level
+        self._last = timestamp
+        self.samples += 1
+
+
+class LinearTrend:
+    """
+    Least-squares line over the last `window` samples, kept as running sums, so
+    an update is constant work. Times are taken relative to an origin that moves
+    up every REBASE_SECONDS (one pass over the window) to keep the sums precise.
+    """
+    REBASE_SECONDS = 3600.0
+
+    def __init__(self, window: int):
+        self.window = max(2, window)
+        self.level = 0.0
+        self.slope = 0.0
+        self._points: Deque[Tuple[float, float]] = deque()
+        self._origin: Optional[float] = None
+        self._sums = [0.0, 0.0, 0.0, 0.0]  # sum x, sum y, sum x^2, sum xy
+
+    @property
+    def samples(self) -> int:
+        return len(self._points)
+
+    def _add(self, timestamp: float, value: float, sign: float):
+        x = timestamp - self._origin
+        sums = self._sums
+        sums[0] += sign * x
+        sums[1] += sign * value
+        sums[2] += sign * x * x
+        sums[3] += sign * x * value
+
+    def update(self, timestamp: float, value: float):
+        if self._origin is None or timestamp - self._origin > self.REBASE_SECONDS:
+            self._origin = timestamp
+            self._sums = [0.0, 0.0, 0.0, 0.0]
+            for point in self._points:
+                self._add(*point, 1.0)
+        self._points.append((timestamp, value))
+        self._add(timestamp, value, 1.0)
+        if len(self._points) > self.window:
+            self._add(*self._points.popleft(), -1.0)
+
+        n = len(self._points)
+        sum_x, sum_y, sum_xx, sum_xy = self._sums
+        denominator = n * sum_xx - sum_x * sum_x
+        if n < 2 or denominator <= 1e-9:
+            self.level, self.slope = value, 0.0
+            return
+        self.slope = (n * sum_xy - sum_x * sum_y) / denominator
+        # The fitted line at the latest sample, not the raw (noisy) value
+        self.level = (sum_y - self.slope * sum_x) / n + self.slope * (timestamp - self._origin)
+
+
+@dataclass
+class EarlyWarning:
+    """A projected breach: at `timestamp` the trend reaches `threshold` in `breach_in` seconds."""
+    timestamp: float
+    value: float  # the model's level (smoothed metric) at `timestamp`
+    slope: float  # metric units per second
+    breach_in: float
+    threshold: float
+    reason: str
+
+    @property
+    def breach_at(self) -> float:
+        return self.timestamp + self.breach_in
+
+
+class BreachForecaster:
+    """
+    One target's early warning. Feed it every sample (with the target's
+    SpikeDetector) via update(); it warns once per approach to the threshold and is
+    silent while the detector is pending or firing. It re-arms after a full horizon
+    without a projected breach.
+    """
+
+    def __init__(self, config: DetectorConfig):
+        if config.forecast_horizon_seconds is None:
+            raise ValueError("forecast_horizon_seconds is not set")
+        self.config = config
+        self.horizon = config.forecast_horizon_seconds
+        if config.forecast_model == "linear":
+            self.model = LinearTrend(config.forecast_window)
+        else:
+            self.model = HoltTrend(config.forecast_alpha, config.forecast_beta)
+        self.armed = True
+        self.streak = 0
+        self.breach_in: Optional[float] = None
+        self._quiet_since: Optional[float] = None
+        self.warnings = 0
+
+    def _project(self) -> Optional[float]:
+        """Seconds until the trend reaches the threshold, if within the horizon."""
+        config = self.config
+        level, slope = self.model.level, self.model.slope
+        if self.model.samples < 3 or slope <= 0 or level >= config.threshold:
+            return None
+        if level < config.forecast_min_level * config.threshold:
+            return None
+        breach_in = (config.threshold - level) / slope
+        return breach_in if breach_in <= self.horizon else None
+
+    def update(self, timestamp: float, value: float, detector: Optional[SpikeDetector] = None) -> Optional[EarlyWarning]:
+        """Returns an EarlyWarning when a breach is newly projected; None otherwise."""
+        self.model.update(timestamp, value)
+        self.breach_in = self._project()
+        busy = detector is not None and (detector.firing or detector.pending)
+
+        if self.breach_in is None or busy:
+            self.streak = 0
+            if self._quiet_since is None:
+                self._quiet_since = timestamp
+            if not self.armed and timestamp - self._quiet_since >= self.horizon:
+                self.armed = True
+            return None
+        self._quiet_since = None
+        self.streak += 1
+        if not self.armed or self.streak < self.config.forecast_confirm:
+            return None
+
+        self.armed = False
+        self.warnings += 1
+        slope = self.model.slope
+        reason = (f"{self.config.forecast_model} trend {slope * 60:+.1f}/min from {self.model.level:.1f} "
+                  f"reaches {self.config.threshold:g} in {self.breach_in:.0f}s")
+        return EarlyWarning(timestamp, self.model.level, slope, self.breach_in, self.config.threshold, reason)
+
+    def state(self) -> Dict[str, Any]:
+        """Current projection for the dashboard / logs."""
+        return {"breach_in": round(self.breach_in, 1) if self.breach_in is not None else None}
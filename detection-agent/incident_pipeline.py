@@ -0,0 +1,237 @@
+"""
+Staged incident pipeline: attribution -> log fetch -> analysis -> confirm -> remediation
+-> verify -> notify.
+
+Detection only enqueues an Incident and returns, so sampling stays on schedule while
+RCA and remediation run. Every stage has a bounded queue and its own workers; a
+target with an incident of the same type (CPU, memory, ...) already in flight is
+not enqueued again.
+
+A pre-incident (status PREDICTED, from an early warning) runs the RCA stages ahead
+of the spike and waits in the confirm stage until the detector fires (confirm()).
+"""
+import asyncio
+import inspect
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from analyzers import AnalysisResult
+from cpu_rate import CpuSnapshot
+from detectors import EarlyWarning
+from instrumentation import ERRORS, INCIDENTS, STAGE_SECONDS, get_logger
+from log_reducer import LogReducer
+from remediation import RemediationOutcome
+from scrape_scheduler import ScrapeTarget
+from stability import StabilityResult
+
+STAGE_NAMES = ("attribution", "log_fetch", "analysis", "confirm", "remediation", "verify", "notify")
+
+log = get_logger("pipeline")
+
+# Stage handlers take the incident and return True to pass it on to the next stage,
+# False to finish it early (e.g. confidence too low). Sync handlers run in a thread.
+StageHandler = Callable[["Incident"], Any]
+
+
+@dataclass
+class Incident:
+    """Everything known about one spike as it moves through the pipeline."""
+    target: ScrapeTarget
+    detected_at: datetime
+    cpu_percent: float
+    snapshot: Optional[CpuSnapshot] = None
+    # What was detected: "cpu", or one of resource_rates.RESOURCES with its reading
+    resource: str = "cpu"
+    resource_value: Optional[float] = None
+
+    # Busiest containers on the node during the spike: (container, CPU %), busiest first
+    top_containers: List[Tuple[str, float]] = field(default_factory=list)
+    container_logs: str = ""
+    system_logs: str = ""
+    log_signature: List[str] = field(default_factory=list)
+    log_reducers: List[LogReducer] = field(default_factory=list)
+    analysis: Optional[AnalysisResult] = None
+    llm_response_text: str = ""
+    rca_cached: bool = False
+    root_cause: str = "Not determined"
+    confidence: int = 0
+    remediation_target: str = ""
+    remediation_action: str = ""
+    remediation_outcome: Optional[RemediationOutcome] = None
+    post_remediation_cpu: Optional[float] = None
+    stability: Optional[StabilityResult] = None
+    status: str = "DETECTED"
+
+    # Pre-incidents only: the projected breach, and the event set when the detector confirms it
+    warning: Optional[EarlyWarning] = None
+    confirmation: Optional[asyncio.Event] = field(default=None, repr=False)
+
+    # Seconds spent in each stage (queue wait excluded).
+    stage_seconds: Dict[str, float] = field(default_factory=dict)
+
+    @property
+    def key(self) -> str:
+        """In-flight dedup key: the target name, qualified by the resource for non-CPU incidents."""
+        return self.target.name if self.resource == "cpu" else f"{self.target.name}/{self.resource}"
+
+
+class _Stage:
+    def __init__(self, name: str, handler: StageHandler, workers: int, queue_size: int):
+        self.name = name
+        self.handler = handler
+        self.workers = workers
+        self.queue: "asyncio.Queue[Incident]" = asyncio.Queue(maxsize=queue_size)
+        self.is_async = inspect.iscoroutinefunction(handler)
+        self.processed = 0
+        self.failed = 0
+        self.latencies: Deque[float] = deque(maxlen=1_000)
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+class IncidentPipeline:
+    """
+    Runs incidents through the stage handlers, in STAGE_NAMES order.
+    `handlers` maps stage name -> handler; `workers` optionally overrides the
+    per-stage worker count (default 1 each).
+    """
+
+    def __init__(self, handlers: Dict[str, StageHandler], queue_size: int = 32,
+                 workers: Optional[Dict[str, int]] = None):
+        workers = workers or {}
+        self.stages = [
+            _Stage(name, handlers[name], workers.get(name, 1), queue_size)
+            for name in STAGE_NAMES if name in handlers
+        ]
+        self.in_flight: Dict[str, Incident] = {}
+        self.submitted = 0
+        self.deduplicated = 0
+        self.dropped = 0
+        self.completed = 0
+        self._tasks: List[asyncio.Task] = []
+
+    def submit(self, incident: Incident) -> bool:
+        """
+        Non-blocking enqueue from the detection path. Returns False if the target already
+        has an incident of this type in flight or the first stage's queue is full.
+        """
+        key = incident.key
+        if key in self.in_flight:
+            self.deduplicated += 1
+            return False
+        try:
+            self.stages[0].queue.put_nowait(incident)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            log.warning("Incident queue full; spike not queued for RCA.", extra={"target": key})
+            return False
+        self.in_flight[key] = incident
+        self.submitted += 1
+        return True
+
+    def confirm(self, key: str) -> Optional[Incident]:
+        """
+        Records that the spike a target's in-flight pre-incident predicted was detected,
+        releasing it from the confirm stage (or letting it pass straight through).
+        Returns it (for the caller to record the detection), or None if the target has
+        no unconfirmed pre-incident.
+        """
+        incident = self.in_flight.get(key)
+        if incident is None or incident.confirmation is None or incident.confirmation.is_set():
+            return None
+        if incident.status == "PREDICTED":
+            incident.status = "DETECTED"
+        incident.confirmation.set()
+        return incident
+
+    def _finish(self, incident: Incident):
+        self.in_flight.pop(incident.key, None)
+        self.completed += 1
+        INCIDENTS.inc(incident.status)
+
+    async def _worker(self, index: int):
+        stage = self.stages[index]
+        next_stage = self.stages[index + 1] if index + 1 < len(self.stages) else None
+
+        while True:
+            incident = await stage.queue.get()
+            start = time.perf_counter()
+            try:
+                if stage.is_async:
+                    proceed = await stage.handler(incident)
+                else:
+                    proceed = await asyncio.to_thread(stage.handler, incident)
+            except Exception as e:
+                stage.failed += 1
+                incident.status = "FAILED"
+                proceed = False
+                ERRORS.inc("pipeline")
+                log.error(f"ERROR in {stage.name} stage: {e!r}", extra={"target": incident.target.name})
+            finally:
+                elapsed = time.perf_counter() - start
+                stage.latencies.append(elapsed)
+                STAGE_SECONDS.observe(elapsed, stage.name)
+                stage.processed += 1
+                incident.stage_seconds[stage.name] = elapsed
+                stage.queue.task_done()
+
+            if proceed and next_stage is not None:
+                # Backpressure between stages: wait for room rather than dropping mid-incident.
+                await next_stage.queue.put(incident)
+            else:
+                self._finish(incident)
+
+    def start(self):
+        """Starts the stage workers on the running event loop."""
+        for index, stage in enumerate(self.stages):
+            for _ in range(stage.workers):
+                self._tasks.append(asyncio.create_task(self._worker(index)))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def join(self):
+        """Waits until every queued incident has left every stage (tests/benchmarks)."""
+        while self.in_flight:
+            await asyncio.sleep(0.01)
+
+    def metrics(self) -> Dict[str, Any]:
+        """Queue depth and stage latency (p50/p95/max seconds over recent incidents)."""
+        stages = {}
+        for stage in self.stages:
+            latencies = list(stage.latencies)
+            stages[stage.name] = {
+                "queue_depth": stage.queue.qsize(),
+                "processed": stage.processed,
+                "failed": stage.failed,
+                "latency_p50": _percentile(latencies, 0.5),
+                "latency_p95": _percentile(latencies, 0.95),
+                "latency_max": max(latencies) if latencies else 0.0,
+            }
+        return {
+            "in_flight": len(self.in_flight),
+            "submitted": self.submitted,
+            "deduplicated": self.deduplicated,
+            "dropped": self.dropped,
+            "completed": self.completed,
+            "stages": stages,
+        }
+
+    def format_metrics(self) -> str:
+        """One-line summary for the agent log."""
+        parts = [
+            f"{name}: depth={m['queue_depth']} p50={m['latency_p50']:.2f}s p95={m['latency_p95']:.2f}s"
+            for name, m in self.metrics()["stages"].items()
+        ]
+        return f"in_flight={len(self.in_flight)} | " + " | ".join(parts)
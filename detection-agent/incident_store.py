@@ -0,0 +1,230 @@
+"""
+Append-only incident store (SQLite, WAL mode).
+
+Replaces the remediation_history.json read-modify-rewrite: every incident is one
+INSERT (atomic and crash-safe), readers never block the writer, and "last N" and
+time-range queries go through indexes, so their cost does not grow with history.
+The full incident dict is kept as JSON; timestamp, node, target and status are
+also stored as indexed columns for filtering.
+"""
+import json
+import os
+import sqlite3
+import threading
+from collections import Counter, deque
+from datetime import datetime
+from typing import Any, Deque, Dict, Iterable, List, Optional, Tuple
+
+IncidentRecord = Dict[str, Any]
+
+
+def _epoch(value: Any) -> float:
+    """Accepts a datetime, epoch seconds or the str(datetime) written by the old JSON history."""
+    if isinstance(value, datetime):
+        return value.timestamp()
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return datetime.fromisoformat(str(value)).timestamp()
+    except ValueError:
+        return 0.0
+
+
+class IncidentStore:
+    """
+    Incident history. Safe to share between the pipeline's worker threads; the
+    dashboard opens its own instance on the same file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # WAL + NORMAL: an append survives process crashes; only an OS crash can lose the last commits
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS incidents ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp REAL NOT NULL,"
+            " node TEXT NOT NULL DEFAULT '', target TEXT NOT NULL DEFAULT '', status TEXT NOT NULL DEFAULT '',"
+            " record TEXT NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS incidents_timestamp ON incidents (timestamp)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS incidents_node ON incidents (node, timestamp)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS incidents_target ON incidents (target, timestamp)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS incidents_status ON incidents (status, timestamp)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+    @staticmethod
+    def _row(record: IncidentRecord) -> Tuple[float, str, str, str, str]:
+        return (
+            _epoch(record.get("timestamp")),
+            str(record.get("node") or ""),
+            str(record.get("target") or ""),
+            str(record.get("status") or ""),
+            json.dumps(record, default=str),  # default=str for datetime objects, as before
+        )
+
+    def append(self, record: IncidentRecord) -> int:
+        """Appends one incident; returns its sequence number."""
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT INTO incidents (timestamp, node, target, status, record) VALUES (?, ?, ?, ?, ?)",
+                self._row(record),
+            )
+            return cursor.lastrowid
+
+    def append_many(self, records: Iterable[IncidentRecord]) -> int:
+        """Appends a batch in one transaction (bulk imports); returns the number appended."""
+        rows = [self._row(record) for record in records]
+        with self._lock:
+            self._insert_rows(rows)
+        return len(rows)
+
+    def _insert_rows(self, rows: List[Tuple[float, str, str, str, str]], meta: Optional[Tuple[str, str]] = None):
+        self._db.execute("BEGIN")
+        try:
+            self._db.executemany(
+                "INSERT INTO incidents (timestamp, node, target, status, record) VALUES (?, ?, ?, ?, ?)", rows)
+            if meta is not None:
+                self._db.execute("INSERT INTO meta (key, value) VALUES (?, ?)", meta)
+            self._db.execute("COMMIT")
+        except Exception:
+            self._db.execute("ROLLBACK")
+            raise
+
+    def _select(self, where: List[str], params: List[Any], order: str, limit: Optional[int]) -> List[IncidentRecord]:
+        sql = "SELECT record FROM incidents"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += f" ORDER BY {order}"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params = params + [limit]
+        with self._lock:
+            rows = self._db.execute(sql, params).fetchall()
+        return [json.loads(record) for (record,) in rows]
+
+    @staticmethod
+    def _filters(node: Optional[str], target: Optional[str], status: Optional[str]) -> Tuple[List[str], List[Any]]:
+        where, params = [], []
+        for column, value in (("node", node), ("target", target), ("status", status)):
+            if value is not None:
+                where.append(f"{column} = ?")
+                params.append(value)
+        return where, params
+
+    def last(self, n: int, node: Optional[str] = None, target: Optional[str] = None,
+             status: Optional[str] = None) -> List[IncidentRecord]:
+        """The `n` most recent incidents, oldest first (like history[-n:])."""
+        where, params = self._filters(node, target, status)
+        records = self._select(where, params, "timestamp DESC, id DESC", n)
+        records.reverse()
+        return records
+
+    def between(self, start: datetime, end: datetime, node: Optional[str] = None, target: Optional[str] = None,
+                status: Optional[str] = None, limit: Optional[int] = None) -> List[IncidentRecord]:
+        """Incidents with start <= timestamp < end, oldest first."""
+        where, params = self._filters(node, target, status)
+        where += ["timestamp >= ?", "timestamp < ?"]
+        params += [_epoch(start), _epoch(end)]
+        return self._select(where, params, "timestamp, id", limit)
+
+    def count(self, node: Optional[str] = None, target: Optional[str] = None, status: Optional[str] = None) -> int:
+        where, params = self._filters(node, target, status)
+        sql = "SELECT COUNT(*) FROM incidents" + (" WHERE " + " AND ".join(where) if where else "")
+        with self._lock:
+            return self._db.execute(sql, params).fetchone()[0]
+
+    def since(self, after_seq: int, limit: Optional[int] = None,
+              until_seq: Optional[int] = None) -> List[Tuple[int, IncidentRecord]]:
+        """(sequence number, incident) pairs appended after `after_seq` (up to `until_seq`), in append order."""
+        sql = "SELECT id, record FROM incidents WHERE id > ?"
+        params: List[Any] = [after_seq]
+        if until_seq is not None:
+            sql += " AND id <= ?"
+            params.append(until_seq)
+        sql += " ORDER BY id"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            rows = self._db.execute(sql, params).fetchall()
+        return [(seq, json.loads(record)) for seq, record in rows]
+
+    def summary(self) -> Tuple[int, Dict[str, int], Dict[str, int]]:
+        """(last sequence number, count per status, count per target) over the whole history."""
+        with self._lock:
+            last_seq = self._db.execute("SELECT COALESCE(MAX(id), 0) FROM incidents").fetchone()[0]
+            by_status = dict(self._db.execute(
+                "SELECT status, COUNT(*) FROM incidents WHERE id <= ? GROUP BY status", (last_seq,)).fetchall())
+            by_target = dict(self._db.execute(
+                "SELECT CASE WHEN node != '' THEN node ELSE target END AS t, COUNT(*) FROM incidents"
+                " WHERE id <= ? GROUP BY t", (last_seq,)).fetchall())
+        return last_seq, by_status, by_target
+
+    def migrate_json(self, json_path: str) -> int:
+        """
+        One-time import of a legacy remediation_history.json. The file is renamed to
+        `<name>.migrated` afterwards; returns the number of incidents imported. Raises
+        ValueError if the file is not a JSON list of incident objects (it is then left as is).
+        """
+        if not os.path.exists(json_path):
+            return 0
+        with self._lock:
+            if self._db.execute("SELECT 1 FROM meta WHERE key = 'migrated_json'").fetchone():
+                return 0
+        with open(json_path, 'r', encoding='utf-8') as f:
+            history = json.load(f)
+        if not isinstance(history, list) or not all(isinstance(record, dict) for record in history):
+            raise ValueError(f"{json_path} is not a list of incident objects")
+
+        rows = [self._row(record) for record in history]
+        with self._lock:
+            self._insert_rows(rows, ("migrated_json", os.path.abspath(json_path)))
+        os.replace(json_path, json_path + ".migrated")
+        return len(history)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def _record_target(record: IncidentRecord) -> str:
+    # Fleet records carry the scrape target ("node"); older ones only the container
+    return str(record.get("node") or record.get("target") or "")
+
+
+class HistoryTail:
+    """
+    Incrementally maintained view of the incident history for the dashboard.
+    The aggregates are bootstrapped once with indexed GROUP BY queries; after that
+    each poll() reads only incidents appended since the last sequence number seen,
+    so a refresh costs the same at 100 or 1M stored incidents.
+    """
+
+    def __init__(self, store: IncidentStore, keep: int = 5):
+        self.store = store
+        self.last_seq, by_status, by_target = store.summary()
+        self.by_status: Counter = Counter(by_status)
+        self.by_target: Counter = Counter(by_target)
+        self.count = sum(self.by_status.values())
+        # Bounded at last_seq: anything appended since summary() is left for the first poll()
+        self.recent: Deque[IncidentRecord] = deque(
+            (record for _seq, record in store.since(max(self.last_seq - keep, 0), until_seq=self.last_seq)),
+            maxlen=keep)
+
+    @property
+    def last_incident(self) -> Optional[IncidentRecord]:
+        return self.recent[-1] if self.recent else None
+
+    def poll(self, max_records: int = 10_000) -> int:
+        """Folds newly appended incidents into the aggregates; returns how many were read."""
+        new = self.store.since(self.last_seq, max_records)
+        for seq, record in new:
+            self.last_seq = seq
+            self.count += 1
+            self.by_status[str(record.get("status") or "")] += 1
+            self.by_target[_record_target(record)] += 1
+            self.recent.append(record)
+        return len(new)
@@ -0,0 +1,252 @@
+"""
+LLM request broker: bounds what the RCA prompt can cost the agent.
+
+The analysis stage calls the LLM synchronously from a pipeline worker thread.
+Through the broker, each call:
+
+  - waits for a token from a TokenBucket sized to the API quota (requests per
+    minute, with a burst) and for one of `max_concurrent` worker slots,
+  - joins an identical prompt that is already in flight instead of sending it
+    again (nodes running the same failing container reduce to the same logs),
+  - is hedged: when no answer has come after the recent p95 latency, a second
+    copy is sent if a token and a slot are free right away; the first answer wins,
+  - gives up after `deadline_seconds` and asks the `fallback` backend (e.g. a
+    faster model, itself behind a broker) when one is configured, else raises
+    LlmUnavailable.
+
+An abandoned call keeps its slot until the backend returns, so slow calls never
+pile up beyond `max_concurrent`; give the backend a timeout of its own.
+"""
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, InvalidStateError, ThreadPoolExecutor, wait
+from typing import Callable, Deque, Dict, List, Optional
+
+from instrumentation import get_logger
+
+log = get_logger("llm_broker")
+
+OUTCOMES = ("requests", "coalesced", "sent", "hedged", "hedge_won", "rate_limited", "timeout", "failed", "fallback")
+
+
+class LlmUnavailable(Exception):
+    """No answer: the deadline passed or the backend failed, and no fallback answered."""
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: `rate` tokens per second, at most `burst` saved up.
+    Waiters reserve tokens ahead (the balance goes negative), so they are served in
+    arrival order and one that cannot be served in time gives up at once.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self, timeout: float) -> Optional[float]:
+        """Reserves a token and returns the seconds until it is usable, or None if that is over `timeout`."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            wait = max(0.0, (1 - self._tokens) / self.rate)
+            if wait > timeout:
+                return None
+            self._tokens -= 1
+            return wait
+
+    def try_acquire(self) -> bool:
+        return self._reserve(0.0) is not None
+
+    def acquire(self, timeout: float) -> bool:
+        """Waits up to `timeout` seconds for a token."""
+        wait = self._reserve(timeout)
+        if wait is None:
+            return False
+        if wait > 0:
+            time.sleep(wait)
+        return True
+
+
+def _settle(future: Future, result: Optional[str] = None, error: Optional[BaseException] = None) -> bool:
+    """Resolves `future` unless another attempt already did; True if this call did."""
+    try:
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+        return True
+    except InvalidStateError:
+        return False
+
+
+class LlmBroker:
+    """
+    Calls `backend(prompt) -> text` under a concurrency cap, a rate limit and a
+    deadline (see the module docstring). `requests_per_minute=None` disables the
+    rate limit; hedging starts once `hedge_min_samples` latencies have been seen.
+    """
+
+    def __init__(self, backend: Callable[[str], str], max_concurrent: int = 4, deadline_seconds: float = 30.0,
+                 requests_per_minute: Optional[float] = 60.0, burst: int = 5, hedge: bool = True,
+                 hedge_quantile: float = 0.95, hedge_min_samples: int = 20,
+                 fallback: Optional[Callable[[str], str]] = None, name: str = "llm"):
+        self.backend = backend
+        self.max_concurrent = max_concurrent
+        self.deadline_seconds = deadline_seconds
+        self.bucket = TokenBucket(requests_per_minute / 60.0, burst) if requests_per_minute else None
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
+        self.fallback = fallback
+        self.name = name
+
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        # One thread per slot: an attempt is only submitted holding a slot, so it never queues in the pool
+        self._pool = ThreadPoolExecutor(max_concurrent, thread_name_prefix=f"{name}-broker")
+        self._in_flight: Dict[str, Future] = {}
+        self._latencies: Deque[float] = deque(maxlen=200)
+        self._running = 0
+        self._lock = threading.Lock()
+        self.counts: Dict[str, int] = {outcome: 0 for outcome in OUTCOMES}
+
+    def _count(self, outcome: str):
+        with self._lock:
+            self.counts[outcome] += 1
+
+    def hedge_delay(self) -> Optional[float]:
+        """Seconds after which a call is hedged: the recent `hedge_quantile` latency (None: no hedging yet)."""
+        if not self.hedge:
+            return None
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if len(latencies) < self.hedge_min_samples:
+            return None
+        return latencies[min(len(latencies) - 1, int(len(latencies) * self.hedge_quantile))]
+
+    def complete(self, prompt: str) -> str:
+        """The backend's answer to `prompt`, or the fallback's; raises LlmUnavailable."""
+        deadline = time.monotonic() + self.deadline_seconds
+        with self._lock:
+            self.counts["requests"] += 1
+            shared = self._in_flight.get(prompt)
+            leader = shared is None
+            if leader:
+                shared = self._in_flight[prompt] = Future()
+            else:
+                self.counts["coalesced"] += 1
+        if leader:
+            shared.add_done_callback(lambda future: self._forget(prompt, future))
+            self._dispatch(prompt, shared, deadline)
+
+        try:
+            return shared.result(timeout=max(0.0, deadline - time.monotonic()))
+        except Exception as e:
+            if shared.done():  # the backend's own error (which may itself be a TimeoutError)
+                self._count("failed")
+                return self._fall_back(prompt, f"backend failed: {e!r}")
+            self._count("timeout")
+            if leader:
+                self._forget(prompt, shared)  # a later identical prompt is sent afresh, not joined to this one
+            return self._fall_back(prompt, f"no answer within {self.deadline_seconds:g}s")
+
+    def _forget(self, prompt: str, future: Future):
+        with self._lock:
+            if self._in_flight.get(prompt) is future:
+                del self._in_flight[prompt]
+
+    def _dispatch(self, prompt: str, shared: Future, deadline: float):
+        """Sends the first attempt (waiting for a token and a slot), then the hedge if it is slow."""
+        if self.bucket is not None and not self.bucket.try_acquire():
+            self._count("rate_limited")
+            if not self.bucket.acquire(deadline - time.monotonic()):
+                _settle(shared, error=LlmUnavailable("rate limited until the deadline"))
+                return
+        if not self._slots.acquire(timeout=max(0.0, deadline - time.monotonic())):
+            _settle(shared, error=LlmUnavailable(f"all {self.max_concurrent} slots busy until the deadline"))
+            return
+        attempts = [1]  # attempts not yet finished, shared with the workers
+        self._launch(prompt, shared, attempts, hedge=False)
+
+        delay = self.hedge_delay()
+        if delay is None:
+            return
+        done, _ = wait([shared], timeout=min(delay, max(0.0, deadline - time.monotonic())))
+        if done or time.monotonic() >= deadline:
+            return
+        # Hedge only with capacity that is free right now; never queue behind the calls being hedged
+        if not self._slots.acquire(blocking=False):
+            return
+        if self.bucket is not None and not self.bucket.try_acquire():
+            self._slots.release()
+            return
+        with self._lock:
+            attempts[0] += 1
+            self.counts["hedged"] += 1
+        self._launch(prompt, shared, attempts, hedge=True)
+
+    def _launch(self, prompt: str, shared: Future, attempts: List[int], hedge: bool):
+        with self._lock:
+            self.counts["sent"] += 1
+            self._running += 1
+        try:
+            self._pool.submit(self._attempt, prompt, shared, attempts, hedge)
+        except RuntimeError as e:  # the broker was closed
+            self._finish()
+            _settle(shared, error=LlmUnavailable(repr(e)))
+
+    def _finish(self):
+        with self._lock:
+            self._running -= 1
+        self._slots.release()
+
+    def _attempt(self, prompt: str, shared: Future, attempts: List[int], hedge: bool):
+        start = time.monotonic()
+        try:
+            text = self.backend(prompt)
+        except Exception as e:
+            with self._lock:
+                attempts[0] -= 1
+                last = attempts[0] == 0
+            self._finish()
+            if last:  # a hedge still running may yet answer
+                _settle(shared, error=e)
+            return
+        with self._lock:
+            attempts[0] -= 1
+            self._latencies.append(time.monotonic() - start)
+        self._finish()
+        if _settle(shared, text) and hedge:
+            self._count("hedge_won")
+
+    def _fall_back(self, prompt: str, why: str) -> str:
+        if self.fallback is None:
+            raise LlmUnavailable(why)
+        self._count("fallback")
+        log.warning(f"{self.name}: {why}; asking the fallback backend")
+        try:
+            return self.fallback(prompt)
+        except Exception as e:
+            raise LlmUnavailable(f"{why}; fallback failed: {e}") from e
+
+    def in_flight(self) -> int:
+        """Backend calls running now, including abandoned ones still holding a slot."""
+        return self._running
+
+    def format_stats(self) -> str:
+        with self._lock:
+            counts = dict(self.counts)
+        delay = self.hedge_delay()
+        hedge = f"{delay:.2f}s" if delay is not None else "off"
+        return (", ".join(f"{outcome}={counts[outcome]}" for outcome in OUTCOMES) +
+                f", in_flight={self._running}, hedge_after={hedge}")
+
+    def close(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
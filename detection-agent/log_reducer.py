@@ -0,0 +1,236 @@
+"""
+Log pre-reduction for the RCA prompt: Drain-style template mining plus dedup.
+
+Lines are masked (numbers, ids, IPs, timestamps), clustered into
+templates with a fixed-depth prefix tree, and collapsed into one entry per
+template with a count and first/last timestamps. Templates are ranked by severity
+and by how unusual they are in the incident window, then rendered until a token
+budget is used up. Memory is bounded by the number of templates, not lines.
+"""
+import math
+import re
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+WILDCARD = "<*>"
+
+# Variables are runs that start with a digit: timestamps, IPs[:port], ids, durations,
+# sizes. A single digit-anchored pattern is several times faster than an alternation
+# of specific formats; ids that happen to start with a letter still collapse into
+# one template through Drain's similarity merge.
+_MASK_RE = re.compile(r"\d[\w.:-]*")
+
+_SEVERITY_RE = re.compile(r"\b(FATAL|CRITICAL|PANIC|ERROR|EXCEPTION|TRACEBACK|OOM|KILLED|WARN(?:ING)?|INFO|DEBUG)\b", re.IGNORECASE)
+_SEVERITY_RANK = {
+    "FATAL": 5, "PANIC": 5, "CRITICAL": 5, "OOM": 5, "KILLED": 4,
+    "ERROR": 4, "EXCEPTION": 4, "TRACEBACK": 4,
+    "WARN": 3, "WARNING": 3,
+    "INFO": 1, "DEBUG": 0,
+}
+_SEVERITY_NAMES = {5: "CRITICAL", 4: "ERROR", 3: "WARNING", 2: "NOTICE", 1: "INFO", 0: "DEBUG"}
+DEFAULT_SEVERITY = 2  # no recognizable level
+
+
+def mask_line(line: str) -> str:
+    """Replaces variable tokens with the wildcard."""
+    return _MASK_RE.sub(WILDCARD, line)
+
+
+def line_severity(line: str) -> int:
+    """Highest severity keyword in the line (0-5)."""
+    best = -1
+    for match in _SEVERITY_RE.finditer(line):
+        best = max(best, _SEVERITY_RANK[match.group(1).upper()])
+    return best if best >= 0 else DEFAULT_SEVERITY
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token) used for budgeting."""
+    return len(text) // 4 + 1
+
+
+class LogTemplate:
+    """One mined template and its occurrence statistics."""
+    __slots__ = ("tokens", "count", "first_ns", "last_ns", "recent_count", "severity", "example")
+
+    def __init__(self, tokens: List[str], timestamp_ns: int, severity: int, example: str):
+        self.tokens = tokens
+        self.count = 0
+        self.first_ns = timestamp_ns
+        self.last_ns = timestamp_ns
+        self.recent_count = 0
+        self.severity = severity
+        self.example = example
+
+    @property
+    def text(self) -> str:
+        return " ".join(self.tokens)
+
+    def similarity(self, tokens: List[str]) -> float:
+        same = sum(1 for a, b in zip(self.tokens, tokens) if a == b or a == WILDCARD)
+        return same / len(tokens) if tokens else 1.0
+
+    def merge(self, tokens: List[str]):
+        self.tokens = [a if a == b else WILDCARD for a, b in zip(self.tokens, tokens)]
+
+
+class LogReducer:
+    """
+    Streaming Drain-style template miner for one incident window.
+    `window_start_ns`/`window_end_ns` bound the window; occurrences in the final
+    `recent_fraction` of it count towards a template's burst score.
+    """
+
+    def __init__(self, window_start_ns: int, window_end_ns: int, depth: int = 4,
+                 similarity_threshold: float = 0.5, max_children: int = 100,
+                 max_templates: int = 5_000, recent_fraction: float = 0.2):
+        self.window_start_ns = window_start_ns
+        self.window_end_ns = window_end_ns
+        self.depth = depth
+        self.similarity_threshold = similarity_threshold
+        self.max_children = max_children
+        self.max_templates = max_templates
+        self.recent_fraction = recent_fraction
+        self._recent_start_ns = window_end_ns - int((window_end_ns - window_start_ns) * recent_fraction)
+
+        # token count -> nested prefix dicts -> leaf list of templates
+        self._tree: Dict[int, Dict] = {}
+        # Exact masked line -> template: repeated lines skip the tree search entirely.
+        self._exact: Dict[str, LogTemplate] = {}
+        self.templates: List[LogTemplate] = []
+        self.overflow_lines = 0
+
+        self.total_lines = 0
+        self.total_chars = 0
+        self.reduce_seconds = 0.0
+
+    # --- MINING ---
+
+    def add(self, timestamp_ns: int, line: str):
+        """Adds one raw log line."""
+        start = time.perf_counter()
+        line = line.strip()
+        self.total_lines += 1
+        self.total_chars += len(line) + 1
+
+        masked = mask_line(line)
+        template = self._exact.get(masked)
+        if template is None:
+            template = self._match(masked, timestamp_ns, line)
+            if template is None:
+                self.overflow_lines += 1
+                self.reduce_seconds += time.perf_counter() - start
+                return
+            if len(self._exact) < self.max_templates * 20:
+                self._exact[masked] = template
+
+        template.count += 1
+        if timestamp_ns < template.first_ns:
+            template.first_ns = timestamp_ns
+        if timestamp_ns > template.last_ns:
+            template.last_ns = timestamp_ns
+        if timestamp_ns >= self._recent_start_ns:
+            template.recent_count += 1
+        self.reduce_seconds += time.perf_counter() - start
+
+    def _match(self, masked: str, timestamp_ns: int, line: str) -> Optional[LogTemplate]:
+        tokens = masked.split()
+        node = self._tree.setdefault(len(tokens), {})
+        for token in tokens[:self.depth]:
+            key = WILDCARD if WILDCARD in token else token
+            if key not in node and len(node) >= self.max_children:
+                key = WILDCARD
+            node = node.setdefault(key, {})
+        leaf: List[LogTemplate] = node.setdefault(None, [])
+
+        best, best_sim = None, -1.0
+        for candidate in leaf:
+            sim = candidate.similarity(tokens)
+            if sim > best_sim:
+                best, best_sim = candidate, sim
+        if best is not None and best_sim >= self.similarity_threshold:
+            best.merge(tokens)
+            best.severity = max(best.severity, line_severity(line))
+            return best
+
+        if len(self.templates) >= self.max_templates:
+            return None
+        template = LogTemplate(tokens, timestamp_ns, line_severity(line), line)
+        leaf.append(template)
+        self.templates.append(template)
+        return template
+
+    # --- RANKING / RENDERING ---
+
+    def score(self, template: LogTemplate) -> float:
+        """
+        Severity dominates; within a severity, rare templates (information content
+        of their share of the window) and templates bursting at the end of the
+        window (near the spike) rank first.
+        """
+        rarity = -math.log10(template.count / self.total_lines) if self.total_lines else 0.0
+        burst = (template.recent_count / template.count) / self.recent_fraction if template.count else 0.0
+        return template.severity * 10 + rarity + burst
+
+    def ranked(self) -> List[LogTemplate]:
+        return sorted(self.templates, key=self.score, reverse=True)
+
+    def signature(self, top_n: int = 20) -> List[str]:
+        """
+        Masked texts of the top-ranked templates: what the incident "looks like",
+        without counts or timestamps, for fingerprinting repeat incidents.
+        """
+        return [template.text for template in self.ranked()[:top_n]]
+
+    def render(self, token_budget: int) -> str:
+        """Ranked template summary that fits in `token_budget` (estimated) tokens."""
+        lines: List[str] = []
+        used = 0
+        omitted_templates = 0
+        omitted_lines = self.overflow_lines
+        for template in self.ranked():
+            first = datetime.fromtimestamp(template.first_ns / 1e9).isoformat(timespec="seconds")
+            last = datetime.fromtimestamp(template.last_ns / 1e9).isoformat(timespec="seconds")
+            entry = (
+                f"[{first} .. {last}] x{template.count} {_SEVERITY_NAMES[template.severity]}: "
+                f"{template.text if template.count > 1 else template.example}"
+            )
+            cost = estimate_tokens(entry)
+            if used + cost > token_budget:
+                omitted_templates += 1
+                omitted_lines += template.count
+                continue
+            lines.append(entry)
+            used += cost
+        if omitted_templates or omitted_lines:
+            lines.append(f"... {omitted_templates} lower-ranked templates ({omitted_lines} lines) omitted")
+        return "\n".join(lines)
+
+    def stats(self, rendered: str) -> Dict[str, float]:
+        """Compression and cost figures for logging/metrics."""
+        out_chars = len(rendered) or 1
+        return {
+            "lines": self.total_lines,
+            "templates": len(self.templates),
+            "input_chars": self.total_chars,
+            "output_chars": len(rendered),
+            "compression_ratio": self.total_chars / out_chars,
+            "reduce_seconds": self.reduce_seconds,
+        }
+
+    def describe(self, rendered: str) -> str:
+        s = self.stats(rendered)
+        return (
+            f"{s['lines']} lines -> {s['templates']} templates, "
+            f"{s['input_chars'] / 1e3:.0f}k -> {s['output_chars'] / 1e3:.1f}k chars "
+            f"({s['compression_ratio']:.0f}x), reduction {s['reduce_seconds'] * 1e3:.0f}ms"
+        )
+
+
+def reduce_lines(records: Iterable[Tuple[int, str]], window_start_ns: int, window_end_ns: int, token_budget: int) -> Tuple[str, LogReducer]:
+    """Convenience wrapper: reduces (timestamp_ns, line) pairs and renders them."""
+    reducer = LogReducer(window_start_ns, window_end_ns)
+    for timestamp_ns, line in records:
+        reducer.add(timestamp_ns, line)
+    return reducer.render(token_budget), reducer
@@ -0,0 +1,122 @@
+"""
+LogQL query planning: push the incident log filtering down to Loki.
+
+Pulling `{job="containerlogs"}` for the whole window transfers every line every
+container wrote, and all of it is then thrown away except a few templates. The
+planner instead:
+
+  1. asks Loki which streams logged the most warning-or-worse lines in the
+     window, with one instant metric query
+     (topk(k, sum by (container) (count_over_time({...} |~ "<severity>" [300s])))),
+  2. pulls raw lines only for those streams (severity-filtered) and, unfiltered,
+     for the suspected containers from CPU attribution,
+  3. falls back to the severity-filtered job when the plan selects nothing.
+
+Queries are built as LogQuery values and rendered to LogQL text; label values
+and filter strings are quoted, and stream names are regex-escaped in =~ matchers.
+"""
+import json
+import re
+from dataclasses import dataclass, field, replace
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import aiohttp
+
+# Keywords line_severity() ranks WARNING or worse (log_reducer), as a case-insensitive LogQL regex
+SEVERITY_REGEX = r"(?i)(fatal|critical|panic|error|exception|traceback|oom|killed|warn)"
+
+
+def quote(value: str) -> str:
+    """A LogQL double-quoted string literal."""
+    return json.dumps(value, ensure_ascii=False)
+
+
+def any_of(values: Iterable[str]) -> str:
+    """RE2 alternation matching exactly one of `values` (label regex matchers are anchored)."""
+    return "|".join(re.escape(value) for value in sorted(set(values)))
+
+
+def line_filter_regex(extra_patterns: Sequence[str] = ()) -> str:
+    """SEVERITY_REGEX plus e.g. the analyzer rule patterns, so lines a rule needs are never filtered out."""
+    if not extra_patterns:
+        return SEVERITY_REGEX
+    return "(?i)" + "|".join([SEVERITY_REGEX[len("(?i)"):]] + [f"(?:{pattern})" for pattern in extra_patterns])
+
+
+@dataclass(frozen=True)
+class LogQuery:
+    """A stream selector plus line filters, e.g. {job="containerlogs", container=~"a|b"} |~ "(?i)error"."""
+    matchers: Tuple[Tuple[str, str, str], ...]  # (label, op, value); op is =, !=, =~ or !~
+    filters: Tuple[Tuple[str, str], ...] = ()  # (op, text); op is |=, !=, |~ or !~
+
+    @classmethod
+    def job(cls, name: str) -> "LogQuery":
+        return cls((("job", "=", name),))
+
+    def where(self, label: str, op: str, value: str) -> "LogQuery":
+        return replace(self, matchers=self.matchers + ((label, op, value),))
+
+    def filter(self, op: str, text: str) -> "LogQuery":
+        return replace(self, filters=self.filters + ((op, text),))
+
+    def render(self) -> str:
+        selector = ", ".join(f"{label}{op}{quote(value)}" for label, op, value in self.matchers)
+        return "{" + selector + "}" + "".join(f" {op} {quote(text)}" for op, text in self.filters)
+
+    def top_streams(self, label: str, window_seconds: int, k: int) -> str:
+        """Instant metric query: the `k` values of `label` with the most matching lines in the window."""
+        return f"topk({k}, sum by ({label}) (count_over_time({self.render()} [{window_seconds}s])))"
+
+
+@dataclass
+class LogQueryPlan:
+    """The raw-line queries for one job, and why they were chosen."""
+    job: str
+    queries: List[LogQuery] = field(default_factory=list)
+    suspects: List[str] = field(default_factory=list)  # fetched unfiltered
+    noisy: List[Tuple[str, float]] = field(default_factory=list)  # (stream, matching lines), fetched filtered
+    fallback: bool = False
+
+    def describe(self) -> str:
+        if self.fallback:
+            return f"{self.job}: " + "; ".join(query.render() for query in self.queries)
+        noisy = ", ".join(f"{name} ({count:.0f})" for name, count in self.noisy) or "none"
+        return f"{self.job}: suspects {', '.join(self.suspects) or 'none'}; noisiest {noisy}"
+
+
+async def query_vector(session: aiohttp.ClientSession, url: str, query: str, time_ns: int) -> List[Tuple[dict, float]]:
+    """One instant query (/loki/api/v1/query): (labels, value) per series of the resulting vector."""
+    async with session.get(url, params={"query": query, "time": time_ns}) as response:
+        response.raise_for_status()
+        body = await response.json()
+    return [(series.get("metric", {}), float(series["value"][1])) for series in body["data"]["result"]]
+
+
+async def plan_job(session: aiohttp.ClientSession, instant_url: str, job: str, end_ns: int, window_seconds: int,
+                   line_regex: str, stream_label: Optional[str] = None, suspects: Sequence[str] = (),
+                   noisy_streams: int = 3) -> LogQueryPlan:
+    """
+    Plans the raw-line queries for `job`. Without a `stream_label` (e.g. syslog) the
+    job is only severity-filtered. Metric query errors propagate (the caller falls back
+    to pulling the job).
+    """
+    base = LogQuery.job(job)
+    filtered = base.filter("|~", line_regex)
+    if stream_label is None:
+        return LogQueryPlan(job, [filtered], fallback=True)
+
+    plan = LogQueryPlan(job, suspects=sorted(set(suspects)))
+    vector = await query_vector(session, instant_url, filtered.top_streams(stream_label, window_seconds,
+                                                                           noisy_streams + len(plan.suspects)),
+                                end_ns)
+    ranked = sorted(((labels.get(stream_label, ""), count) for labels, count in vector), key=lambda item: -item[1])
+    plan.noisy = [(name, count) for name, count in ranked if name and name not in plan.suspects][:noisy_streams]
+
+    if plan.suspects:
+        plan.queries.append(base.where(stream_label, "=~", any_of(plan.suspects)))
+    if plan.noisy:
+        plan.queries.append(filtered.where(stream_label, "=~", any_of(name for name, _ in plan.noisy)))
+    if not plan.queries:
+        plan.queries.append(filtered)
+        plan.fallback = True
+    return plan
@@ -0,0 +1,256 @@
+"""
+Asynchronous notification dispatcher.
+
+The notify stage only enqueues a Notification (never blocks on a webhook); one
+dispatcher task delivers them to every configured sink over a pooled aiohttp
+session with timeouts, retrying transient failures with exponential backoff.
+
+Coalescing: a notification arriving while things are quiet is sent at once.
+Anything arriving in the next `coalesce_seconds` is held and sent as one
+message ("12 incidents in the last 60s: 10 SUCCESS, 2 SKIPPED"), and so on until a window
+passes with nothing new. A storm costs one message per window, not one per incident.
+
+Sinks are pluggable: anything with a `name` and `async send(session, batch)`;
+SlackSink and WebhookSink (generic JSON POST) are built in.
+"""
+import asyncio
+import random
+import time
+from collections import Counter as CountBy
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence
+
+import aiohttp
+
+from instrumentation import ERRORS, NOTIFICATIONS, STAGE_SECONDS, get_logger
+
+log = get_logger("notifier")
+
+# Incidents listed one per line in a coalesced Slack message; the rest are counted
+SLACK_MAX_LINES = 20
+
+
+@dataclass
+class Notification:
+    summary: str
+    details: str
+    target: str = ""
+    status: str = ""
+    incident_type: str = ""  # resource_rates.INCIDENT_TYPES, e.g. "CPU spike"
+    created: datetime = field(default_factory=datetime.now)
+
+
+class SinkError(Exception):
+    """A sink could not deliver; `retryable` is False for errors a retry will not fix (e.g. HTTP 400)."""
+
+    def __init__(self, message: str, retryable: bool = True, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+async def post_json(session: aiohttp.ClientSession, url: str, payload: dict):
+    """POSTs `payload`; raises SinkError (retryable for timeouts, connection errors, 429 and 5xx)."""
+    try:
+        async with session.post(url, json=payload) as response:
+            if response.status < 300:
+                return
+            body = (await response.text())[:200]
+            retry_after = response.headers.get("Retry-After")
+            raise SinkError(f"HTTP {response.status}: {body}",
+                            retryable=response.status == 429 or response.status >= 500,
+                            retry_after=float(retry_after) if retry_after and retry_after.isdigit() else None)
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        raise SinkError(repr(e)) from e
+
+
+def describe_batch(batch: Sequence[Notification], window_seconds: float) -> str:
+    """'12 incidents in the last 60s: 10 SUCCESS, 2 SKIPPED'."""
+    by_status = CountBy(notification.status or "UNKNOWN" for notification in batch)
+    counts = ", ".join(f"{n} {status}" for status, n in by_status.most_common())
+    return f"{len(batch)} incidents in the last {window_seconds:.0f}s: {counts}"
+
+
+def report_title(batch: Sequence[Notification]) -> str:
+    """'Automated Incident Report: CPU spike', naming every incident type in the batch."""
+    kinds = sorted({notification.incident_type for notification in batch if notification.incident_type})
+    kinds_text = ", ".join(kinds) or "incident"
+    return f"Automated Incident Report: {kinds_text[:1].upper()}{kinds_text[1:]}"
+
+
+class SlackSink:
+    """Slack incoming webhook: the classic incident report, or one summary message for a batch."""
+    name = "slack"
+
+    def __init__(self, webhook_url: str, window_seconds: float = 60.0):
+        self.webhook_url = webhook_url
+        self.window_seconds = window_seconds
+
+    def payload(self, batch: Sequence[Notification]) -> dict:
+        if len(batch) == 1:
+            notification = batch[0]
+            # Using the 'blocks' format for a cleaner message
+            return {
+                "text": f"?? DevOps AI Agent Incident: {notification.summary}",
+                "blocks": [
+                    {"type": "header", "text": {"type": "plain_text", "text": f"?? {report_title(batch)} ??"}},
+                    {"type": "section", "fields": [
+                        {"type": "mrkdwn", "text": f"*Time:* {notification.created.isoformat()}"},
+                        {"type": "mrkdwn", "text": f"*Summary:* {notification.summary}"},
+                    ]},
+                    {"type": "divider"},
+                    {"type": "section", "text": {"type": "mrkdwn", "text": "*Detailed Analysis & Action Taken:*"}},
+                    {"type": "section", "text": {"type": "mrkdwn", "text": f"```{notification.details}```"}},
+                ],
+            }
+
+        headline = describe_batch(batch, self.window_seconds)
+        lines = [f"• [{n.target}] {n.status}: {n.summary}" for n in batch[:SLACK_MAX_LINES]]
+        if len(batch) > SLACK_MAX_LINES:
+            lines.append(f"… and {len(batch) - SLACK_MAX_LINES} more (see the incident history)")
+        return {
+            "text": f"?? DevOps AI Agent: {headline}",
+            "blocks": [
+                {"type": "header", "text": {"type": "plain_text", "text": f"?? {report_title(batch)} ??"}},
+                {"type": "section", "text": {"type": "mrkdwn", "text": f"*{headline}*"}},
+                {"type": "divider"},
+                {"type": "section", "text": {"type": "mrkdwn", "text": "\n".join(lines)}},
+            ],
+        }
+
+    async def send(self, session: aiohttp.ClientSession, batch: Sequence[Notification]):
+        await post_json(session, self.webhook_url, self.payload(batch))
+
+
+class WebhookSink:
+    """Generic JSON webhook: {"summary": ..., "notifications": [{summary, details, target, status, created}, ...]}."""
+    name = "webhook"
+
+    def __init__(self, url: str, window_seconds: float = 60.0):
+        self.url = url
+        self.window_seconds = window_seconds
+
+    async def send(self, session: aiohttp.ClientSession, batch: Sequence[Notification]):
+        summary = batch[0].summary if len(batch) == 1 else describe_batch(batch, self.window_seconds)
+        notifications = [{**asdict(n), "created": n.created.isoformat()} for n in batch]
+        await post_json(session, self.url, {"summary": summary, "notifications": notifications})
+
+
+class NotificationDispatcher:
+    """
+    Bounded queue + one delivery task. submit() never blocks: when the queue is
+    full the notification is dropped (and counted) rather than stalling the pipeline.
+    """
+
+    def __init__(self, sinks: Sequence, queue_size: int = 256, coalesce_seconds: float = 60.0,
+                 max_batch: int = 100, timeout: float = 10.0, retries: int = 3, backoff_seconds: float = 1.0):
+        self.sinks = list(sinks)
+        self.queue_size = queue_size
+        self.coalesce_seconds = coalesce_seconds
+        self.max_batch = max_batch
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff_seconds = backoff_seconds
+        self.submitted = 0
+        self.dropped = 0
+        self.messages: Dict[str, int] = {}  # sink -> messages delivered
+        self._queue: Optional["asyncio.Queue[Notification]"] = None
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._task: Optional[asyncio.Task] = None
+        # Batch being collected or sent; close() redelivers it, so an interrupted send may reach a sink twice
+        self._batch: List[Notification] = []
+
+    def start(self):
+        """Starts the delivery task on the running event loop."""
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        if self.sinks:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout))
+            self._task = asyncio.create_task(self._run())
+
+    def submit(self, notification: Notification) -> bool:
+        if not self.sinks or self._queue is None:
+            return False
+        try:
+            self._queue.put_nowait(notification)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            NOTIFICATIONS.inc("queue", "dropped")
+            log.warning("Notification queue full; notification dropped.", extra={"target": notification.target})
+            return False
+        self.submitted += 1
+        return True
+
+    def pending(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def _drain(self, batch: List[Notification]):
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self._queue.get_nowait())
+            except asyncio.QueueEmpty:
+                return
+
+    async def _collect(self, batch: List[Notification], seconds: float):
+        """Adds everything that arrives within `seconds` (or until max_batch) to `batch`."""
+        deadline = time.monotonic() + seconds
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+            self._drain(batch)
+
+    async def _run(self):
+        while True:
+            self._batch = [await self._queue.get()]
+            self._drain(self._batch)
+            while self._batch:
+                await self._deliver(self._batch)
+                self._batch = []
+                await self._collect(self._batch, self.coalesce_seconds)
+
+    async def _deliver(self, batch: List[Notification]):
+        await asyncio.gather(*(self._send_with_retry(sink, batch) for sink in self.sinks))
+
+    async def _send_with_retry(self, sink, batch: List[Notification]):
+        for attempt in range(self.retries + 1):
+            start = time.perf_counter()
+            try:
+                await sink.send(self._session, batch)
+            except SinkError as e:
+                ERRORS.inc(sink.name)
+                if not e.retryable or attempt == self.retries:
+                    NOTIFICATIONS.inc(sink.name, "failed")
+                    log.error(f"Could not send {sink.name} notification ({len(batch)} incidents): {e}")
+                    return
+                # Exponential backoff with jitter, or what the server asked for
+                delay = e.retry_after or self.backoff_seconds * 2 ** attempt * random.uniform(0.8, 1.2)
+                log.warning(f"{sink.name} notification failed ({e}); retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                continue
+            finally:
+                STAGE_SECONDS.observe(time.perf_counter() - start, sink.name)
+            self.messages[sink.name] = self.messages.get(sink.name, 0) + 1
+            NOTIFICATIONS.inc(sink.name, "sent")
+            log.info(f"? {sink.name} notification sent successfully ({len(batch)} incident(s)).")
+            return
+
+    async def close(self, flush_seconds: float = 5.0):
+        """Delivers what is still queued (best effort, within `flush_seconds`), then stops."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            pending = self._batch
+            while not self._queue.empty():
+                pending.append(self._queue.get_nowait())
+            if pending:
+                try:
+                    await asyncio.wait_for(self._deliver(pending), flush_seconds)
+                except asyncio.TimeoutError:
+                    log.warning(f"{len(pending)} notifications not delivered at shutdown.")
+        if self._session is not None:
+            await self._session.close()
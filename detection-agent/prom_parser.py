@@ -0,0 +1,211 @@
+"""
+Streaming parser for the Prometheus text exposition format (Node Exporter /metrics).
+
+The payload is consumed line by line in a single pass and only the metric
+families the caller asks for are kept, so a multi-megabyte scrape from a
+large host never has to be split into lists or rescanned.
+"""
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+if TYPE_CHECKING:
+    import requests  # the sync helpers below import it on first use; the agent itself only scrapes with aiohttp
+
+CPU_SECONDS_FAMILY = "node_cpu_seconds_total"
+
+Labels = Tuple[Tuple[str, str], ...]
+CpuSeconds = Dict[Tuple[str, str], float]  # (cpu, mode) -> counter value
+
+
+class Sample(NamedTuple):
+    """One exposition sample: sorted-as-exposed label pairs and the float value."""
+    labels: Labels
+    value: float
+
+
+# --- PARSING ---
+
+def _parse_labels(label_str: str) -> Labels:
+    """Parses the inside of `{...}` into a tuple of (name, value) pairs."""
+    if not label_str:
+        return ()
+
+    if "\\" not in label_str:
+        # Fast path: no escapes, so '",' can only be a pair separator.
+        pairs = []
+        for chunk in label_str.rstrip(",").split('",'):
+            name, _, value = chunk.partition("=")
+            pairs.append((name.strip(), value.strip().strip('"')))
+        return tuple(pairs)
+
+    # Slow path: honour \" \\ and \n escapes inside quoted values.
+    pairs = []
+    i, n = 0, len(label_str)
+    while i < n:
+        eq = label_str.find("=", i)
+        if eq == -1:
+            break
+        name = label_str[i:eq].strip(" ,")
+        j = label_str.find('"', eq) + 1
+        chars = []
+        while j < n and label_str[j] != '"':
+            if label_str[j] == "\\" and j + 1 < n:
+                nxt = label_str[j + 1]
+                chars.append("\n" if nxt == "n" else nxt)
+                j += 2
+            else:
+                chars.append(label_str[j])
+                j += 1
+        pairs.append((name, "".join(chars)))
+        i = j + 1
+    return tuple(pairs)
+
+
+# Label sets repeat verbatim on every scrape, so parsed label tuples are interned by their
+# raw text. The cap only matters for exporters with unbounded label churn.
+_LABEL_CACHE: Dict[str, Labels] = {}
+_LABEL_CACHE_MAX = 200_000
+_KEY_CACHE: Dict[Tuple[Labels, Tuple[str, ...]], Tuple[str, ...]] = {}
+
+# NamedTuple.__new__ is a Python-level function; building through tuple.__new__ is C-only.
+_new_sample = tuple.__new__
+
+
+def _parse_value(rest: str) -> Optional[float]:
+    """Parses the text after the labels: a value, optionally followed by a timestamp."""
+    fields = rest.split()
+    if not fields:
+        return None
+    try:
+        return float(fields[0])
+    except ValueError:
+        return None
+
+
+def _parse_lines_into(lines: Iterable[Union[str, bytes]], result: Dict[str, List[Sample]],
+                      str_prefixes: Tuple[str, ...], byte_prefixes: Tuple[bytes, ...]):
+    """Core loop shared by parse_families and FamilyParser."""
+    label_cache = _LABEL_CACHE
+
+    for line in lines:
+        if line.__class__ is bytes:
+            if not line.startswith(byte_prefixes):
+                continue
+            line = line.decode("utf-8", "replace")
+        elif not line.startswith(str_prefixes):
+            continue
+
+        for name in str_prefixes:
+            if not line.startswith(name):
+                continue
+            end = len(name)
+            # Guard against prefix collisions (e.g. node_cpu_seconds_total_foo).
+            if len(line) == end or line[end] not in "{ \t":
+                continue
+
+            if line[end] == "{":
+                close = line.rfind("}")
+                if close == -1:
+                    break
+                label_str = line[end + 1:close]
+                labels = label_cache.get(label_str)
+                if labels is None:
+                    if len(label_cache) >= _LABEL_CACHE_MAX:
+                        label_cache.clear()
+                    labels = label_cache[label_str] = _parse_labels(label_str)
+                rest = line[close + 1:]
+            else:
+                labels = ()
+                rest = line[end:]
+
+            try:
+                # Node Exporter omits sample timestamps, so the remainder is usually just the value.
+                value = float(rest)
+            except ValueError:
+                value = _parse_value(rest)
+                if value is None:
+                    break
+            result[name].append(_new_sample(Sample, (labels, value)))
+            break
+
+
+def parse_families(lines: Iterable[Union[str, bytes]], families: Iterable[str]) -> Dict[str, List[Sample]]:
+    """
+    Single pass over exposition lines, keeping only samples of the requested families.
+    Lines may be str or raw bytes; bytes are only decoded once they match a family, so
+    comments and unrelated families cost one C-level prefix check each.
+    Returns: {family_name: [Sample, ...]} (requested families always present).
+    """
+    wanted = tuple(families)
+    result: Dict[str, List[Sample]] = {name: [] for name in wanted}
+    _parse_lines_into(lines, result, wanted, tuple(name.encode() for name in wanted))
+    return result
+
+
+class FamilyParser:
+    """
+    Incremental form of parse_families for async clients: feed() raw body chunks as
+    they arrive, then close() to get the parsed families. Only the trailing partial
+    line of each chunk is buffered.
+    """
+
+    def __init__(self, families: Iterable[str]):
+        self._wanted = tuple(families)
+        self._byte_prefixes = tuple(name.encode() for name in self._wanted)
+        self._result: Dict[str, List[Sample]] = {name: [] for name in self._wanted}
+        self._tail = b""
+
+    def feed(self, chunk: bytes):
+        if self._tail:
+            chunk = self._tail + chunk
+        lines = chunk.split(b"\n")
+        self._tail = lines.pop()
+        _parse_lines_into(lines, self._result, self._wanted, self._byte_prefixes)
+
+    def close(self) -> Dict[str, List[Sample]]:
+        if self._tail:
+            _parse_lines_into((self._tail,), self._result, self._wanted, self._byte_prefixes)
+            self._tail = b""
+        return self._result
+
+
+def group_by_labels(samples: Iterable[Sample], *keys: str) -> Dict[Tuple[str, ...], float]:
+    """Groups samples by the given label names, summing values that collide."""
+    grouped: Dict[Tuple[str, ...], float] = {}
+    for labels, value in samples:
+        cache_key = (labels, keys)
+        key = _KEY_CACHE.get(cache_key)
+        if key is None:
+            if len(_KEY_CACHE) >= _LABEL_CACHE_MAX:
+                _KEY_CACHE.clear()
+            label_map = dict(labels)
+            key = _KEY_CACHE[cache_key] = tuple(label_map.get(k, "") for k in keys)
+        grouped[key] = grouped.get(key, 0.0) + value
+    return grouped
+
+
+def parse_cpu_seconds(lines: Iterable[Union[str, bytes]]) -> CpuSeconds:
+    """Returns node_cpu_seconds_total counters keyed by (cpu, mode)."""
+    samples = parse_families(lines, (CPU_SECONDS_FAMILY,))[CPU_SECONDS_FAMILY]
+    return group_by_labels(samples, "cpu", "mode")
+
+
+# --- HTTP HELPERS ---
+
+def iter_response_lines(response: "requests.Response", chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+    """Streams a requests response body as raw byte lines (decoded lazily by the parser)."""
+    return response.iter_lines(chunk_size=chunk_size)
+
+
+def fetch_families(url: str, families: Iterable[str], timeout: Optional[float] = None) -> Dict[str, List[Sample]]:
+    """Scrapes `url` and parses only the requested families while the body streams in."""
+    import requests
+
+    with requests.get(url, stream=True, timeout=timeout) as response:
+        response.raise_for_status()
+        return parse_families(iter_response_lines(response), families)
+
+
+def fetch_cpu_seconds(url: str, timeout: Optional[float] = None) -> CpuSeconds:
+    """Scrapes `url` and returns node_cpu_seconds_total keyed by (cpu, mode)."""
+    samples = fetch_families(url, (CPU_SECONDS_FAMILY,), timeout=timeout)[CPU_SECONDS_FAMILY]
+    return group_by_labels(samples, "cpu", "mode")
@@ -0,0 +1,151 @@
+"""
+Persistent RCA result cache keyed by a log-signature fingerprint.
+
+The key is a hash of the reduced log templates (see LogReducer.signature) plus
+the target and model, so a container looping on the same error resolves from
+disk instead of another LLM round trip. Entries expire after a TTL, the least
+recently used entries are evicted past `max_entries`, and an optional SimHash
+match catches near-duplicate incidents whose template sets differ slightly.
+"""
+import hashlib
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, NamedTuple, Optional, Tuple
+
+SIMHASH_BITS = 64
+
+
+class CachedRca(NamedTuple):
+    response_text: str
+    created: float
+    hits: int
+    near_duplicate: bool
+
+
+def _hash64(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), "big")
+
+
+def simhash(templates: Iterable[str]) -> int:
+    """64-bit SimHash over the literal (non-wildcard) tokens of the templates."""
+    weights = [0] * SIMHASH_BITS
+    for template in templates:
+        for token in template.split():
+            if "<*>" in token:
+                continue
+            h = _hash64(token)
+            for bit in range(SIMHASH_BITS):
+                weights[bit] += 1 if (h >> bit) & 1 else -1
+    return sum(1 << bit for bit, weight in enumerate(weights) if weight > 0)
+
+
+def _to_signed(value: int) -> int:
+    """SQLite integers are signed 64-bit."""
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def fingerprint(target: str, model: str, templates: Iterable[str]) -> Tuple[str, int]:
+    """(exact key, simhash) for an incident's reduced log templates."""
+    templates = sorted(set(templates))
+    digest = hashlib.sha256("\n".join([target, model, *templates]).encode()).hexdigest()
+    return digest, simhash(templates)
+
+
+class RcaCache:
+    """
+    SQLite-backed cache of LLM RCA responses.
+    Safe to share between the pipeline's analysis worker threads.
+    `near_duplicate_bits`: max SimHash Hamming distance for a near match (None disables).
+    """
+
+    def __init__(self, path: str, ttl_seconds: float = 3600, max_entries: int = 1000,
+                 near_duplicate_bits: Optional[int] = 3):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.near_duplicate_bits = near_duplicate_bits
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS rca_cache ("
+            " key TEXT PRIMARY KEY, simhash INTEGER NOT NULL, target TEXT NOT NULL, model TEXT NOT NULL,"
+            " response TEXT NOT NULL, created REAL NOT NULL, last_used REAL NOT NULL, hits INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS rca_cache_scope ON rca_cache (target, model, created)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS rca_cache_lru ON rca_cache (last_used)")
+
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lookup_seconds = 0.0
+
+    def get(self, key: str, sim: int, target: str, model: str) -> Optional[CachedRca]:
+        """Exact lookup first, then the closest live SimHash for the same target/model."""
+        start = time.perf_counter()
+        now = time.time()
+        min_created = now - self.ttl_seconds
+        with self._lock:
+            row = self._db.execute(
+                "SELECT key, response, created, hits FROM rca_cache WHERE key = ? AND created >= ?",
+                (key, min_created),
+            ).fetchone()
+            near = False
+            if row is None and self.near_duplicate_bits is not None:
+                best = None
+                for cand_key, cand_sim, response, created, hits in self._db.execute(
+                    "SELECT key, simhash, response, created, hits FROM rca_cache"
+                    " WHERE target = ? AND model = ? AND created >= ?",
+                    (target, model, min_created),
+                ):
+                    distance = bin((cand_sim ^ _to_signed(sim)) & ((1 << 64) - 1)).count("1")
+                    if distance <= self.near_duplicate_bits and (best is None or distance < best[0]):
+                        best = (distance, (cand_key, response, created, hits))
+                if best is not None:
+                    row, near = best[1], True
+
+            if row is None:
+                self.misses += 1
+                self.lookup_seconds += time.perf_counter() - start
+                return None
+
+            self._db.execute("UPDATE rca_cache SET last_used = ?, hits = hits + 1 WHERE key = ?", (now, row[0]))
+            if near:
+                self.near_hits += 1
+            else:
+                self.hits += 1
+            self.lookup_seconds += time.perf_counter() - start
+            return CachedRca(response_text=row[1], created=row[2], hits=row[3] + 1, near_duplicate=near)
+
+    def put(self, key: str, sim: int, target: str, model: str, response_text: str):
+        """Stores a response, then drops expired entries and LRU entries beyond max_entries."""
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO rca_cache (key, simhash, target, model, response, created, last_used, hits)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, 0)",
+                (key, _to_signed(sim), target, model, response_text, now, now),
+            )
+            expired = self._db.execute("DELETE FROM rca_cache WHERE created < ?", (now - self.ttl_seconds,)).rowcount
+            overflow = self._db.execute(
+                "DELETE FROM rca_cache WHERE key IN ("
+                " SELECT key FROM rca_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            ).rowcount
+            self.evictions += max(expired, 0) + max(overflow, 0)
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.near_hits + self.misses
+        return {
+            "hits": self.hits,
+            "near_hits": self.near_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": (self.hits + self.near_hits) / lookups if lookups else 0.0,
+            "avg_lookup_ms": self.lookup_seconds / lookups * 1e3 if lookups else 0.0,
+        }
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,309 @@
+"""
+Remediation executor: restarts containers through the Docker Engine API (pooled
+HTTP over the Unix socket, or a TCP endpoint) with the docker CLI as a fallback,
+and systemd units through systemctl.
+
+Remediations for many targets run in parallel under a global and a per-host
+concurrency cap. A restart of a container that is already being restarted joins
+the one in flight instead of issuing a second; a container restarted within the
+cooldown is left alone; a fleet-wide rate limit bounds the blast radius of a bad
+rule. Dry-run evaluates the same guards without acting on them or consuming
+them, so repeating it gives the same answer.
+
+The guards are per executor, i.e. per process. Processes that share targets
+(sharded mode) also pass a `ledger` (sharding.ShardMembership) that records
+restarts in a shared file and applies the cooldown and rate limit across them.
+"""
+import asyncio
+import sqlite3
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from urllib.parse import quote
+
+import aiohttp
+
+DEFAULT_DOCKER_ENDPOINT = "unix:///var/run/docker.sock"
+ACTIONS = ("docker restart", "systemctl restart")
+
+
+@dataclass
+class RemediationRequest:
+    """One remediation: `host` is the scrape target name (cap and cooldown scope)."""
+    host: str
+    resource: str  # container name or systemd unit
+    action: str
+    # Docker endpoint of that host ("unix:///path" or "tcp://host:2375"); "" = executor default
+    endpoint: str = ""
+
+
+@dataclass
+class RemediationOutcome:
+    """status: SUCCESS, FAILED, SKIPPED (guard refused; see reason) or DRY_RUN."""
+    status: str
+    detail: str
+    backend: str = ""  # docker-api, docker-cli, systemctl
+    # for SKIPPED: cooldown, rate_limited, ledger_unavailable; for FAILED: unknown (the request reached the daemon, which
+    # may have restarted the container anyway)
+    reason: str = ""
+    elapsed: float = 0.0
+    joined: bool = False  # shared the result of a restart already in flight
+
+
+class DockerApiError(Exception):
+    """The Docker daemon answered, but refused (unknown container, server error)."""
+
+
+class DockerApiClient:
+    """Minimal async Docker Engine API client over one pooled connection set."""
+
+    def __init__(self, endpoint: str = DEFAULT_DOCKER_ENDPOINT, pool_size: int = 8, timeout: float = 60.0):
+        self.endpoint = endpoint
+        self.pool_size = pool_size
+        self.timeout = timeout
+        if endpoint.startswith("unix://"):
+            self.socket_path: Optional[str] = endpoint[len("unix://"):]
+            self.base_url = "http://docker"
+        else:
+            self.socket_path = None
+            self.base_url = "http://" + endpoint.split("://", 1)[-1].rstrip("/")
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        # Created lazily so it binds to the running event loop
+        if self._session is None or self._session.closed:
+            if self.socket_path is not None:
+                connector = aiohttp.UnixConnector(path=self.socket_path, limit=self.pool_size)
+            else:
+                connector = aiohttp.TCPConnector(limit=self.pool_size)
+            self._session = aiohttp.ClientSession(connector=connector,
+                                                  timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self._session
+
+    async def _post(self, path: str, params: Optional[Dict[str, str]] = None):
+        async with self._get_session().post(self.base_url + path, params=params) as response:
+            if response.status >= 400:
+                try:
+                    message = (await response.json()).get("message", "")
+                except (aiohttp.ContentTypeError, ValueError):
+                    message = await response.text()
+                raise DockerApiError(f"HTTP {response.status}: {message.strip()}")
+
+    async def ping(self) -> bool:
+        try:
+            async with self._get_session().get(self.base_url + "/_ping") as response:
+                return response.status == 200
+        except (aiohttp.ClientError, asyncio.TimeoutError, OSError):
+            return False
+
+    async def container_names(self) -> Dict[str, str]:
+        """GET /containers/json: {12-character id: name} of the running containers."""
+        async with self._get_session().get(self.base_url + "/containers/json") as response:
+            if response.status >= 400:
+                raise DockerApiError(f"HTTP {response.status}: {(await response.text()).strip()}")
+            containers = await response.json()
+        return {container["Id"][:12]: container["Names"][0].lstrip("/")
+                for container in containers if container.get("Names")}
+
+    async def restart(self, container: str, stop_timeout: int = 10):
+        """POST /containers/{name}/restart; the daemon waits `stop_timeout` s before killing."""
+        await self._post(f"/containers/{quote(container, safe='')}/restart", {"t": str(stop_timeout)})
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+
+
+async def _run_command(command: List[str], timeout: float) -> Tuple[bool, str]:
+    """Runs a CLI without blocking the event loop; (succeeded, output or error)."""
+    try:
+        proc = await asyncio.create_subprocess_exec(*command, stdout=asyncio.subprocess.PIPE,
+                                                    stderr=asyncio.subprocess.PIPE)
+    except FileNotFoundError:
+        return False, f"Command not found: {command[0]}"
+    try:
+        stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout)
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+        return False, f"Timed out after {timeout:g}s: {' '.join(command)}"
+    if proc.returncode != 0:
+        return False, stderr.decode(errors="replace").strip() or f"exit status {proc.returncode}"
+    return True, stdout.decode(errors="replace").strip()
+
+
+class RemediationExecutor:
+    """
+    Runs RemediationRequests. `max_concurrent` / `max_per_host` cap parallel
+    remediations; a (host, resource) is not remediated again within
+    `cooldown_seconds`; at most `rate_limit` remediations start per
+    `rate_window_seconds` across the fleet. With a `ledger` (claim_restart() /
+    release_restart(), see sharding.ShardMembership), both are also checked against
+    the restarts other processes recorded there.
+    """
+
+    def __init__(self, default_endpoint: str = DEFAULT_DOCKER_ENDPOINT, max_concurrent: int = 8,
+                 max_per_host: int = 1, cooldown_seconds: float = 300.0, rate_limit: int = 10,
+                 rate_window_seconds: float = 60.0, dry_run: bool = False, stop_timeout: int = 10,
+                 cli_fallback: bool = True, command_timeout: float = 120.0, ledger: Optional[Any] = None):
+        self.default_endpoint = default_endpoint
+        self.max_per_host = max_per_host
+        self.cooldown_seconds = cooldown_seconds
+        self.rate_limit = rate_limit
+        self.rate_window_seconds = rate_window_seconds
+        self.dry_run = dry_run
+        self.stop_timeout = stop_timeout
+        self.cli_fallback = cli_fallback
+        self.command_timeout = command_timeout
+        self.ledger = ledger
+
+        self.max_concurrent = max_concurrent
+        # Created on first use so they bind to the running event loop (as in ScrapeScheduler)
+        self._global: Optional[asyncio.Semaphore] = None
+        self._per_host: Dict[str, asyncio.Semaphore] = {}
+        self._clients: Dict[str, DockerApiClient] = {}
+        self._last_run: Dict[Tuple[str, str], float] = {}
+        self._recent: Deque[float] = deque()
+        self._in_flight: Dict[Tuple[str, str], "asyncio.Future[RemediationOutcome]"] = {}
+        self.counts: Dict[str, int] = {}
+
+    def _client(self, endpoint: str) -> DockerApiClient:
+        client = self._clients.get(endpoint)
+        if client is None:
+            client = self._clients[endpoint] = DockerApiClient(endpoint, pool_size=self.max_concurrent,
+                                                               timeout=self.stop_timeout + 50)
+        return client
+
+    def _guard(self, key: Tuple[str, str], now: float) -> Optional[Tuple[str, str]]:
+        """(reason, detail) if a guard refuses the remediation, else None. Does not change state."""
+        last = self._last_run.get(key)
+        if last is not None and now - last < self.cooldown_seconds:
+            return "cooldown", f"{key[1]} on {key[0]} was remediated {now - last:.0f}s ago (cooldown {self.cooldown_seconds:g}s)"
+        while self._recent and now - self._recent[0] >= self.rate_window_seconds:
+            self._recent.popleft()
+        if len(self._recent) >= self.rate_limit:
+            return "rate_limited", f"{len(self._recent)} remediations in the last {self.rate_window_seconds:g}s (limit {self.rate_limit})"
+        return None
+
+    def _count(self, outcome: RemediationOutcome) -> RemediationOutcome:
+        self.counts[outcome.status] = self.counts.get(outcome.status, 0) + 1
+        return outcome
+
+    async def execute(self, request: RemediationRequest) -> RemediationOutcome:
+        if request.action not in ACTIONS:
+            return self._count(RemediationOutcome("FAILED", f"Unknown remediation action: {request.action}"))
+
+        key = (request.host, request.resource)
+        pending = self._in_flight.get(key)
+        if pending is not None:
+            outcome = await asyncio.shield(pending)
+            return self._count(RemediationOutcome(outcome.status, outcome.detail, outcome.backend, outcome.reason,
+                                                  outcome.elapsed, joined=True))
+
+        now = time.time()
+        refused = self._guard(key, now)
+        if refused is not None:
+            return self._count(RemediationOutcome("SKIPPED", refused[1], reason=refused[0]))
+        if self.dry_run:
+            backend = "systemctl" if request.action == "systemctl restart" else "docker-api"
+            return self._count(RemediationOutcome("DRY_RUN", f"Would run '{request.action}' on {request.resource} "
+                                                             f"({request.host}) via {backend}", backend))
+
+        # Reserve the cooldown and rate-limit slot before waiting for a concurrency slot
+        self._last_run[key] = now
+        self._recent.append(now)
+        future: "asyncio.Future[RemediationOutcome]" = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            if self._global is None:
+                self._global = asyncio.Semaphore(self.max_concurrent)
+            host_slot = self._per_host.get(request.host)
+            if host_slot is None:
+                host_slot = self._per_host[request.host] = asyncio.Semaphore(self.max_per_host)
+            async with self._global, host_slot:
+                refused = await self._claim(key, now)
+                if refused is not None:
+                    outcome = RemediationOutcome("SKIPPED", refused[1], reason=refused[0])
+                    future.set_result(outcome)
+                    return self._count(outcome)
+                start = time.perf_counter()
+                outcome = await self._run(request)
+                outcome.elapsed = time.perf_counter() - start
+            if outcome.status != "SUCCESS" and outcome.reason != "unknown":
+                await self._release(key, now)  # nothing was restarted; allow a retry
+            future.set_result(outcome)
+            return self._count(outcome)
+        except BaseException as e:
+            self._last_run.pop(key, None)  # a shared claim is kept: the restart may have been sent
+            future.set_result(RemediationOutcome("FAILED", f"Remediation interrupted: {e!r}"))
+            raise
+        finally:
+            self._in_flight.pop(key, None)
+
+    async def _claim(self, key: Tuple[str, str], now: float) -> Optional[Tuple[str, str]]:
+        """The shared guards: (reason, detail) if the ledger refuses, else None (the restart is recorded)."""
+        if self.ledger is None:
+            return None
+        try:
+            refused = await asyncio.to_thread(self.ledger.claim_restart, key[0], key[1], now, self.cooldown_seconds,
+                                              self.rate_limit, self.rate_window_seconds)
+        except sqlite3.Error as e:
+            # Another worker may have just restarted it; not knowing, do not restart it again
+            refused = "ledger_unavailable", f"Could not check the shared restart ledger: {e!r}"
+        if refused is not None:
+            # This process started nothing; the ledger keeps refusing for as long as it should
+            self._last_run.pop(key, None)
+            if now in self._recent:  # unless it has already left the rate window
+                self._recent.remove(now)
+        return refused
+
+    async def _release(self, key: Tuple[str, str], now: float):
+        self._last_run.pop(key, None)
+        if self.ledger is None:
+            return
+        try:
+            await asyncio.to_thread(self.ledger.release_restart, key[0], key[1], now)
+        except sqlite3.Error:
+            pass  # the claim stays as a cooldown; the next incident after it may retry
+
+    async def execute_many(self, requests: List[RemediationRequest]) -> List[RemediationOutcome]:
+        """Runs a batch in parallel (within the caps); outcomes in request order."""
+        return list(await asyncio.gather(*(self.execute(request) for request in requests)))
+
+    async def _run(self, request: RemediationRequest) -> RemediationOutcome:
+        if request.action == "systemctl restart":
+            ok, output = await _run_command(["sudo", "systemctl", "restart", request.resource], self.command_timeout)
+            return RemediationOutcome("SUCCESS" if ok else "FAILED", output, "systemctl")
+
+        endpoint = request.endpoint or self.default_endpoint
+        try:
+            await self._client(endpoint).restart(request.resource, self.stop_timeout)
+            return RemediationOutcome("SUCCESS", f"Restarted {request.resource} via Docker API ({endpoint})", "docker-api")
+        except DockerApiError as e:
+            return RemediationOutcome("FAILED", f"Docker API refused restart of {request.resource}: {e}", "docker-api")
+        except (aiohttp.ClientConnectorError, FileNotFoundError, PermissionError, ConnectionRefusedError) as e:
+            # Never connected (socket missing, no permission, nothing listening): nothing was sent
+            if not self.cli_fallback:
+                return RemediationOutcome("FAILED", f"Docker API unreachable at {endpoint}: {e}", "docker-api")
+            api_error = e
+        except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as e:
+            # Timed out or dropped after the request went out: the daemon may still be restarting the
+            # container, so running the CLI too could restart it twice. Keeps the cooldown.
+            return RemediationOutcome("FAILED", f"Docker API restart of {request.resource} at {endpoint} ended "
+                                                f"without an answer ({e!r}); it may have been restarted",
+                                      "docker-api", reason="unknown")
+
+        # Daemon not reachable through the API: fall back to the CLI
+        command = ["docker", "-H", endpoint, "restart", "-t", str(self.stop_timeout), request.resource]
+        ok, output = await _run_command(command, self.command_timeout)
+        detail = output if ok else f"{output} (Docker API also failed: {api_error})"
+        return RemediationOutcome("SUCCESS" if ok else "FAILED", detail, "docker-cli")
+
+    async def container_names(self, endpoint: str = "") -> Dict[str, str]:
+        """{12-character id: name} of the containers running on `endpoint` (default: the executor's)."""
+        return await self._client(endpoint or self.default_endpoint).container_names()
+
+    async def close(self):
+        for client in self._clients.values():
+            await client.close()
@@ -0,0 +1,153 @@
+"""
+Memory, disk, network and load readings from the Node Exporter scrape the agent
+already makes for CPU.
+
+The scheduler asks the streaming parser for ALL_RESOURCE_FAMILIES next to
+node_cpu_seconds_total, so the same single pass over the body yields them and no
+extra request is made. A ResourceRateEngine (one per target, like CpuRateEngine)
+turns each scrape into a ResourceSnapshot:
+
+  memory   % of MemTotal not available (node_memory_MemAvailable_bytes)
+  disk     % of the interval the busiest device had I/O in flight
+           (rate of node_disk_io_time_seconds_total, 100 = saturated)
+  network  receive + transmit errors per second over all interfaces but lo
+  load     1-minute load average per CPU (node_load1 / cores)
+
+Counter resets (reboot, a device or interface replaced) drop that series for
+one sample instead of producing a negative rate.
+"""
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from prom_parser import Labels, Sample, group_by_labels
+
+MEMORY_TOTAL_FAMILY = "node_memory_MemTotal_bytes"
+MEMORY_AVAILABLE_FAMILY = "node_memory_MemAvailable_bytes"
+DISK_IO_TIME_FAMILY = "node_disk_io_time_seconds_total"
+NETWORK_ERROR_FAMILIES = ("node_network_receive_errs_total", "node_network_transmit_errs_total")
+LOAD_FAMILY = "node_load1"
+
+RESOURCES = ("memory", "disk", "network", "load")
+# Families each resource is computed from
+RESOURCE_FAMILIES: Dict[str, Tuple[str, ...]] = {
+    "memory": (MEMORY_TOTAL_FAMILY, MEMORY_AVAILABLE_FAMILY),
+    "disk": (DISK_IO_TIME_FAMILY,),
+    "network": NETWORK_ERROR_FAMILIES,
+    "load": (LOAD_FAMILY,),
+}
+ALL_RESOURCE_FAMILIES = tuple(family for resource in RESOURCES for family in RESOURCE_FAMILIES[resource])
+
+# Incident type per resource ("cpu" is the agent's original CPU spike), used in logs and notifications
+INCIDENT_TYPES = {
+    "cpu": "CPU spike",
+    "memory": "memory pressure",
+    "disk": "disk saturation",
+    "network": "network errors",
+    "load": "high load average",
+}
+
+# Node Exporter labels the loopback interface's series with the device label only
+LOOPBACK_LABELS = (("device", "lo"),)
+
+
+@dataclass
+class ResourceSnapshot:
+    """One scrape's readings; None where the exporter has no data yet (or the collector is off)."""
+    memory_percent: Optional[float] = None
+    disk_busy_percent: Optional[float] = None
+    busiest_disk: str = ""
+    network_errors_per_second: Optional[float] = None
+    load1: Optional[float] = None
+    load_per_cpu: Optional[float] = None
+
+    def value(self, resource: str) -> Optional[float]:
+        """The value a resource's detector runs on."""
+        if resource == "memory":
+            return self.memory_percent
+        if resource == "disk":
+            return self.disk_busy_percent
+        if resource == "network":
+            return self.network_errors_per_second
+        if resource == "load":
+            return self.load_per_cpu
+        raise ValueError(f"Unknown resource '{resource}' (expected one of {', '.join(RESOURCES)})")
+
+    def describe(self, resource: str) -> str:
+        """The reading with its unit, e.g. for the detection log line."""
+        value = self.value(resource)
+        if value is None:
+            return f"{resource} n/a"
+        if resource == "memory":
+            return f"memory {value:.1f}% used"
+        if resource == "disk":
+            return f"disk {self.busiest_disk} {value:.1f}% busy"
+        if resource == "network":
+            return f"network {value:.1f} errors/s"
+        return f"load {self.load1:.2f} ({value:.2f} per CPU)"
+
+    def breakdown(self) -> str:
+        """Short summary of every available reading, for the per-sample log line."""
+        return ", ".join(self.describe(resource) for resource in RESOURCES if self.value(resource) is not None)
+
+
+def _single(samples: List[Sample]) -> Optional[float]:
+    return samples[0].value if samples else None
+
+
+class ResourceRateEngine:
+    """
+    Turns successive scrapes (the parsed families) into ResourceSnapshots. Gauges
+    are read as they are; the disk and network counters need a previous scrape, so
+    their readings are None on the first one.
+    """
+
+    def __init__(self):
+        self._disk: Dict[Tuple[str, ...], float] = {}
+        # Per error family: {labels: counter}. A host can have thousands of interfaces, so these are
+        # keyed by the parser's interned label tuples rather than regrouped by device.
+        self._errors: List[Dict[Labels, float]] = []
+        self._timestamp: Optional[float] = None
+
+    @staticmethod
+    def _increases(previous: Dict[Any, float], current: Dict[Any, float]) -> Dict[Any, float]:
+        """Per-series increase; series that are new or went backwards (reset) sit this sample out."""
+        increases = {}
+        get = previous.get
+        for key, value in current.items():
+            before = get(key)
+            if before is not None and value >= before:
+                increases[key] = value - before
+        return increases
+
+    def update(self, families: Dict[str, List[Sample]], timestamp: float, num_cpus: int) -> ResourceSnapshot:
+        """Feeds one scrape (families as returned by the parser, ALL_RESOURCE_FAMILIES included)."""
+        snapshot = ResourceSnapshot()
+
+        total = _single(families.get(MEMORY_TOTAL_FAMILY, ()))
+        available = _single(families.get(MEMORY_AVAILABLE_FAMILY, ()))
+        if total and available is not None:
+            snapshot.memory_percent = min(max(100.0 * (1 - available / total), 0.0), 100.0)
+
+        load1 = _single(families.get(LOAD_FAMILY, ()))
+        if load1 is not None:
+            snapshot.load1 = load1
+            snapshot.load_per_cpu = load1 / num_cpus if num_cpus else load1
+
+        disk = group_by_labels(families.get(DISK_IO_TIME_FAMILY, ()), "device")
+        errors = [dict(families.get(family, ())) for family in NETWORK_ERROR_FAMILIES]
+        for series in errors:
+            series.pop(LOOPBACK_LABELS, None)
+
+        elapsed = timestamp - self._timestamp if self._timestamp is not None else 0.0
+        if elapsed > 0:
+            disk_busy = self._increases(self._disk, disk)
+            if disk_busy:
+                (device,), busy = max(disk_busy.items(), key=lambda item: item[1])
+                snapshot.busiest_disk = device
+                snapshot.disk_busy_percent = min(100.0 * busy / elapsed, 100.0)
+            if any(errors) and self._errors:
+                snapshot.network_errors_per_second = sum(
+                    sum(self._increases(previous, current).values())
+                    for previous, current in zip(self._errors, errors)) / elapsed
+        self._disk, self._errors, self._timestamp = disk, errors, timestamp
+        return snapshot
@@ -0,0 +1,106 @@
+"""
+Shared sample channel: the agent publishes the CPU samples it already computes,
+and dashboards read them over a small local HTTP endpoint instead of scraping
+Node Exporter themselves. N open dashboards cost one scrape per interval and all
+show the same numbers.
+
+    GET /samples                 -> {"version": n, "targets": {name: sample, ...}}
+    GET /samples?target=web-1    -> the same, for one target
+
+The JSON body is encoded once per published sample, not once per viewer.
+"""
+import json
+import time
+from collections import deque
+from typing import TYPE_CHECKING, Any, Deque, Dict, Optional, Tuple
+
+from aiohttp import web
+
+from cpu_rate import CpuSnapshot
+
+if TYPE_CHECKING:
+    import requests  # dashboard side only, imported by fetch_samples
+
+
+class SampleChannel:
+    """Latest sample plus a short (timestamp, total %) history per target."""
+
+    def __init__(self, history: int = 60):
+        self.history = history
+        self.version = 0
+        self._latest: Dict[str, Dict[str, Any]] = {}
+        self._history: Dict[str, Deque[Tuple[float, float]]] = {}
+        self._encoded: Dict[Optional[str], Tuple[int, bytes]] = {}
+        self.requests_served = 0
+
+    def publish(self, target_name: str, snapshot: CpuSnapshot, timestamp: Optional[float] = None,
+                detector: Optional[Dict[str, Any]] = None):
+        """Records a sample; `detector` is the target's detector state (SpikeDetector.state())."""
+        timestamp = time.time() if timestamp is None else timestamp
+        points = self._history.setdefault(target_name, deque(maxlen=self.history))
+        points.append((timestamp, round(snapshot.total_percent, 2)))
+        cpu, hottest = snapshot.hottest_core
+        self._latest[target_name] = {
+            "timestamp": timestamp,
+            "num_cpus": snapshot.num_cpus,
+            "total_percent": round(snapshot.total_percent, 2),
+            "average_percent": round(snapshot.average_percent, 2),
+            "mode_percent": {mode: round(value, 2) for mode, value in snapshot.mode_percent.items()},
+            "hottest_core": [cpu, hottest],
+            "breakdown": snapshot.breakdown(),
+            "detector": detector,
+        }
+        self.version += 1
+
+    def drop(self, target_name: str):
+        """Forgets a target (no longer monitored here, e.g. moved to another shard)."""
+        if self._latest.pop(target_name, None) is not None:
+            self._history.pop(target_name, None)
+            self.version += 1
+
+    def payload(self, target: Optional[str] = None) -> bytes:
+        """Encoded response body, cached until the next publish()."""
+        cached = self._encoded.get(target)
+        if cached is not None and cached[0] == self.version:
+            return cached[1]
+        names = [target] if target is not None else list(self._latest)
+        body = json.dumps({
+            "version": self.version,
+            "targets": {
+                name: dict(self._latest[name], history=list(self._history[name]))
+                for name in names if name in self._latest
+            },
+        }).encode()
+        if len(self._encoded) > 1024:
+            self._encoded.clear()
+        self._encoded[target] = (self.version, body)
+        return body
+
+    async def handle_samples(self, request: web.Request) -> web.Response:
+        self.requests_served += 1
+        return web.Response(body=self.payload(request.query.get("target")), content_type="application/json")
+
+
+def make_app(channel: SampleChannel) -> web.Application:
+    app = web.Application()
+    app.router.add_get("/samples", channel.handle_samples)
+    return app
+
+
+async def start_server(app: web.Application, host: str, port: int) -> web.AppRunner:
+    """Serves `app` on the running event loop; call `await runner.cleanup()` to stop."""
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+def fetch_samples(url: str, target: Optional[str] = None, timeout: float = 0.5,
+                  session: Optional["requests.Session"] = None) -> Dict[str, Dict[str, Any]]:
+    """Dashboard side: the published samples by target name (raises on HTTP errors)."""
+    import requests
+
+    params = {"target": target} if target is not None else None
+    response = (session or requests).get(url, params=params, timeout=timeout)
+    response.raise_for_status()
+    return response.json()["targets"]
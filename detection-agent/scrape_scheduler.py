@@ -0,0 +1,258 @@
+"""
+Asyncio scrape scheduler: monitors a fleet of Node Exporter targets from one agent.
+
+Every target runs on its own jittered schedule and keeps its own CPU counter state,
+scrapes share one pooled aiohttp session with timeouts, and a semaphore bounds how
+many scrapes are in flight, so a slow or dead exporter only delays itself. With
+`resources` on, the memory, disk, network and load families are parsed from the
+same scrape (see resource_rates.py).
+"""
+import asyncio
+import json
+import os
+import random
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+import aiohttp
+
+from cpu_rate import CpuRateEngine, CpuSnapshot
+from instrumentation import ERRORS, STAGE_SECONDS, get_logger
+from prom_parser import CPU_SECONDS_FAMILY, CpuSeconds, FamilyParser, Sample, group_by_labels
+from resource_rates import ALL_RESOURCE_FAMILIES, ResourceRateEngine, ResourceSnapshot
+
+READ_CHUNK_BYTES = 64 * 1024
+
+log = get_logger("scheduler")
+
+
+@dataclass
+class ScrapeTarget:
+    """One monitored node: its Node Exporter URL, the container to remediate and detector overrides."""
+    name: str
+    url: str
+    interval: float
+    container: str = ""
+    docker: str = ""  # Docker endpoint of the node ("tcp://10.0.0.5:2375"); "" = the agent's DOCKER_ENDPOINT
+    # Per-container CPU: a cAdvisor /metrics URL, or a cgroup v2 root on the agent's own node; "" = off
+    containers: str = ""
+    detector: Dict[str, Any] = field(default_factory=dict)
+    # Per-resource detector overrides ({"memory": {"threshold": 95}, "network": None to turn it off})
+    resources: Dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class TargetState:
+    """Per-target scheduling and counter state."""
+    target: ScrapeTarget
+    engine: CpuRateEngine = field(default_factory=CpuRateEngine)
+    last_snapshot: Optional[CpuSnapshot] = None
+    resources: ResourceRateEngine = field(default_factory=ResourceRateEngine)
+    last_resources: Optional[ResourceSnapshot] = None
+    last_scrape_time: float = 0.0
+    consecutive_errors: int = 0
+
+
+# Called with the target state after every successful scrape (snapshot may be None while priming;
+# the resource readings, when parsed, are in state.last_resources).
+SampleHandler = Callable[[TargetState, Optional[CpuSnapshot]], Awaitable[None]]
+
+
+def load_targets(path: str, default_url: str, default_interval: float, default_container: str = "",
+                 default_containers: str = "") -> List[ScrapeTarget]:
+    """
+    Loads the target list from a JSON file:
+        [{"name": "web-1", "url": "http://10.0.0.5:9100/metrics", "container": "api", "interval": 10,
+          "docker": "tcp://10.0.0.5:2375", "containers": "http://10.0.0.5:8080/metrics",
+          "detector": {"threshold": 150, "sustain_seconds": 30}, "resources": {"memory": {"threshold": 95}}}, ...]
+    Only "url" is required ("detector" overrides detectors.DetectorConfig fields, "resources" the same
+    per resource detector; "docker" is where
+    the container is restarted; "containers" is where per-container CPU is read, see attribution.py). Falls back to a single local target if the file does not exist.
+    """
+    if not os.path.exists(path):
+        return [ScrapeTarget(name="localhost", url=default_url, interval=default_interval, container=default_container,
+                             containers=default_containers)]
+
+    with open(path, 'r', encoding='utf-8') as f:
+        entries = json.load(f)
+
+    targets = []
+    for i, entry in enumerate(entries):
+        targets.append(ScrapeTarget(
+            name=entry.get("name") or f"target-{i}",
+            url=entry["url"],
+            interval=float(entry.get("interval", default_interval)),
+            container=entry.get("container", default_container),
+            docker=entry.get("docker", ""),
+            containers=entry.get("containers", default_containers),
+            detector=entry.get("detector") or {},
+            resources=entry.get("resources") or {},
+        ))
+    return targets
+
+
+async def fetch_families_async(session: aiohttp.ClientSession, url: str,
+                               families: Tuple[str, ...]) -> Dict[str, List[Sample]]:
+    """Async counterpart of prom_parser.fetch_families: parses chunks as they arrive."""
+    parser = FamilyParser(families)
+    async with session.get(url) as response:
+        response.raise_for_status()
+        async for chunk in response.content.iter_chunked(READ_CHUNK_BYTES):
+            parser.feed(chunk)
+    return parser.close()
+
+
+async def fetch_cpu_seconds_async(session: aiohttp.ClientSession, url: str) -> CpuSeconds:
+    """Async counterpart of prom_parser.fetch_cpu_seconds."""
+    families = await fetch_families_async(session, url, (CPU_SECONDS_FAMILY,))
+    return group_by_labels(families[CPU_SECONDS_FAMILY], "cpu", "mode")
+
+
+class ScrapeScheduler:
+    """
+    Runs one scheduling task per target. Each task sleeps until its next due time,
+    takes a concurrency slot, scrapes, hands the snapshot to `on_sample` and
+    re-arms with `interval * (1 +/- jitter)`. Due times advance from the schedule,
+    not from when the scrape finished, so latency does not accumulate as drift.
+    `resources` also parses the resource families and updates each target's
+    ResourceRateEngine. set_targets() changes the fleet while it runs (sharding).
+    """
+
+    def __init__(self, targets: List[ScrapeTarget], on_sample: SampleHandler,
+                 max_concurrency: int = 64, timeout: float = 5.0, jitter: float = 0.1, resources: bool = False):
+        self.states = [TargetState(target) for target in targets]
+        self.resources = resources
+        self.families = (CPU_SECONDS_FAMILY,) + (ALL_RESOURCE_FAMILIES if resources else ())
+        self.on_sample = on_sample
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.jitter = jitter
+
+        self.scrape_count = 0
+        self.error_count = 0
+        # Recent scheduling drift (seconds between due time and scrape start).
+        self.drift_seconds: Deque[float] = deque(maxlen=10_000)
+
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._session: Optional[aiohttp.ClientSession] = None
+        # Per target name: its scheduling task and the event that stops it
+        self._tasks: Dict[str, Tuple[asyncio.Task, asyncio.Event]] = {}
+        self._retired: Set[asyncio.Task] = set()
+
+    def _next_interval(self, target: ScrapeTarget) -> float:
+        return target.interval * (1 + random.uniform(-self.jitter, self.jitter))
+
+    async def scrape(self, state: TargetState) -> Optional[CpuSnapshot]:
+        """Scrapes one target and updates its rate engines. Raises on HTTP/timeout errors."""
+        start = time.perf_counter()
+        families = await fetch_families_async(self._session, state.target.url, self.families)
+        parsed = time.perf_counter()
+        state.last_scrape_time = time.time()
+        state.last_snapshot = state.engine.update(group_by_labels(families[CPU_SECONDS_FAMILY], "cpu", "mode"))
+        rated = time.perf_counter()
+        STAGE_SECONDS.observe(parsed - start, "scrape")
+        STAGE_SECONDS.observe(rated - parsed, "cpu_rate")
+        if self.resources:
+            state.last_resources = state.resources.update(families, state.last_scrape_time, state.engine.num_cpus)
+            STAGE_SECONDS.observe(time.perf_counter() - rated, "resources")
+        return state.last_snapshot
+
+    async def _run_target(self, state: TargetState, stop: asyncio.Event):
+        loop = asyncio.get_running_loop()
+        # Spread the first scrapes so a large fleet does not start in lockstep: over one interval once the
+        # fleet outgrows max_concurrency, proportionally less before that (a single target starts at once).
+        spread = state.target.interval * min(1.0, (len(self.states) - 1) / self.max_concurrency)
+        due = loop.time() + random.uniform(0, spread)
+
+        while not stop.is_set():
+            delay = due - loop.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(stop.wait(), timeout=delay)
+                    return
+                except asyncio.TimeoutError:
+                    pass
+
+            failed = True
+            async with self._semaphore:
+                self.drift_seconds.append(loop.time() - due)
+                try:
+                    snapshot = await self.scrape(state)
+                    state.consecutive_errors = 0
+                    self.scrape_count += 1
+                    failed = False
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    log.error(f"Could not scrape {state.target.name} ({state.target.url}): {e!r}",
+                              extra={"target": state.target.name})
+                except Exception as e:
+                    log.error(f"UNEXPECTED ERROR scraping {state.target.name}: {e!r}", extra={"target": state.target.name})
+                if failed:
+                    state.consecutive_errors += 1
+                    self.error_count += 1
+                    ERRORS.inc("scrape")
+
+            if not failed:
+                try:
+                    await self.on_sample(state, snapshot)
+                except Exception as e:
+                    log.error(f"UNEXPECTED ERROR handling sample for {state.target.name}: {e!r}",
+                              extra={"target": state.target.name})
+
+            due += self._next_interval(state.target)
+            # If the handler overran whole intervals, skip them instead of bursting to catch up.
+            now = loop.time()
+            if due < now:
+                due = now
+
+    def _start(self, state: TargetState):
+        stop = asyncio.Event()
+        self._tasks[state.target.name] = (asyncio.create_task(self._run_target(state, stop)), stop)
+
+    def set_targets(self, targets: List[ScrapeTarget]) -> Tuple[List[str], List[str]]:
+        """
+        Replaces the monitored targets, also while running: new ones start on their own
+        schedule, dropped ones stop after any scrape in progress, and the rest keep their
+        counter state. Returns the names (added, removed).
+        """
+        wanted = {target.name: target for target in targets}
+        current = {state.target.name: state for state in self.states}
+        removed = [name for name in current if name not in wanted]
+        added = [TargetState(target) for name, target in wanted.items() if name not in current]
+        for name in removed:
+            entry = self._tasks.pop(name, None)
+            if entry is not None:
+                task, stop = entry
+                stop.set()
+                self._retired.add(task)
+                task.add_done_callback(self._retired.discard)
+        self.states = [state for name, state in current.items() if name in wanted] + added
+        if self._session is not None:
+            for state in added:
+                self._start(state)
+        return [state.target.name for state in added], removed
+
+    async def run(self, stop: Optional[asyncio.Event] = None):
+        """Runs until `stop` is set (or forever)."""
+        stop = stop or asyncio.Event()
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        connector = aiohttp.TCPConnector(limit=self.max_concurrency, limit_per_host=0, ttl_dns_cache=300)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            self._session = session
+            for state in self.states:
+                self._start(state)
+            try:
+                await stop.wait()
+                for _, target_stop in self._tasks.values():
+                    target_stop.set()
+                await asyncio.gather(*(task for task, _ in self._tasks.values()), *self._retired)
+            finally:
+                tasks = [task for task, _ in self._tasks.values()] + list(self._retired)
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                self._tasks.clear()
+                self._session = None
@@ -0,0 +1,312 @@
+"""
+Sharded agent mode: several agent processes split one target list, so parsing,
+detection and log reduction for a large fleet use more than one core.
+
+Workers (processes started by one supervisor, or separate agents on the same
+host pointed at the same file) hold a lease in a small SQLite table and renew it
+every heartbeat; a worker whose lease has expired is dead. Each worker splits
+the targets over the live workers with rendezvous (highest random weight)
+hashing, so all of them agree on the split without talking to each other, and a
+worker joining or dying only moves its own share of the targets.
+
+One live worker also holds the leader lease. The leader serves the aggregate
+view on the dashboard's port: /samples merged from every worker's own sample
+channel, and /shards with the workers, their targets and their own endpoints.
+
+Restarts are recorded in the same file (claim_restart), so the remediation
+cooldown and rate limit hold across workers: a target that moves to another
+worker, or that two workers briefly both own while one fails to renew its lease,
+is not restarted twice.
+"""
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+import aiohttp
+from aiohttp import web
+
+from instrumentation import ERRORS, get_logger
+from sample_channel import start_server
+from scrape_scheduler import ScrapeTarget
+
+log = get_logger("sharding")
+
+
+def _weight(worker: str, key: str) -> int:
+    # Stable across processes and restarts (unlike hash(), which is salted per process)
+    return int.from_bytes(hashlib.blake2b(f"{worker}\0{key}".encode(), digest_size=8).digest(), "big")
+
+
+def assign_targets(targets: List[ScrapeTarget], workers: List[str]) -> Dict[str, List[ScrapeTarget]]:
+    """Each target goes to the worker with the highest weight for it; every worker gets an entry."""
+    shards: Dict[str, List[ScrapeTarget]] = {worker: [] for worker in workers}
+    if not workers:
+        return shards
+    for target in targets:
+        owner = max(workers, key=lambda worker: _weight(worker, target.name))
+        shards[owner].append(target)
+    return shards
+
+
+@dataclass
+class ShardView:
+    """The live workers ({worker: samples URL}) and the leader, as of one heartbeat."""
+    workers: Dict[str, str]
+    leader: Optional[str]
+    targets: Dict[str, int]  # targets each worker reported owning
+
+
+class ShardMembership:
+    """
+    One worker's lease in the shared SQLite file. All methods are short
+    transactions; call them off the event loop (they may wait on another
+    worker's write for up to `busy_timeout` seconds).
+    """
+
+    def __init__(self, path: str, worker: str, lease_seconds: float = 10.0, busy_timeout: float = 5.0):
+        self.path = path
+        self.worker = worker
+        self.lease_seconds = lease_seconds
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=busy_timeout, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS workers ("
+            " worker TEXT PRIMARY KEY, pid INTEGER NOT NULL, url TEXT NOT NULL DEFAULT '',"
+            " targets INTEGER NOT NULL DEFAULT 0, expires REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS leader (id INTEGER PRIMARY KEY CHECK (id = 0), worker TEXT NOT NULL,"
+            " expires REAL NOT NULL)"
+        )
+        self._db.execute("CREATE TABLE IF NOT EXISTS restarts (host TEXT NOT NULL, resource TEXT NOT NULL, at REAL NOT NULL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS restarts_by_resource ON restarts (host, resource, at)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS restarts_by_time ON restarts (at)")
+
+    def renew(self, url: str, targets: int) -> ShardView:
+        """Renews this worker's lease (and the leader lease, when it is ours or expired)."""
+        now = time.time()
+        expires = now + self.lease_seconds
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.execute(
+                    "INSERT INTO workers (worker, pid, url, targets, expires) VALUES (?, ?, ?, ?, ?)"
+                    " ON CONFLICT (worker) DO UPDATE SET pid = excluded.pid, url = excluded.url,"
+                    " targets = excluded.targets, expires = excluded.expires",
+                    (self.worker, os.getpid(), url, targets, expires),
+                )
+                self._db.execute("DELETE FROM workers WHERE expires < ?", (now - self.lease_seconds,))
+                self._db.execute(
+                    "INSERT INTO leader (id, worker, expires) VALUES (0, ?, ?)"
+                    " ON CONFLICT (id) DO UPDATE SET worker = excluded.worker, expires = excluded.expires"
+                    " WHERE leader.worker = excluded.worker OR leader.expires < ?",
+                    (self.worker, expires, now),
+                )
+                rows = self._db.execute("SELECT worker, url, targets FROM workers WHERE expires >= ?", (now,)).fetchall()
+                leader = self._db.execute("SELECT worker FROM leader WHERE expires >= ?", (now,)).fetchone()
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return ShardView(workers={worker: url for worker, url, _ in rows}, leader=leader[0] if leader else None,
+                         targets={worker: count for worker, _, count in rows})
+
+    def claim_restart(self, host: str, resource: str, now: float, cooldown_seconds: float, rate_limit: int,
+                      rate_window_seconds: float) -> Optional[Tuple[str, str]]:
+        """
+        Records a restart of `resource` on `host` at `now` for every worker to see, unless
+        one was recorded within `cooldown_seconds` or `rate_limit` were within
+        `rate_window_seconds`; then (reason, detail), as RemediationExecutor's guards.
+        """
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.execute("DELETE FROM restarts WHERE at < ?", (now - max(cooldown_seconds, rate_window_seconds),))
+                last = self._db.execute("SELECT MAX(at) FROM restarts WHERE host = ? AND resource = ?",
+                                        (host, resource)).fetchone()[0]
+                recent = self._db.execute("SELECT COUNT(*) FROM restarts WHERE at > ?",
+                                          (now - rate_window_seconds,)).fetchone()[0]
+                if last is not None and now - last < cooldown_seconds:
+                    refused = ("cooldown", f"{resource} on {host} was remediated {now - last:.0f}s ago by a shard "
+                                           f"worker (cooldown {cooldown_seconds:g}s)")
+                elif recent >= rate_limit:
+                    refused = ("rate_limited", f"{recent} remediations across the shard workers in the last "
+                                               f"{rate_window_seconds:g}s (limit {rate_limit})")
+                else:
+                    refused = None
+                    self._db.execute("INSERT INTO restarts (host, resource, at) VALUES (?, ?, ?)", (host, resource, now))
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return refused
+
+    def release_restart(self, host: str, resource: str, at: float):
+        """Forgets a claimed restart that did not happen, so it can be retried."""
+        with self._lock:
+            self._db.execute("DELETE FROM restarts WHERE host = ? AND resource = ? AND at = ?", (host, resource, at))
+
+    def leave(self):
+        """Gives up the lease (and leadership) at once, so the others take over without waiting for it to expire."""
+        with self._lock:
+            self._db.execute("DELETE FROM workers WHERE worker = ?", (self.worker,))
+            self._db.execute("DELETE FROM leader WHERE worker = ?", (self.worker,))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class SampleAggregator:
+    """The leader's /samples: every live worker's /samples, fetched concurrently and merged."""
+
+    def __init__(self, urls: Callable[[], List[str]], timeout: float = 1.0):
+        self.urls = urls
+        self.timeout = timeout
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def _fetch(self, url: str, params: Optional[Dict[str, str]]) -> dict:
+        async with self._session.get(url, params=params) as response:
+            response.raise_for_status()
+            return await response.json()
+
+    async def handle_samples(self, request: web.Request) -> web.Response:
+        if self._session is None:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout))
+        target = request.query.get("target")
+        params = {"target": target} if target is not None else None
+        urls = self.urls()
+        results = await asyncio.gather(*(self._fetch(url, params) for url in urls), return_exceptions=True)
+        merged = {"version": 0, "targets": {}}
+        for url, result in zip(urls, results):
+            if isinstance(result, BaseException):
+                ERRORS.inc("shard")
+                log.warning(f"Could not read samples from shard worker {url}: {result!r}")
+                continue
+            merged["version"] += result["version"]
+            merged["targets"].update(result["targets"])
+        return web.json_response(merged)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+class ShardCoordinator:
+    """
+    Keeps one worker's share of the targets current: renews the lease every
+    `heartbeat_seconds`, calls `on_assign(targets)` whenever the set of live
+    workers changes, and serves the aggregate view on `host`:`port` while this
+    worker is the leader. A worker that cannot renew its lease for a whole lease
+    period assumes the others have taken its targets and drops them.
+    """
+
+    def __init__(self, membership: ShardMembership, targets: List[ScrapeTarget],
+                 on_assign: Callable[[List[ScrapeTarget]], None], samples_url: str, host: str, port: int,
+                 heartbeat_seconds: float = 2.0):
+        self.membership = membership
+        self.targets = targets
+        self.on_assign = on_assign
+        self.samples_url = samples_url
+        self.host = host
+        self.port = port
+        self.heartbeat_seconds = heartbeat_seconds
+
+        self.view = ShardView(workers={}, leader=None, targets={})
+        self.owned: List[ScrapeTarget] = []
+        self.rebalances = 0
+        self._workers: Optional[List[str]] = None
+        self._renewed = time.time()
+        self._aggregator = SampleAggregator(lambda: [url for url in self.view.workers.values() if url])
+        self._server = None
+
+    @property
+    def leading(self) -> bool:
+        return self._server is not None
+
+    def _assign(self, workers: Optional[List[str]]):
+        self._workers = workers
+        self.owned = assign_targets(self.targets, workers or []).get(self.membership.worker, [])
+        self.rebalances += 1
+        log.info(f"Shard {self.membership.worker}: {len(self.owned)} of {len(self.targets)} target(s) "
+                 f"across {len(workers or ())} live worker(s)")
+        self.on_assign(self.owned)
+
+    async def handle_shards(self, request: web.Request) -> web.Response:
+        view = self.view
+        return web.json_response({
+            "leader": view.leader,
+            "workers": {worker: {"samples": url, "targets": view.targets.get(worker, 0)}
+                        for worker, url in sorted(view.workers.items())},
+        })
+
+    async def _lead(self, leader: bool):
+        if leader and self._server is None:
+            app = web.Application()
+            app.router.add_get("/samples", self._aggregator.handle_samples)
+            app.router.add_get("/shards", self.handle_shards)
+            try:
+                self._server = await start_server(app, self.host, self.port)
+            except OSError as e:  # the old leader's socket may not be closed yet; retried next heartbeat
+                log.warning(f"Shard {self.membership.worker} leads but cannot serve the aggregate view yet ({e})")
+                return
+            log.info(f"Shard {self.membership.worker} is the leader; serving the aggregate view on "
+                     f"http://{self.host}:{self.port}/samples and /shards")
+        elif not leader and self._server is not None:
+            await self._stop_serving()
+            log.warning(f"Shard {self.membership.worker} lost the leader lease; stopped serving the aggregate view")
+
+    async def _stop_serving(self):
+        if self._server is not None:
+            await self._server.cleanup()
+            self._server = None
+
+    async def beat(self, assign: bool = True):
+        """One heartbeat: renew, rebalance if the live workers changed, take or give up the aggregate view."""
+        try:
+            view = await asyncio.to_thread(self.membership.renew, self.samples_url, len(self.owned))
+        except sqlite3.Error as e:
+            ERRORS.inc("shard")
+            log.error(f"Shard {self.membership.worker} could not renew its lease: {e!r}")
+            if time.time() - self._renewed > self.membership.lease_seconds and self._workers:
+                self._assign([])
+            if self.leading:
+                await self._lead(False)
+            return
+        self._renewed = time.time()
+        self.view = view
+        if not assign:
+            return
+        workers = sorted(view.workers)
+        if workers != self._workers:
+            self._assign(workers)
+        await self._lead(view.leader == self.membership.worker)
+
+    async def run(self, stop: asyncio.Event):
+        """
+        Heartbeats until `stop` is set, then leaves the group. The first share is taken
+        one heartbeat after joining, once workers started at the same time have joined too.
+        """
+        try:
+            assign = False
+            while not stop.is_set():
+                await self.beat(assign)
+                assign = True
+                try:
+                    await asyncio.wait_for(stop.wait(), timeout=self.heartbeat_seconds)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            await self._stop_serving()
+            await self._aggregator.close()
+            try:
+                await asyncio.to_thread(self.membership.leave)
+            except sqlite3.Error as e:
+                log.warning(f"Shard {self.membership.worker} could not leave the group: {e!r}")
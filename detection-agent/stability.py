@@ -0,0 +1,80 @@
+"""
+Post-remediation stability verification.
+
+After a restart the agent samples the node every second or so, on its own CPU
+rate state, and feeds each sample to a StabilityVerifier, which decides as soon
+as the series allows:
+
+  - STABLE:   every sample over the last `settle_seconds` was below `settle_below`
+  - UNSTABLE: after the `grace_seconds` restart warm-up, the metric stayed at or
+              above `escalate_above` for `escalate_seconds` (the restart did not help)
+  - TIMEOUT:  neither within `max_seconds`
+
+Each sample is a rate over the interval since the previous one, so windows are
+measured from the start of that interval. The convergence curve is kept for the
+incident record.
+"""
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+
+@dataclass
+class StabilityConfig:
+    """Thresholds are in the units of the target's detector metric."""
+    settle_below: float
+    escalate_above: float
+    sample_interval: float = 1.0
+    settle_seconds: float = 5.0
+    grace_seconds: float = 5.0
+    escalate_seconds: float = 5.0
+    max_seconds: float = 60.0
+
+
+@dataclass
+class StabilityResult:
+    status: str  # STABLE, UNSTABLE or TIMEOUT
+    value: float  # last sample, detector metric units
+    elapsed: float  # seconds from the start of verification to the verdict
+    # (seconds since the start of verification, metric value) per sample
+    curve: List[Tuple[float, float]] = field(default_factory=list)
+
+
+class StabilityVerifier:
+    """Streaming verdict over post-remediation samples; update() returns a status once decided."""
+
+    def __init__(self, config: StabilityConfig):
+        self.config = config
+        self.curve: List[Tuple[float, float]] = []
+        self._previous = 0.0
+        self._below_since: Optional[float] = None
+        self._above_since: Optional[float] = None
+
+    def update(self, elapsed: float, value: float) -> Optional[str]:
+        """`value` covers (previous sample, elapsed]; elapsed is seconds since verification started."""
+        config = self.config
+        interval_start, self._previous = self._previous, elapsed
+        self.curve.append((round(elapsed, 3), round(value, 2)))
+
+        if value < config.settle_below:
+            if self._below_since is None:
+                self._below_since = interval_start
+            self._above_since = None
+        else:
+            self._below_since = None
+            if value >= config.escalate_above and elapsed > config.grace_seconds:
+                if self._above_since is None:
+                    self._above_since = max(interval_start, config.grace_seconds)
+            else:
+                self._above_since = None
+
+        if self._below_since is not None and elapsed - self._below_since >= config.settle_seconds:
+            return "STABLE"
+        if self._above_since is not None and elapsed - self._above_since >= config.escalate_seconds:
+            return "UNSTABLE"
+        if elapsed >= config.max_seconds:
+            return "TIMEOUT"
+        return None
+
+    def result(self, status: str) -> StabilityResult:
+        last = self.curve[-1][1] if self.curve else 0.0
+        return StabilityResult(status, last, self._previous, list(self.curve))
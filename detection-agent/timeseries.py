@@ -0,0 +1,203 @@
+"""
+Fixed-size time-series store: NumPy ring buffers with downsampling tiers.
+
+Every series keeps a raw tier plus 10s and 1m rollup tiers (min/max/avg per
+bucket), each a preallocated ring, so memory is fixed per series and appends
+are O(1). Windows are cut with a binary search on the (ordered) ring, so "last
+24h" is answered from the 1m tier in well under a millisecond.
+
+With a directory the rings are np.memmap'd .npy files: the agent writes them and
+the dashboard opens the same files read-only to chart hours of history.
+"""
+import math
+import os
+import re
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+POINT_DTYPE = np.dtype([("t", "<f8"), ("min", "<f4"), ("max", "<f4"), ("avg", "<f4")])
+
+
+class TierSpec(NamedTuple):
+    name: str
+    resolution: float  # bucket width in seconds; 0 = raw samples
+    capacity: int
+
+
+# raw: 10h at the default 10s scrape interval; 10s: 24h; 1m: 7 days (~450 KB per series)
+DEFAULT_TIERS = (
+    TierSpec("raw", 0, 3_600),
+    TierSpec("10s", 10, 8_640),
+    TierSpec("1m", 60, 10_080),
+)
+
+
+def cpu_total_series(target: str) -> str:
+    """Series name for a target's total CPU % (agent scale), shared by agent and dashboard."""
+    return f"{target}/cpu_total"
+
+
+# meta layout: next write index, count, open bucket start/min/max/sum/n
+_HEAD, _COUNT, _B_START, _B_MIN, _B_MAX, _B_SUM, _B_N = range(7)
+
+
+class Window(NamedTuple):
+    """Points of one series in a time range, oldest first."""
+    times: np.ndarray
+    min: np.ndarray
+    max: np.ndarray
+    avg: np.ndarray
+    tier: str
+
+
+class RingTier:
+    """One ring of POINT_DTYPE records; rollup tiers also carry the open (partial) bucket."""
+
+    def __init__(self, spec: TierSpec, data: np.ndarray, meta: np.ndarray):
+        self.spec = spec
+        self.data = data
+        self.meta = meta
+
+    @property
+    def count(self) -> int:
+        return int(self.meta[_COUNT])
+
+    def _push(self, t: float, vmin: float, vmax: float, vavg: float):
+        head = int(self.meta[_HEAD])
+        self.data[head] = (t, vmin, vmax, vavg)
+        # Data before meta, so a concurrent reader never sees an unwritten slot as valid
+        self.meta[_HEAD] = (head + 1) % self.spec.capacity
+        self.meta[_COUNT] = min(self.count + 1, self.spec.capacity)
+
+    def add(self, t: float, value: float):
+        if self.spec.resolution == 0:
+            self._push(t, value, value, value)
+            return
+        bucket = math.floor(t / self.spec.resolution) * self.spec.resolution
+        meta = self.meta
+        if meta[_B_N] and bucket != meta[_B_START]:
+            self._push(meta[_B_START], meta[_B_MIN], meta[_B_MAX], meta[_B_SUM] / meta[_B_N])
+            meta[_B_N] = 0
+        if not meta[_B_N]:
+            meta[_B_START], meta[_B_MIN], meta[_B_MAX], meta[_B_SUM], meta[_B_N] = bucket, value, value, value, 1
+        else:
+            meta[_B_MIN] = min(meta[_B_MIN], value)
+            meta[_B_MAX] = max(meta[_B_MAX], value)
+            meta[_B_SUM] += value
+            meta[_B_N] += 1
+
+    def segments(self) -> List[np.ndarray]:
+        """The ring as one or two views, oldest first."""
+        count, head = self.count, int(self.meta[_HEAD])
+        if count < self.spec.capacity:
+            return [self.data[:count]]
+        return [self.data[head:], self.data[:head]]
+
+    def oldest(self) -> Optional[float]:
+        for segment in self.segments():
+            if len(segment):
+                return float(segment["t"][0])
+        return None
+
+    def covers(self, start: float) -> bool:
+        """True if the tier still holds everything recorded since `start`."""
+        oldest = self.oldest()
+        return self.count < self.spec.capacity or (oldest is not None and oldest <= start)
+
+    def window(self, start: float, end: float) -> np.ndarray:
+        parts = []
+        for segment in self.segments():
+            times = segment["t"]
+            lo, hi = np.searchsorted(times, start, "left"), np.searchsorted(times, end, "right")
+            if hi > lo:
+                parts.append(segment[lo:hi])
+        if self.spec.resolution and self.meta[_B_N] and start <= self.meta[_B_START] <= end:
+            partial = np.array([(self.meta[_B_START], self.meta[_B_MIN], self.meta[_B_MAX],
+                                 self.meta[_B_SUM] / self.meta[_B_N])], dtype=POINT_DTYPE)
+            parts.append(partial)
+        if not parts:
+            return np.empty(0, dtype=POINT_DTYPE)
+        return parts[0].copy() if len(parts) == 1 else np.concatenate(parts)
+
+
+def _file_name(series: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", series)
+
+
+class TimeSeriesStore:
+    """
+    Named series of (timestamp, value) samples.
+    `path=None` keeps the rings in memory; otherwise they are memory-mapped files in
+    that directory. `readonly=True` opens an existing directory without writing to it
+    (series appear once the writer has created them).
+    """
+
+    def __init__(self, path: Optional[str] = None, tiers: Tuple[TierSpec, ...] = DEFAULT_TIERS,
+                 readonly: bool = False):
+        self.path = path
+        self.tiers = tiers
+        self.readonly = readonly
+        self._series: Dict[str, List[RingTier]] = {}
+        if path and not readonly:
+            os.makedirs(path, exist_ok=True)
+
+    def _allocate(self, series: str, spec: TierSpec) -> Optional[RingTier]:
+        if self.path is None:
+            return RingTier(spec, np.zeros(spec.capacity, dtype=POINT_DTYPE), np.zeros(7))
+
+        base = os.path.join(self.path, f"{_file_name(series)}.{spec.name}")
+        data_file, meta_file = base + ".npy", base + ".meta.npy"
+        if self.readonly:
+            if not (os.path.exists(data_file) and os.path.exists(meta_file)):
+                return None
+            return RingTier(spec, np.load(data_file, mmap_mode="r"), np.load(meta_file, mmap_mode="r"))
+
+        if os.path.exists(data_file) and os.path.exists(meta_file):
+            data = np.load(data_file, mmap_mode="r+")
+            meta = np.load(meta_file, mmap_mode="r+")
+            if data.shape == (spec.capacity,) and data.dtype == POINT_DTYPE and meta.shape == (7,):
+                return RingTier(spec, data, meta)
+        data = np.lib.format.open_memmap(data_file, mode="w+", dtype=POINT_DTYPE, shape=(spec.capacity,))
+        meta = np.lib.format.open_memmap(meta_file, mode="w+", dtype=np.float64, shape=(7,))
+        return RingTier(spec, data, meta)
+
+    def series(self, name: str) -> Optional[List[RingTier]]:
+        tiers = self._series.get(name)
+        if tiers is None:
+            allocated = [self._allocate(name, spec) for spec in self.tiers]
+            if any(tier is None for tier in allocated):
+                return None
+            tiers = self._series[name] = allocated
+        return tiers
+
+    def append(self, name: str, timestamp: float, value: float):
+        for tier in self.series(name):
+            tier.add(timestamp, value)
+
+    def query(self, name: str, start: float, end: float = math.inf, tier: Optional[str] = None) -> Window:
+        """
+        Points in [start, end] from the finest tier that still covers `start`
+        (or the named tier). Rollup tiers include their current partial bucket.
+        """
+        tiers = self.series(name)
+        if not tiers:
+            empty = np.empty(0)
+            return Window(empty, empty, empty, empty, "")
+        if tier is not None:
+            chosen = next(t for t in tiers if t.spec.name == tier)
+        else:
+            chosen = next((t for t in tiers if t.covers(start)), tiers[-1])
+        points = chosen.window(start, end)
+        return Window(points["t"], points["min"], points["max"], points["avg"], chosen.spec.name)
+
+    def names(self) -> List[str]:
+        return list(self._series)
+
+    def flush(self):
+        """Writes dirty pages of memory-mapped series back to disk."""
+        for tiers in self._series.values():
+            for tier in tiers:
+                for array in (tier.data, tier.meta):
+                    if isinstance(array, np.memmap) and not self.readonly:
+                        array.flush()